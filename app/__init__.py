@@ -1,13 +1,25 @@
+import time
+
 from flask import Flask
 from app.routes.main import main  # 导入蓝图
 from flask_cors import CORS
+from app import metrics
+from app.routes.stocks_analyse import get_code_name_map
+from app.trade_calendar import warm_up
 
 # from .extensions import db  # 导入扩展（如果有）
 
+# create_app 的时间预算，超出时打印告警；包导入耗时由 benchmarks/bench_cold_start.py 单独计入
+STARTUP_BUDGET_SECONDS = 3.0
+
 
-def create_app():
+def create_app(config=None):
+    started = time.perf_counter()
     app = Flask(__name__)
     # app.config.from_object("config")  # 加载配置
+    # 是否在后台线程中预热交易日历、股票列表等懒加载数据
+    app.config["WARM_UP_CACHES"] = True
+    app.config.update(config or {})
 
     # 启用跨域，允许所有域名访问（默认支持所有路径和方法）
     CORS(app, supports_credentials=True)
@@ -16,4 +28,17 @@ def create_app():
 
     # 注册蓝图
     app.register_blueprint(main)
+    # 路由、akshare 调用计时，/metrics 暴露；PROFILING 为真时允许按请求 profiling
+    metrics.init_app(app)
+    metrics.instrument_akshare()
+
+    if app.config["WARM_UP_CACHES"]:
+        warm_up(get_code_name_map)
+
+    elapsed = time.perf_counter() - started
+    app.config["STARTUP_SECONDS"] = elapsed
+    if elapsed > STARTUP_BUDGET_SECONDS:
+        print(
+            f"[启动] create_app 耗时 {elapsed:.2f}s，超出预算 {STARTUP_BUDGET_SECONDS}s"
+        )
     return app
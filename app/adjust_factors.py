@@ -0,0 +1,281 @@
+"""
+复权因子存储，读取日线时按需生成前复权 / 后复权价格。
+
+history_cache 只保存不复权日线（stock_zh_a_hist 的 adjust=""）。每只股票的后复权因子
+（新浪 stock_zh_a_daily 的 hfq-factor，按除权除息日排列的阶梯表）另存为
+``history_cache/_adjust_factors.npz``，CSR 布局：第 i 只股票 codes[i] 的因子表为
+dates / factors 的 [indptr[i], indptr[i + 1]) 段，另有待刷新的 pending 代码列表。
+
+- 后复权价 = 不复权价 × 当日因子，前复权价 = 后复权价 ÷ 最新因子；
+  发生新的除权除息只需刷新这只股票的因子表，不用重新下载日线；
+- 同步写入新 K 线后调用 ``on_history_updated``：上游日线的涨跌额以除权后的昨收为基准，
+  新 K 线的 收盘 - 涨跌额 与上一根收盘价对不上说明发生了除权除息，该股票记为待刷新，
+  还没有因子表的股票同样记为待刷新；后台同步任务或刷新接口再调用 ``sync_pending``，
+  经 fetch_engine 的限速流水线拉取这些股票的因子表；
+- ``apply`` 用 searchsorted 一次查出每根 K 线所在的因子区间，向量化缩放价格字段。
+"""
+
+import asyncio
+import os
+import threading
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from app import fetch_engine, history_store
+
+# 与 stock_zh_a_hist 的 adjust 参数一致："" 不复权，qfq 前复权，hfq 后复权
+ADJUST_MODES = ("", "qfq", "hfq")
+
+# 随复权缩放的字段；涨跌额在因子不变的区间内等比缩放，除权日当天同样成立
+PRICE_FIELDS = ("open", "close", "high", "low", "change")
+
+# 收盘 - 涨跌额 与上一根收盘价相差超过该值（元）即视为除权除息；日线价格精确到分
+EVENT_TOLERANCE = 0.015
+
+
+def factors_path():
+    return os.path.join(history_store.HISTORY_CACHE_DIR, "_adjust_factors.npz")
+
+
+def normalize_mode(adjust):
+    """None / "" / "none" 为不复权，其余只接受 qfq / hfq，否则抛出 ValueError"""
+    mode = str(adjust or "").strip().lower()
+    if mode == "none":
+        mode = ""
+    if mode not in ADJUST_MODES:
+        raise ValueError(f"adjust 应为 none / qfq / hfq，收到 {adjust!r}")
+    return mode
+
+
+def market_symbol(code):
+    """新浪接口使用带交易所前缀的代码"""
+    code = str(code).zfill(6)
+    if code.startswith(("5", "6", "9")):
+        return f"sh{code}"
+    if code.startswith(("4", "8")):
+        return f"bj{code}"
+    return f"sz{code}"
+
+
+def fetch_factors(code):
+    """拉取单只股票的后复权因子表，返回按日期升序的 (dates, factors)"""
+    df = ak.stock_zh_a_daily(symbol=market_symbol(code), adjust="hfq-factor")
+    dates = pd.to_datetime(df["date"]).values.astype("M8[D]")
+    factors = pd.to_numeric(df["hfq_factor"], errors="coerce").to_numpy(dtype=float)
+    keep = ~np.isnat(dates) & ~np.isnan(factors)
+    dates, factors = dates[keep], factors[keep]
+    order = np.argsort(dates, kind="stable")
+    return dates[order], factors[order]
+
+
+def has_events(records):
+    """records 中除第一根外是否有除权除息日：收盘 - 涨跌额（除权后的昨收）与前一根收盘对不上"""
+    if len(records) < 2:
+        return False
+    implied = records["close"][1:] - records["change"][1:]
+    with np.errstate(invalid="ignore"):
+        return bool((np.abs(implied - records["close"][:-1]) > EVENT_TOLERANCE).any())
+
+
+class FactorStore:
+    """全部股票的后复权因子表，常驻内存，按需整体落盘"""
+
+    def __init__(self):
+        self.tables = {}  # 代码 -> (升序的除权除息日, 后复权因子)
+        self.pending = set()
+        self.dirty = False
+        self.lock = threading.Lock()
+        # 取快照和写文件整体串行，后取快照的一方一定后写
+        self.write_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        path = factors_path()
+        if not os.path.exists(path):
+            return
+        try:
+            with np.load(path) as data:
+                codes, indptr = data["codes"], data["indptr"]
+                dates, factors = data["dates"], data["factors"]
+                pending = data["pending"]
+            for i, code in enumerate(codes):
+                lo, hi = indptr[i], indptr[i + 1]
+                self.tables[str(code)] = (dates[lo:hi], factors[lo:hi])
+            self.pending = {str(code) for code in pending}
+        except Exception as e:
+            print(f"[复权因子] 读取 {path} 失败，将重新拉取：{e}")
+            self.tables, self.pending = {}, set()
+
+    def save(self):
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                codes = sorted(self.tables)
+                tables = [self.tables[code] for code in codes]
+                pending = sorted(self.pending)
+                self.dirty = False
+            indptr = np.zeros(len(codes) + 1, dtype=np.int64)
+            np.cumsum([len(dates) for dates, _ in tables], out=indptr[1:])
+            dates = np.concatenate(
+                [np.array([], dtype="M8[D]")] + [dates for dates, _ in tables]
+            )
+            factors = np.concatenate(
+                [np.array([])] + [factors for _, factors in tables]
+            )
+            os.makedirs(history_store.HISTORY_CACHE_DIR, exist_ok=True)
+            path = factors_path()
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    codes=np.array(codes, dtype=str),
+                    indptr=indptr,
+                    dates=dates,
+                    factors=factors,
+                    pending=np.array(pending, dtype=str),
+                )
+            os.replace(tmp_path, path)
+
+    def get(self, code):
+        return self.tables.get(code)
+
+    def put(self, code, dates, factors):
+        """写入一只股票的因子表并清除待刷新标记，返回因子表是否有变化"""
+        with self.lock:
+            old = self.tables.get(code)
+            changed = old is None or not (
+                np.array_equal(old[0], dates) and np.array_equal(old[1], factors)
+            )
+            if changed:
+                self.tables[code] = (dates, factors)
+            if changed or code in self.pending:
+                self.pending.discard(code)
+                self.dirty = True
+        return changed
+
+    def mark_pending(self, codes):
+        with self.lock:
+            new = set(codes) - self.pending
+            if new:
+                self.pending |= new
+                self.dirty = True
+
+    def pending_codes(self, codes=None):
+        with self.lock:
+            pending = self.pending if codes is None else self.pending & set(codes)
+            return sorted(pending)
+
+    def factors_for(self, code, dates):
+        """
+        dates 中每个日期适用的后复权因子，以及最新因子；没有因子表时返回 None。
+        早于第一个除权除息日的日期沿用第一个因子。
+        """
+        table = self.tables.get(code)
+        if table is None or len(table[0]) == 0:
+            return None
+        event_dates, factors = table
+        i = np.searchsorted(event_dates, dates, side="right") - 1
+        return factors[np.maximum(i, 0)], factors[-1]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FactorStore()
+    return _store
+
+
+def flush():
+    if _store is not None:
+        _store.save()
+
+
+def apply(code, records, adjust):
+    """
+    返回 records 按 adjust 复权后的副本；不复权、没有数据或还没有因子表时原样返回。
+    """
+    mode = normalize_mode(adjust)
+    if not mode or records is None or len(records) == 0:
+        return records
+    found = get_store().factors_for(code, records["date"])
+    if found is None:
+        return records
+    factor, latest = found
+    if mode == "qfq":
+        factor = factor / latest
+    adjusted = np.array(records)
+    for field in PRICE_FIELDS:
+        adjusted[field] = records[field] * factor
+    return adjusted
+
+
+def on_history_updated(code, appended):
+    """history 同步写入后的钩子：还没有因子表或新 K 线里有除权除息日时，把该股票记为待刷新"""
+    store = get_store()
+    if store.get(code) is None:
+        store.mark_pending([code])
+        return
+    if appended <= 0:
+        return
+    records = history_store.read_history(code)
+    # 连同新 K 线之前的一根一起比较，才能发现第一根新 K 线就是除权日的情况
+    if records is not None and has_events(records[-(appended + 1) :]):
+        store.mark_pending([code])
+
+
+def sync_pending(codes=None, should_stop=None, on_progress=None, **options):
+    """
+    经 fetch_engine.run_pipeline 拉取待刷新股票的因子表（codes 为空时处理全部待刷新股票），
+    与日线同步共用令牌桶限速和 AIMD 并发控制，options 透传（rate、max_concurrency 等）。
+    拉取失败的股票保持待刷新，下次同步时重试。返回 {"pending", "fetched", "changed", "failed"}。
+    """
+    store = get_store()
+    pending = store.pending_codes(codes)
+    changed, failed = [], []
+
+    def write_one(code, payload):
+        if store.put(code, *payload):
+            changed.append(code)
+        return {"code": 0, "message": f"[复权因子] {code} 已刷新", "updated_count": 1}
+
+    done = []
+
+    def on_result(code, result):
+        done.append(code)
+        if result.get("updated_count", -1) < 0:
+            print(result.get("message"))
+            failed.append(code)
+        if on_progress is not None:
+            on_progress(len(done), len(pending))
+
+    stats = {"fetched": 0}
+    if pending:
+        stats = asyncio.run(
+            fetch_engine.run_pipeline(
+                pending,
+                fetch_factors,
+                write_one,
+                should_stop=should_stop,
+                on_result=on_result,
+                **options,
+            )
+        )
+        print(
+            f"[复权因子] 刷新 {len(pending)} 只，变化 {len(changed)} 只，失败 {len(failed)} 只"
+        )
+    store.save()
+    return {
+        "pending": len(store.pending_codes()),
+        "fetched": stats["fetched"],
+        "changed": sorted(changed),
+        "failed": sorted(failed),
+    }
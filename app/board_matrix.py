@@ -0,0 +1,356 @@
+"""
+行业板块、概念板块成分股的稀疏隶属矩阵。
+
+refresh() 并发拉取全部行业板块和概念板块的成分股，建成 (板块 × 股票) 的 CSR 稀疏矩阵：
+- boards：板块表，每行为 (类型 industry / concept, 板块名称, 板块代码)；
+- codes：按代码排序的股票代码；
+- indptr / indices：第 i 个板块的成分股为 codes[indices[indptr[i]:indptr[i + 1]]]，下标升序；
+- 同时保存按股票排列的转置，股票 -> 所属板块也只是一次切片。
+
+矩阵持久化为 stocks_info/board_members.npz（临时文件 + os.replace 原子替换），
+进程内按文件戳缓存。集合运算都在有序的股票下标数组上做（np.intersect1d / union1d / setdiff1d）。
+某个板块拉取失败时沿用上一版矩阵中该板块的成分股。
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import akshare as ak
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+MATRIX_PATH = os.path.join(BASE_DIR, "stocks_info", "board_members.npz")
+
+# 板块类型 -> (板块列表接口, 成分股接口)；按名称在调用时取函数，便于替换和计时
+KINDS = {
+    "industry": ("stock_board_industry_name_em", "stock_board_industry_cons_em"),
+    "concept": ("stock_board_concept_name_em", "stock_board_concept_cons_em"),
+}
+
+SET_OPS = {
+    "and": np.intersect1d,
+    "or": np.union1d,
+    "diff": np.setdiff1d,
+}
+
+
+def normalize_code(code):
+    return str(code).strip().zfill(6)
+
+
+class BoardMatrix:
+    def __init__(self, boards, codes, indptr, indices, built_at=None, failed=()):
+        self.boards = boards  # [(kind, name, board_code), ...]
+        self.codes = codes  # 升序的股票代码数组
+        self.indptr = indptr
+        self.indices = indices
+        self.built_at = built_at
+        self.failed = list(failed)
+
+        self.by_key = {(kind, name): i for i, (kind, name, _) in enumerate(boards)}
+        self.by_name = {}
+        for i, (_, name, board_code) in reversed(list(enumerate(boards))):
+            # 行业与概念同名时按名称查找优先取行业板块
+            self.by_name[name] = i
+            self.by_name[board_code] = i
+
+        # 转置：把每个非零元按股票下标稳定排序，得到股票 -> 板块的 CSR
+        rows = np.repeat(np.arange(len(boards), dtype=np.int32), np.diff(indptr))
+        order = np.argsort(indices, kind="stable")
+        self.code_indices = rows[order]
+        self.code_indptr = np.searchsorted(
+            indices[order], np.arange(len(codes) + 1)
+        ).astype(np.int64)
+
+    @classmethod
+    def build(cls, members, built_at=None, failed=()):
+        """members: {(kind, name, board_code): 成分股代码列表}"""
+        boards = sorted(members)
+        codes = np.array(
+            sorted({normalize_code(c) for m in members.values() for c in m}), dtype=str
+        )
+        indptr = np.zeros(len(boards) + 1, dtype=np.int64)
+        parts = []
+        for i, board in enumerate(boards):
+            board_codes = np.unique(
+                np.array([normalize_code(c) for c in members[board]], dtype=str)
+            )
+            parts.append(np.searchsorted(codes, board_codes).astype(np.int32))
+            indptr[i + 1] = indptr[i] + len(board_codes)
+        indices = np.concatenate(parts) if parts else np.array([], dtype=np.int32)
+        return cls(boards, codes, indptr, indices, built_at, failed)
+
+    def __len__(self):
+        return len(self.boards)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def board_index(self, name, kind=None):
+        """按 (类型, 名称) 或名称 / 板块代码查找板块行号，找不到时返回 None"""
+        if kind is not None:
+            return self.by_key.get((kind, name))
+        return self.by_name.get(name)
+
+    def board_info(self, i):
+        kind, name, board_code = self.boards[i]
+        return {
+            "kind": kind,
+            "name": name,
+            "board_code": board_code,
+            "size": int(self.indptr[i + 1] - self.indptr[i]),
+        }
+
+    def members(self, i):
+        """板块 i 的成分股下标（升序）"""
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
+
+    def code_positions(self, codes):
+        """股票代码 -> 下标，矩阵中没有的代码被丢弃，返回升序下标数组"""
+        codes = np.unique(np.array([normalize_code(c) for c in codes], dtype=str))
+        positions = np.searchsorted(self.codes, codes)
+        found = positions < len(self.codes)
+        found[found] = self.codes[positions[found]] == codes[found]
+        return positions[found]
+
+    def boards_of(self, code):
+        """股票所属的所有板块行号，股票不在矩阵中时返回空数组"""
+        positions = self.code_positions([code])
+        if len(positions) == 0:
+            return np.array([], dtype=np.int32)
+        j = positions[0]
+        return self.code_indices[self.code_indptr[j] : self.code_indptr[j + 1]]
+
+    def combine(self, board_rows, op="and"):
+        """对若干板块的成分股做集合运算（and / or / diff 依次作用），返回股票下标"""
+        func = SET_OPS[op]
+        result = self.members(board_rows[0])
+        for i in board_rows[1:]:
+            result = func(result, self.members(i))
+        return result
+
+    def summarize(self, codes, distance, hits):
+        """
+        按板块汇总：codes 为全市场代码，distance 为与之对齐的距阶段最低涨幅（无数据为 NaN），
+        hits 为低价股代码。对每个板块返回成分股数、有数据的成分股数、低价股数和距低点中位数，
+        全程在非零元数组上向量化计算，不逐板块循环。
+        """
+        n_boards = len(self.boards)
+        rows = np.repeat(np.arange(n_boards), np.diff(self.indptr))
+
+        # 矩阵中的股票 -> 全市场数组中的位置
+        codes = np.asarray(codes, dtype=str)
+        order = np.argsort(codes)
+        positions = np.searchsorted(codes[order], self.codes)
+        found = positions < len(codes)
+        found[found] = codes[order][positions[found]] == self.codes[found]
+        code_distance = np.full(len(self.codes), np.nan)
+        code_distance[found] = np.asarray(distance, dtype=float)[
+            order[positions[found]]
+        ]
+        code_hit = np.zeros(len(self.codes), dtype=bool)
+        code_hit[self.code_positions(hits)] = True
+
+        member_distance = code_distance[self.indices]
+        valid = ~np.isnan(member_distance)
+        low = np.bincount(
+            rows, weights=code_hit[self.indices], minlength=n_boards
+        ).astype(int)
+        with_data = np.bincount(rows[valid], minlength=n_boards)
+
+        # 按 (板块, 距离) 排序后，每个板块的有效值连续排列，中位数直接按下标取
+        valid_rows, valid_distance = rows[valid], member_distance[valid]
+        sorted_distance = valid_distance[np.lexsort((valid_distance, valid_rows))]
+        median = np.full(n_boards, np.nan)
+        has_data = with_data > 0
+        if len(sorted_distance):
+            starts = np.cumsum(with_data) - with_data
+            lo = (starts + (with_data - 1) // 2)[has_data]
+            hi = (starts + with_data // 2)[has_data]
+            median[has_data] = (sorted_distance[lo] + sorted_distance[hi]) / 2
+
+        return {
+            "size": np.diff(self.indptr),
+            "with_data": with_data,
+            "low": low,
+            "median_distance": median,
+        }
+
+    def stats(self):
+        kinds = {}
+        for kind, _, _ in self.boards:
+            kinds[kind] = kinds.get(kind, 0) + 1
+        return {
+            "boards": len(self.boards),
+            "by_kind": kinds,
+            "codes": len(self.codes),
+            "nnz": self.nnz,
+            "built_at": self.built_at,
+            "failed": self.failed,
+        }
+
+    def save(self, path=MATRIX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        kinds, names, board_codes = zip(*self.boards) if self.boards else ((), (), ())
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                kinds=np.array(kinds, dtype=str),
+                names=np.array(names, dtype=str),
+                board_codes=np.array(board_codes, dtype=str),
+                codes=self.codes,
+                indptr=self.indptr,
+                indices=self.indices,
+                meta=np.array(
+                    json.dumps(
+                        {"built_at": self.built_at, "failed": self.failed},
+                        ensure_ascii=False,
+                    )
+                ),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=MATRIX_PATH):
+        with np.load(path) as data:
+            columns = {key: data[key] for key in data.files}
+        meta = json.loads(str(columns["meta"]))
+        boards = list(
+            zip(
+                columns["kinds"].tolist(),
+                columns["names"].tolist(),
+                columns["board_codes"].tolist(),
+            )
+        )
+        return cls(
+            boards,
+            columns["codes"],
+            columns["indptr"],
+            columns["indices"],
+            meta.get("built_at"),
+            meta.get("failed", []),
+        )
+
+
+_cache = {"version": None, "matrix": None}
+_lock = threading.Lock()
+
+
+def _file_version(path=MATRIX_PATH):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def get_matrix():
+    """返回当前的隶属矩阵；还没有 refresh 过时返回 None"""
+    version = _file_version()
+    if version is None:
+        return None
+    if _cache["version"] == version:
+        return _cache["matrix"]
+    with _lock:
+        if _cache["version"] != version:
+            _cache["matrix"] = BoardMatrix.load()
+            _cache["version"] = version
+    return _cache["matrix"]
+
+
+def fetch_board_list(kind):
+    """[(kind, 板块名称, 板块代码), ...]"""
+    df = getattr(ak, KINDS[kind][0])()
+    return [
+        (kind, str(name), str(board_code))
+        for name, board_code in zip(df["板块名称"], df["板块代码"])
+    ]
+
+
+def fetch_board_members(board):
+    """返回 (成分股代码列表, 错误, 耗时)，异常不外抛"""
+    kind, name, _ = board
+    started = time.perf_counter()
+    try:
+        df = getattr(ak, KINDS[kind][1])(symbol=name)
+        codes = [normalize_code(c) for c in df["代码"]]
+        return codes, None, time.perf_counter() - started
+    except Exception as e:
+        print(f"[板块矩阵] 拉取 {kind} {name} 成分股失败：{e}")
+        return None, e, time.perf_counter() - started
+
+
+def refresh(kinds=tuple(KINDS), max_workers=8, should_stop=None, on_progress=None):
+    """
+    并发拉取 kinds 中所有板块的成分股（并发数不超过 max_workers），重建并保存隶属矩阵。
+    板块列表或成分股拉取失败、以及 should_stop() 为真后未拉取的板块，沿用上一版矩阵中的数据；
+    on_progress(done, total) 在每个板块完成后回调。
+    """
+    started = time.perf_counter()
+    previous = get_matrix()
+
+    def previous_members(board):
+        if previous is None:
+            return None
+        i = previous.board_index(board[1], board[0])
+        return None if i is None else previous.codes[previous.members(i)].tolist()
+
+    boards, failed = [], []
+    for kind in kinds:
+        try:
+            boards += fetch_board_list(kind)
+        except Exception as e:
+            print(f"[板块矩阵] 获取{kind}板块列表失败，沿用上一版：{e}")
+            failed.append(kind)
+            if previous is not None:
+                boards += [b for b in previous.boards if b[0] == kind]
+    # 只刷新部分类型时，其余类型原样保留
+    if previous is not None:
+        boards += [b for b in previous.boards if b[0] not in kinds]
+
+    members = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(fetch_board_members, board): board
+            for board in boards
+            if board[0] in kinds
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            if should_stop is not None and should_stop():
+                executor.shutdown(cancel_futures=True)
+                print("[板块矩阵] 检测到停止信号，取消剩余拉取")
+                break
+            codes, error, _ = future.result()
+            if error is None:
+                members[futures[future]] = codes
+            if on_progress is not None:
+                on_progress(done, len(futures))
+
+    for board in boards:
+        if board in members:
+            continue
+        codes = previous_members(board)
+        if board[0] in kinds:
+            failed.append(f"{board[0]}:{board[1]}")
+        if codes is not None:
+            members[board] = codes
+
+    matrix = BoardMatrix.build(
+        members, built_at=datetime.now().isoformat(timespec="seconds"), failed=failed
+    )
+    matrix.save()
+    with _lock:
+        _cache["matrix"] = matrix
+        _cache["version"] = _file_version()
+    elapsed = time.perf_counter() - started
+    print(
+        f"[板块矩阵] {len(matrix)} 个板块、{len(matrix.codes)} 只股票、"
+        f"{matrix.nnz} 条隶属关系，失败 {len(failed)}，耗时 {elapsed:.2f}s"
+    )
+    return {**matrix.stats(), "elapsed": round(elapsed, 3)}
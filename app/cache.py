@@ -0,0 +1,197 @@
+"""
+akshare 接口的共享缓存层。
+
+- 每个缓存有独立的 TTL 和容量上限，超出容量时按 LRU 淘汰；
+- single-flight：同一个 key 并发未命中时只有一个线程调用上游，其余线程等待并复用结果；
+- 可选磁盘持久化（stocks_info/cache/{name}/），重启后未过期的条目仍然有效；
+- 命中、未命中、合并等待、淘汰、上游错误等计数可通过 stats() 查看。
+
+用法：
+
+    @cached("industry_boards", ttl=600, persist=True)
+    def fetch_industry_boards():
+        return ak.stock_board_industry_name_em()
+
+返回值在多个请求之间共享，调用方不要原地修改（需要修改时先 copy()）。
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+CACHE_DIR = os.path.join(BASE_DIR, "stocks_info", "cache")
+
+CACHES = {}
+
+
+class _Flight:
+    """一次正在进行的上游调用，等待者通过 event 获取结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    def __init__(self, name, ttl, maxsize=128, persist=False):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.persist = persist
+        self.entries = OrderedDict()  # key -> (过期时间戳, value)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(CACHE_DIR, self.name, f"{digest}.pkl")
+
+    def _load_disk(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                expires_at, stored_key, value = pickle.load(f)
+        except Exception:
+            return None
+        if stored_key != key or expires_at <= time.time():
+            return None
+        return expires_at, value
+
+    def _save_disk(self, key, expires_at, value):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((expires_at, key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _remove_disk(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _store(self, key, expires_at, value):
+        """调用方需持有 self.lock"""
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            evicted, _ = self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+            if self.persist:
+                self._remove_disk(evicted)
+
+    def get_or_load(self, key, loader):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self.inflight[key] = flight
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            stored = self._load_disk(key) if self.persist else None
+            if stored is not None:
+                expires_at, value = stored
+                with self.lock:
+                    self.counters["disk_hits"] += 1
+            else:
+                with self.lock:
+                    self.counters["misses"] += 1
+                value = loader()
+                expires_at = time.time() + self.ttl
+                if self.persist:
+                    try:
+                        self._save_disk(key, expires_at, value)
+                    except Exception as e:
+                        print(f"[缓存] {self.name} 写入磁盘失败：{e}")
+            with self.lock:
+                self._store(key, expires_at, value)
+            flight.value = value
+            return value
+        except Exception as e:
+            with self.lock:
+                self.counters["errors"] += 1
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            flight.event.set()
+
+    def invalidate(self, key=None):
+        with self.lock:
+            keys = list(self.entries) if key is None else [key]
+            for k in keys:
+                self.entries.pop(k, None)
+                if self.persist:
+                    self._remove_disk(k)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "ttl": self.ttl,
+                "maxsize": self.maxsize,
+                "size": len(self.entries),
+                "persist": self.persist,
+                **self.counters,
+            }
+
+
+def get_cache(name, ttl, maxsize=128, persist=False):
+    if name not in CACHES:
+        CACHES[name] = TTLCache(name, ttl, maxsize=maxsize, persist=persist)
+    return CACHES[name]
+
+
+def cached(name, ttl, maxsize=128, persist=False):
+    """以位置参数和关键字参数作为 key 缓存函数结果"""
+    cache = get_cache(name, ttl, maxsize=maxsize, persist=persist)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return cache.get_or_load(key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def stats():
+    return {name: cache.stats() for name, cache in CACHES.items()}
@@ -0,0 +1,319 @@
+"""
+按筛选窗口预计算的阶段最低/最高价索引。
+
+每个窗口（30/90/180/365 天）一份索引，持久化为 ``history_cache/_extremes_{days}.npz``，
+记录每只股票窗口内的最低价、最高价及其所在日、最新收盘价，以及对应的窗口起始日
+和 .npy 文件的 (大小, 修改时间) 戳。
+
+- 历史同步追加新 K 线后调用 ``on_history_updated``，用新增的几行增量更新极值；
+- 筛选时调用 ``screen``，只做查表和与 threshold 的比较；
+- 多个窗口一起筛选时先调用 ``refresh``，过期的股票只读一次文件就重算所有窗口；
+- 文件戳对不上的条目视为过期，查表时自动从 history_cache 重算；
+- 窗口每天向后滚动，移出窗口的只是最早的 K 线：最低、最高价所在日仍在窗口内时
+  极值不变，只更新起始日，只有极值所在日滚出窗口的股票才重读文件。
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from app import history_store, metrics, screener
+
+INDEX_WINDOWS = (30, 90, 180, 365)
+
+_FIELDS = (
+    "size",
+    "mtime",
+    "rows",
+    "cutoff",
+    "has_data",
+    "min",
+    "min_date",
+    "max",
+    "max_date",
+    "close",
+)
+
+
+def index_path(days):
+    return os.path.join(history_store.HISTORY_CACHE_DIR, f"_extremes_{days}.npz")
+
+
+def first_day_for(days, now=None):
+    """窗口内第一个自然日：与 screener.cutoff_for 的 `日期 >= 截止时间` 语义一致"""
+    cutoff = screener.cutoff_for(days, now)
+    first_day = cutoff.astype("M8[D]")
+    if first_day < cutoff:
+        first_day += 1
+    return first_day
+
+
+def _file_stamp(code):
+    try:
+        st = os.stat(history_store.history_path(code))
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _window_entry(records, first_day, stamp):
+    window = records[np.searchsorted(records["date"], first_day, side="left") :]
+    entry = {
+        "size": stamp[0],
+        "mtime": stamp[1],
+        "rows": len(records),
+        "cutoff": first_day,
+        "has_data": len(window) > 0,
+        "min": np.nan,
+        "min_date": np.datetime64("NaT", "D"),
+        "max": np.nan,
+        "max_date": np.datetime64("NaT", "D"),
+        "close": np.nan,
+    }
+    if len(window) > 0:
+        # fmin/fmax 忽略 NaN，与面板上的 nanmin/nanmax 结果一致；
+        # 极值出现多次时记最后一次的日期，窗口滚动时能沿用得更久
+        for key, field, reduce in (("min", "low", np.fmin), ("max", "high", np.fmax)):
+            values = window[field]
+            entry[key] = float(reduce.reduce(values))
+            if not np.isnan(entry[key]):
+                entry[f"{key}_date"] = window["date"][values == entry[key]][-1]
+        entry["close"] = float(window["close"][-1])
+    return entry
+
+
+def _roll(entry, first_day):
+    """
+    把条目的窗口起始日移到 first_day：极值所在日都还在窗口内时返回更新了起始日的条目，
+    否则返回 None，需要重读文件。没有数据的条目窗口后移后仍没有数据。
+    """
+    if entry["cutoff"] == first_day:
+        return entry
+    if first_day < entry["cutoff"]:
+        return None
+    if entry["has_data"] and not (
+        entry["min_date"] >= first_day and entry["max_date"] >= first_day
+    ):
+        return None
+    return dict(entry, cutoff=first_day)
+
+
+def _current(entry, stamp, first_day):
+    """文件戳一致时返回滚动到 first_day 的条目，缺失或需要重读文件时返回 None"""
+    if entry is None or stamp is None or (entry["size"], entry["mtime"]) != stamp:
+        return None
+    return _roll(entry, first_day)
+
+
+def _merge_extreme(old, new, key, prefer_new):
+    """合并旧条目与新增 K 线的某个极值，返回 (值, 所在日)；相等时取较晚的新值"""
+    if np.isnan(new[key]) or (
+        not np.isnan(old[key]) and not prefer_new(new[key], old[key])
+    ):
+        return old[key], old[f"{key}_date"]
+    return new[key], new[f"{key}_date"]
+
+
+class ExtremesIndex:
+    """单个窗口的极值索引，按股票代码保存一条记录"""
+
+    def __init__(self, days):
+        self.days = days
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        # 同步任务的 flush 与请求线程的 lookup 可能同时落盘，写文件整体串行，
+        # 后取快照的一方一定后写，磁盘上不会留下较旧的内容
+        self.write_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        path = index_path(self.days)
+        if not os.path.exists(path):
+            return
+        try:
+            # NpzFile 每次按键取值都会重新解压整列，先一次性取出各列
+            with np.load(path) as data:
+                codes = data["codes"]
+                columns = {field: data[field] for field in _FIELDS}
+            for i, code in enumerate(codes):
+                self.entries[str(code)] = {
+                    field: columns[field][i] for field in _FIELDS
+                }
+        except Exception as e:
+            print(f"[极值索引] 读取 {path} 失败，将重建：{e}")
+            self.entries = {}
+
+    def save(self):
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                codes = sorted(self.entries)
+                columns = {
+                    field: np.array([self.entries[c][field] for c in codes])
+                    for field in _FIELDS
+                }
+                self.dirty = False
+            os.makedirs(history_store.HISTORY_CACHE_DIR, exist_ok=True)
+            path = index_path(self.days)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, codes=np.array(codes, dtype=str), **columns)
+            os.replace(tmp_path, path)
+
+    def _rebuild(self, code, first_day, stamp):
+        records = history_store.read_history(code)
+        if records is None:
+            self.entries.pop(code, None)
+            return None
+        entry = _window_entry(records, first_day, _file_stamp(code) or stamp)
+        self.entries[code] = entry
+        self.dirty = True
+        return entry
+
+    def update(self, code, appended, now=None):
+        """同步追加了 appended 行新 K 线后增量更新该股票的极值"""
+        first_day = first_day_for(self.days, now)
+        stamp = _file_stamp(code)
+        if stamp is None:
+            return
+        records = history_store.read_history(code)
+        with self.lock:
+            old = self.entries.get(code)
+            if old is not None:
+                old = _roll(old, first_day)
+            if old is None or appended <= 0 or old["rows"] + appended != len(records):
+                # 极值已滚出窗口或索引与文件不一致，直接重算
+                self.entries[code] = _window_entry(records, first_day, stamp)
+            else:
+                new = _window_entry(records[-appended:], first_day, stamp)
+                entry = dict(new, rows=len(records))
+                if old["has_data"]:
+                    entry["has_data"] = True
+                    entry["min"], entry["min_date"] = _merge_extreme(
+                        old, new, "min", np.less_equal
+                    )
+                    entry["max"], entry["max_date"] = _merge_extreme(
+                        old, new, "max", np.greater_equal
+                    )
+                    if not new["has_data"]:
+                        entry["close"] = old["close"]
+                self.entries[code] = entry
+            self.dirty = True
+
+    def lookup(self, codes, now=None):
+        """
+        返回 codes 对应的窗口统计量（与 screener.window_stats 相同的结构），
+        过期或缺失的条目会先从 history_cache 重算，只是窗口滚动的条目原地更新起始日。
+        """
+        first_day = first_day_for(self.days, now)
+        n = len(codes)
+        stats = {
+            "has_data": np.zeros(n, dtype=bool),
+            "min_price": np.full(n, np.nan),
+            "max_price": np.full(n, np.nan),
+            "current_price": np.full(n, np.nan),
+        }
+        rebuilt = rolled = 0
+        with self.lock:
+            for j, code in enumerate(codes):
+                stamp = _file_stamp(code)
+                entry = self.entries.get(code)
+                current = _current(entry, stamp, first_day)
+                if current is None:
+                    entry = self._rebuild(code, first_day, stamp)
+                    rebuilt += 1
+                elif current is not entry:
+                    entry = self.entries[code] = current
+                    self.dirty = True
+                    rolled += 1
+                if entry is None or not entry["has_data"]:
+                    continue
+                stats["has_data"][j] = True
+                stats["min_price"][j] = entry["min"]
+                stats["max_price"][j] = entry["max"]
+                stats["current_price"][j] = entry["close"]
+        if rebuilt:
+            print(f"[极值索引] {self.days} 天窗口重算 {rebuilt} 只股票")
+        if rebuilt or rolled:
+            self.save()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stats["distance"] = (stats["current_price"] - stats["min_price"]) / stats[
+                "min_price"
+            ]
+        return stats
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(days):
+    with _indexes_lock:
+        if days not in _indexes:
+            _indexes[days] = ExtremesIndex(days)
+        return _indexes[days]
+
+
+def on_history_updated(code, appended, now=None):
+    """history 同步写入后的钩子：增量更新所有窗口的索引（不立即落盘）"""
+    for days in INDEX_WINDOWS:
+        try:
+            get_index(days).update(code, appended, now)
+        except Exception as e:
+            print(f"[极值索引] 更新 {code} 的 {days} 天窗口失败：{e}")
+
+
+def refresh(codes, windows, now=None):
+    """
+    多个窗口一起查表前调用：任一窗口过期的股票只读一次 history，
+    同时重算所有过期窗口的条目，避免每个窗口各自重读一遍文件。
+    """
+    indexes = [(get_index(days), first_day_for(days, now)) for days in windows]
+    rebuilt = rolled = 0
+    for code in codes:
+        stamp = _file_stamp(code)
+        stale = []
+        for index, first_day in indexes:
+            with index.lock:
+                entry = index.entries.get(code)
+                current = _current(entry, stamp, first_day)
+                if current is None:
+                    stale.append((index, first_day))
+                elif current is not entry:
+                    index.entries[code] = current
+                    index.dirty = True
+                    rolled += 1
+        if not stale:
+            continue
+        records = history_store.read_history(code) if stamp is not None else None
+        for index, first_day in stale:
+            with index.lock:
+                if records is None:
+                    index.entries.pop(code, None)
+                else:
+                    index.entries[code] = _window_entry(records, first_day, stamp)
+                index.dirty = True
+        rebuilt += 1
+    if rebuilt:
+        print(f"[极值索引] {len(windows)} 个窗口一起重算 {rebuilt} 只股票")
+    if rebuilt or rolled:
+        flush()
+
+
+def flush():
+    """把所有有改动的窗口索引写回磁盘"""
+    for index in list(_indexes.values()):
+        index.save()
+
+
+@metrics.timed(metrics.SCREENING_DURATION, engine="index")
+def screen(codes, days, threshold=1.05, name_map=None, now=None):
+    """基于索引的低价筛选，结果与 screener.screen_low_price 一致"""
+    metrics.SCREENING_CODES.inc(len(codes), engine="index")
+    stats = get_index(days).lookup(codes, now)
+    mask = screener.low_price_mask(stats, threshold)
+    print(f"[极值索引] {days} 天窗口：{len(codes)} 只股票，命中 {int(mask.sum())} 只")
+    return screener.format_rows(list(codes), stats, mask, name_map)
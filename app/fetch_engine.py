@@ -0,0 +1,228 @@
+"""
+基于 asyncio 的连续抓取流水线，用于全市场历史行情同步。
+
+- 令牌桶（TokenBucket）限制对上游的请求速率；
+- AIMD 并发控制（AIMDLimiter）：请求成功且时延正常时并发数线性增加，
+  出错或时延超过目标时乘性减半，自动适应上游的快慢；
+- 抓取与写盘通过有界队列解耦：抓取协程只负责拉数据，
+  单独的写盘协程按顺序写入 history_cache，队列满时抓取自然降速。
+
+上游函数（如 ak.stock_zh_a_hist）是同步阻塞调用，放在线程池中执行；
+超时的调用无法中断，线程仍占着线程池，因此它的并发名额等调用真正返回后才归还，
+这只股票也不再重试，避免同一代码的旧请求与重试同时进行。
+fetch_one / write_one 由调用方传入，便于用本地桩函数注入时延和错误做测试。
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒 rate 个请求，允许 capacity 个突发"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AIMDLimiter:
+    """
+    加性增、乘性减的并发上限。
+    每个成功且时延低于 latency_target 的请求把上限增加 1/limit（约每轮 +1），
+    出错或超时则把上限乘以 backoff；同一时延窗口内只减一次。
+    """
+
+    def __init__(
+        self, initial=4, minimum=1, maximum=32, latency_target=2.0, backoff=0.5
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency, ok):
+        async with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if not ok or latency > self.latency_target:
+                if now - self.last_decrease > self.latency_target:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+
+async def run_pipeline(
+    items,
+    fetch_one,
+    write_one,
+    rate=10,
+    initial_concurrency=4,
+    max_concurrency=16,
+    latency_target=2.0,
+    queue_size=64,
+    timeout=60,
+    retries=2,
+    should_stop=None,
+    on_result=None,
+):
+    """
+    对 items 逐个执行 fetch_one(item)（线程池），结果经有界队列交给 write_one(item, payload)。
+    fetch_one 返回 None 表示无需写入；on_result(item, result) 在每个 item 完成后回调。
+    返回统计信息 dict。
+    """
+    loop = asyncio.get_running_loop()
+    bucket = TokenBucket(rate)
+    limiter = AIMDLimiter(
+        initial=initial_concurrency,
+        maximum=max_concurrency,
+        latency_target=latency_target,
+    )
+    pending = asyncio.Queue()
+    for item in items:
+        pending.put_nowait(item)
+    write_queue = asyncio.Queue(maxsize=queue_size)
+    stats = {
+        "total": len(items),
+        "fetched": 0,
+        "skipped": 0,
+        "written": 0,
+        "errors": 0,
+        "timeouts": 0,
+        "stopped": False,
+    }
+    started = time.monotonic()
+
+    def report(item, result):
+        if on_result is not None:
+            try:
+                on_result(item, result)
+            except Exception as e:
+                print(f"[抓取引擎] 进度回调异常: {e}")
+
+    def on_late_return(begin, call):
+        """超时的调用终于返回：归还并发名额（按失败计），结果和异常都丢弃"""
+        if not call.cancelled():
+            call.exception()
+        loop.create_task(limiter.release(time.monotonic() - begin, False))
+
+    fetch_executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    write_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def fetcher():
+        while True:
+            if should_stop is not None and should_stop():
+                stats["stopped"] = True
+                return
+            try:
+                item = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            payload, error = None, None
+            for attempt in range(retries + 1):
+                await limiter.acquire()
+                await bucket.acquire()
+                begin = time.monotonic()
+                call = loop.run_in_executor(fetch_executor, fetch_one, item)
+                try:
+                    # shield：超时只放弃等待，不取消 call，调用返回时再归还名额
+                    payload = await asyncio.wait_for(asyncio.shield(call), timeout)
+                    error = None
+                except asyncio.TimeoutError:
+                    stats["timeouts"] += 1
+                    call.add_done_callback(functools.partial(on_late_return, begin))
+                    error = "超时"
+                    break
+                except Exception as e:
+                    error = e
+                await limiter.release(time.monotonic() - begin, error is None)
+                if error is None:
+                    break
+                if attempt < retries:
+                    await asyncio.sleep(min(2**attempt, 10) * 0.5)
+
+            if error is not None:
+                stats["errors"] += 1
+                report(
+                    item,
+                    {
+                        "code": -1,
+                        "message": f"[更新失败] {item}: {error}",
+                        "updated_count": -1,
+                    },
+                )
+            elif payload is None:
+                stats["skipped"] += 1
+                report(
+                    item,
+                    {
+                        "code": 0,
+                        "message": f"[无需更新] {item} 已是最新",
+                        "updated_count": 0,
+                    },
+                )
+            else:
+                stats["fetched"] += 1
+                await write_queue.put((item, payload))
+
+    async def writer():
+        while True:
+            entry = await write_queue.get()
+            if entry is None:
+                return
+            item, payload = entry
+            try:
+                result = await loop.run_in_executor(
+                    write_executor, write_one, item, payload
+                )
+                stats["written"] += 1
+            except Exception as e:
+                stats["errors"] += 1
+                result = {
+                    "code": -1,
+                    "message": f"[写入失败] {item}: {e}",
+                    "updated_count": -1,
+                }
+            report(item, result)
+
+    writer_task = asyncio.create_task(writer())
+    try:
+        await asyncio.gather(*(fetcher() for _ in range(max_concurrency)))
+    finally:
+        await write_queue.put(None)
+        await writer_task
+        fetch_executor.shutdown(wait=False, cancel_futures=True)
+        write_executor.shutdown(wait=True)
+
+    stats["elapsed"] = round(time.monotonic() - started, 3)
+    stats["final_concurrency"] = round(limiter.limit, 2)
+    return stats
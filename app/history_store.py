@@ -0,0 +1,317 @@
+"""
+日线历史数据的二进制列式存储。
+
+每只股票一个 ``history_cache/{code}.npy`` 文件，内容是按日期升序排列的 NumPy
+结构化数组（日期为 datetime64[D]，价格/成交量为 float64）。读取时直接
+``np.load(mmap_mode="r")`` 内存映射，不再做文本解析和 ``pd.to_datetime``。
+
+增量更新时只把新 K 线追加到文件末尾，并就地改写 .npy 头部中的行数
+（NumPy 会为头部预留足够的空白，shape 可以原地增长），不会重写历史数据。
+每只股票的水位（最后日期、行数）直接从文件头和最后一行读出。
+同一只股票的写入由进程内的按代码锁串行化，读水位、过滤、追加是一个整体。
+所有写入路径都会同步更新 sync_manifest 中的清单条目。
+
+旧的 ``history_cache/{code}.csv`` 仍可读取：首次访问时会自动转换为 .npy，
+也可以通过 ``python -m app.history_store migrate`` 一次性批量迁移。
+
+文件中始终是不复权价格，读取时传 adjust="qfq" / "hfq" 按复权因子即时换算。
+"""
+
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.errors import EmptyDataError
+
+from app import metrics
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+HISTORY_CACHE_DIR = os.path.join(BASE_DIR, "history_cache")
+
+# (akshare 中文列名, 存储字段名, dtype)
+FIELDS = [
+    ("日期", "date", "M8[D]"),
+    ("开盘", "open", "f8"),
+    ("收盘", "close", "f8"),
+    ("最高", "high", "f8"),
+    ("最低", "low", "f8"),
+    ("成交量", "volume", "f8"),
+    ("成交额", "amount", "f8"),
+    ("振幅", "amplitude", "f8"),
+    ("涨跌幅", "pct_chg", "f8"),
+    ("涨跌额", "change", "f8"),
+    ("换手率", "turnover", "f8"),
+]
+HISTORY_DTYPE = np.dtype([(field, dtype) for _, field, dtype in FIELDS])
+COLUMN_TO_FIELD = {column: field for column, field, _ in FIELDS}
+FIELD_TO_COLUMN = {field: column for column, field, _ in FIELDS}
+
+
+# 股票代码 -> 可重入锁；追加时 get_watermark 可能触发 CSV 迁移，同一线程会再次加锁
+_code_locks = {}
+_code_locks_guard = threading.Lock()
+
+
+def code_lock(code):
+    """单只股票的写入锁：同步任务、每日快照和单只更新可能同时写同一只股票"""
+    with _code_locks_guard:
+        lock = _code_locks.get(code)
+        if lock is None:
+            lock = _code_locks[code] = threading.RLock()
+        return lock
+
+
+def history_path(code):
+    return os.path.join(HISTORY_CACHE_DIR, f"{code}.npy")
+
+
+def legacy_csv_path(code):
+    return os.path.join(HISTORY_CACHE_DIR, f"{code}.csv")
+
+
+def list_codes():
+    """返回缓存中所有股票代码（.npy 与未迁移的 .csv 合并），按代码排序"""
+    if not os.path.isdir(HISTORY_CACHE_DIR):
+        return []
+    codes = set()
+    for f in os.listdir(HISTORY_CACHE_DIR):
+        if f.startswith("_"):
+            continue
+        if f.endswith(".npy") or f.endswith(".csv"):
+            codes.add(f[:-4])
+    return sorted(codes)
+
+
+def has_history(code):
+    return os.path.exists(history_path(code)) or os.path.exists(legacy_csv_path(code))
+
+
+def frame_to_records(df):
+    """把 akshare 返回的中文列 DataFrame 转换为按日期升序的结构化数组"""
+    records = np.empty(len(df), dtype=HISTORY_DTYPE)
+    for column, field, _ in FIELDS:
+        if column not in df.columns:
+            records[field] = np.datetime64("NaT") if field == "date" else np.nan
+        elif field == "date":
+            records[field] = pd.to_datetime(df[column]).values.astype("M8[D]")
+        else:
+            records[field] = pd.to_numeric(df[column], errors="coerce").values
+    return records[np.argsort(records["date"], kind="stable")]
+
+
+def records_to_frame(records):
+    """把结构化数组还原为中文列名的 DataFrame（日期为 datetime64）"""
+    return pd.DataFrame(
+        {FIELD_TO_COLUMN[field]: records[field] for field in HISTORY_DTYPE.names}
+    )
+
+
+def _notify_manifest(method, *args):
+    """把写入同步到 sync_manifest；清单出错不影响数据写入"""
+    # 延迟导入：sync_manifest 依赖本模块
+    from app import sync_manifest
+
+    try:
+        getattr(sync_manifest.get_manifest(), method)(*args)
+    except Exception as e:
+        print(f"[同步清单] 更新 {args[0]} 失败：{e}")
+
+
+@metrics.timed(metrics.STORE_DURATION, store="history", op="write")
+def _save_records(code, records):
+    os.makedirs(HISTORY_CACHE_DIR, exist_ok=True)
+    path = history_path(code)
+    tmp_path = f"{path}.tmp"
+    records = np.ascontiguousarray(records, dtype=HISTORY_DTYPE)
+    with code_lock(code):
+        with open(tmp_path, "wb") as f:
+            np.save(f, records)
+        os.replace(tmp_path, path)
+        _notify_manifest("on_saved", code, records)
+
+
+def migrate_csv(code, remove_csv=False):
+    """把单只股票的旧 CSV 缓存转换为 .npy，返回转换后的结构化数组"""
+    csv_path = legacy_csv_path(code)
+    try:
+        df = pd.read_csv(csv_path)
+    except EmptyDataError:
+        df = pd.DataFrame()
+    records = frame_to_records(df)
+    _save_records(code, records)
+    if remove_csv:
+        os.remove(csv_path)
+    return records
+
+
+def read_history(code, mmap=True, adjust=""):
+    """
+    读取单只股票的日线结构化数组，不存在时返回 None。
+    默认以只读内存映射方式打开，调用方不要修改返回的数组。
+    adjust 为 qfq / hfq 时返回用复权因子缩放价格后的副本（见 adjust_factors）。
+    """
+    records = _read_raw(code, mmap)
+    if adjust:
+        # 延迟导入：adjust_factors 依赖本模块
+        from app import adjust_factors
+
+        records = adjust_factors.apply(code, records, adjust)
+    return records
+
+
+@metrics.timed(metrics.STORE_DURATION, store="history", op="read")
+def _read_raw(code, mmap):
+    path = history_path(code)
+    if not os.path.exists(path):
+        if not os.path.exists(legacy_csv_path(code)):
+            return None
+        return migrate_csv(code)
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def read_history_frame(code, adjust=""):
+    """读取单只股票的日线 DataFrame（中文列名），不存在时返回空 DataFrame"""
+    records = read_history(code, mmap=False, adjust=adjust)
+    if records is None:
+        return pd.DataFrame(columns=[column for column, _, _ in FIELDS])
+    return records_to_frame(records)
+
+
+def write_history(code, df):
+    """用 DataFrame（中文列名）整体覆盖写入单只股票的日线数据，返回写入行数"""
+    records = frame_to_records(df)
+    _save_records(code, records)
+    return len(records)
+
+
+def _read_header(f):
+    """读取 .npy 头部，返回 (行数, dtype, 数据起始偏移)"""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return shape[0], dtype, f.tell()
+
+
+def _rewrite_header(f, rows, dtype, data_offset):
+    """
+    原地改写头部中的行数，头部总长度保持不变。
+    空白不足以容纳新的 shape 时返回 False，由调用方退回整体重写。
+    """
+    f.seek(0)
+    version = np.lib.format.read_magic(f)
+    prefix_len = f.tell() + (2 if version == (1, 0) else 4)
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(dtype),
+        rows,
+    )
+    space = data_offset - prefix_len - 1
+    if len(header) > space:
+        return False
+    f.seek(prefix_len)
+    f.write((header.ljust(space) + "\n").encode("latin1"))
+    return True
+
+
+@metrics.timed(metrics.STORE_DURATION, store="history", op="watermark")
+def get_watermark(code):
+    """
+    返回单只股票的水位 {"last_date": "YYYY-MM-DD" 或 None, "rows": 行数}，
+    只读取文件头和最后一行，不加载历史数据。缓存不存在时返回 None。
+    """
+    path = history_path(code)
+    if not os.path.exists(path):
+        if not os.path.exists(legacy_csv_path(code)):
+            return None
+        migrate_csv(code)
+
+    with open(path, "rb") as f:
+        rows, dtype, data_offset = _read_header(f)
+        if rows == 0:
+            return {"last_date": None, "rows": 0}
+        f.seek(data_offset + (rows - 1) * dtype.itemsize)
+        last = np.frombuffer(f.read(dtype.itemsize), dtype=dtype)
+    return {"last_date": str(last["date"][0]), "rows": int(rows)}
+
+
+def append_history(code, df):
+    """
+    把新的 K 线（中文列名 DataFrame）追加到单只股票的缓存末尾。
+    只写入日期晚于当前最后一根 K 线的行，返回实际追加的行数。
+    """
+    return append_records(code, frame_to_records(df))
+
+
+@metrics.timed(metrics.STORE_DURATION, store="history", op="append")
+def append_records(code, records):
+    """
+    append_history 的结构化数组版本，供批量写入时跳过 DataFrame 转换。
+    持有该股票的写入锁，并发追加重叠的 K 线时不会重复写入。
+    """
+    with code_lock(code):
+        return _append_records(code, records)
+
+
+def _append_records(code, records):
+    path = history_path(code)
+    if not os.path.exists(path) and not os.path.exists(legacy_csv_path(code)):
+        _save_records(code, records)
+        return len(records)
+
+    watermark = get_watermark(code)
+    if watermark["last_date"] is not None:
+        records = records[records["date"] > np.datetime64(watermark["last_date"])]
+    if len(records) == 0:
+        return 0
+    records = np.ascontiguousarray(
+        records[np.unique(records["date"], return_index=True)[1]]
+    )
+
+    st = os.stat(path)
+    rewritten = False
+    with open(path, "r+b") as f:
+        rows, dtype, data_offset = _read_header(f)
+        if dtype == HISTORY_DTYPE:
+            # 先写数据再改头部：中途失败时旧头部仍然有效，多出的字节会被忽略
+            f.seek(data_offset + rows * dtype.itemsize)
+            f.write(records.tobytes())
+            f.truncate()
+            rewritten = _rewrite_header(f, rows + len(records), dtype, data_offset)
+    if rewritten:
+        _notify_manifest("on_appended", code, (st.st_size, st.st_mtime_ns), records)
+        return len(records)
+
+    # 字段结构变化或头部空间不足，退回整体重写
+    old = np.load(path)
+    _save_records(code, np.concatenate([old[:rows].astype(HISTORY_DTYPE), records]))
+    return len(records)
+
+
+def migrate_csv_cache(remove_csv=False):
+    """把 history_cache 下所有尚未迁移的 CSV 批量转换为 .npy"""
+    migrated = 0
+    failed = []
+    for code in list_codes():
+        if os.path.exists(history_path(code)):
+            continue
+        try:
+            migrate_csv(code, remove_csv=remove_csv)
+            migrated += 1
+        except Exception as e:
+            print(f"[迁移失败] {code}: {e}")
+            failed.append(code)
+    from app import sync_manifest
+
+    sync_manifest.flush()
+    print(f"[迁移完成] 共转换 {migrated} 只股票，失败 {len(failed)} 只")
+    return {"migrated": migrated, "failed": failed}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        migrate_csv_cache(remove_csv="--remove-csv" in sys.argv)
+    else:
+        print("用法: python -m app.history_store migrate [--remove-csv]")
@@ -0,0 +1,274 @@
+"""
+后台任务管理：取代原来的全局 stop_flag + task_status.json。
+
+- 任务按类型注册（历史行情同步、融资融券刷新、低价筛选等），每个任务有独立的
+  job_id、状态、进度和取消令牌；不同类型的任务可以并发运行，同一类型同一时间只运行一个；
+- 进度保存在内存中，并定期落盘到 stocks_info/jobs/{job_id}.json（原子替换）；
+- 进程重启后，落盘时仍为 running 的任务被标记为 interrupted，
+  可以通过 resume 从 checkpoint 继续，而不是从头开始。
+
+任务函数签名为 run(job, token)：
+- job.params 为启动参数，job.checkpoint 为可续跑的断点（dict，需可 JSON 序列化）；
+- 通过 job.update(...) 更新进度，job.save() 按间隔落盘；
+- 循环中检查 token.cancelled（或把 token 直接当作 should_stop 回调传下去）。
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+JOBS_DIR = os.path.join(BASE_DIR, "stocks_info", "jobs")
+
+# 两次落盘之间的最短间隔（秒），状态变化（开始/结束）时总是立即落盘
+CHECKPOINT_INTERVAL = 2.0
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+
+ACTIVE_STATES = (PENDING, RUNNING)
+RESUMABLE_STATES = (FAILED, CANCELLED, INTERRUPTED)
+
+JOB_TYPES = {}
+
+
+def job_type(name):
+    """注册任务类型：@job_type("history_sync") def run(job, token): ..."""
+
+    def decorator(func):
+        JOB_TYPES[name] = func
+        return func
+
+    return decorator
+
+
+class CancelToken:
+    """单个任务的取消令牌，可直接作为 should_stop 回调使用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def __call__(self):
+        return self.event.is_set()
+
+
+class Job:
+    def __init__(self, job_id, type, params=None):
+        self.job_id = job_id
+        self.type = type
+        self.params = params or {}
+        self.state = PENDING
+        self.message = ""
+        self.progress = 0
+        self.total = 0
+        self.stats = {}
+        self.checkpoint = {}
+        self.result = None
+        self.created_at = _now()
+        self.updated_at = self.created_at
+        self.finished_at = None
+        self.token = CancelToken()
+        self.lock = threading.Lock()
+        self.last_saved = 0.0
+
+    @property
+    def path(self):
+        return os.path.join(JOBS_DIR, f"{self.job_id}.json")
+
+    @property
+    def running(self):
+        return self.state in ACTIVE_STATES
+
+    def update(self, **fields):
+        """更新进度字段（progress、total、message、stats、checkpoint、result）"""
+        with self.lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.updated_at = _now()
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "job_id": self.job_id,
+                "type": self.type,
+                "state": self.state,
+                "running": self.running,
+                "message": self.message,
+                "progress": self.progress,
+                "total": self.total,
+                "stats": dict(self.stats),
+                "params": self.params,
+                "result": self.result,
+                "created_at": self.created_at,
+                "updated_at": self.updated_at,
+                "finished_at": self.finished_at,
+            }
+
+    def save(self, force=False, checkpoint=None):
+        """
+        落盘状态和 checkpoint；非 force 时按 CHECKPOINT_INTERVAL 节流。
+        checkpoint 可以是返回断点 dict 的函数，只在真正落盘时才调用，避免频繁构造。
+        """
+        now = time.monotonic()
+        if not force and now - self.last_saved < CHECKPOINT_INTERVAL:
+            return
+        self.last_saved = now
+        if checkpoint is not None:
+            self.update(checkpoint=checkpoint())
+        payload = self.to_dict()
+        with self.lock:
+            payload["checkpoint"] = self.checkpoint
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, indent=2, default=str)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[任务] 保存 {self.job_id} 失败：{e}")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        job = cls(data["job_id"], data["type"], data.get("params"))
+        job.state = data.get("state", INTERRUPTED)
+        job.message = data.get("message", "")
+        job.progress = data.get("progress", 0)
+        job.total = data.get("total", 0)
+        job.stats = data.get("stats") or {}
+        job.checkpoint = data.get("checkpoint") or {}
+        job.result = data.get("result")
+        job.created_at = data.get("created_at")
+        job.updated_at = data.get("updated_at")
+        job.finished_at = data.get("finished_at")
+        return job
+
+
+class JobManager:
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(JOBS_DIR):
+            return
+        for name in os.listdir(JOBS_DIR):
+            if not name.endswith(".json"):
+                continue
+            try:
+                job = Job.load(os.path.join(JOBS_DIR, name))
+            except Exception as e:
+                print(f"[任务] 读取 {name} 失败：{e}")
+                continue
+            if job.state in ACTIVE_STATES:
+                # 上次进程退出时仍在运行，标记为中断，等待续跑
+                job.state = INTERRUPTED
+                job.message = "服务重启，任务中断，可续跑"
+                job.save(force=True)
+            self.jobs[job.job_id] = job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self, type=None):
+        jobs = [j for j in self.jobs.values() if type is None or j.type == type]
+        return sorted(jobs, key=lambda j: j.created_at or "")
+
+    def latest(self, type):
+        jobs = self.list(type)
+        return jobs[-1] if jobs else None
+
+    def active(self, type):
+        return next((j for j in self.list(type) if j.running), None)
+
+    def start(self, type, params=None):
+        """启动新任务；同类型已有任务在运行时抛出 RuntimeError"""
+        if type not in JOB_TYPES:
+            raise ValueError(f"未知的任务类型: {type}")
+        with self.lock:
+            if self.active(type) is not None:
+                raise RuntimeError(f"{type} 任务已在运行中")
+            job = Job(f"{type}-{uuid.uuid4().hex[:8]}", type, params)
+            self.jobs[job.job_id] = job
+        self._run(job)
+        return job
+
+    def resume(self, job_id):
+        """从 checkpoint 继续一个中断、失败或已取消的任务"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job.state not in RESUMABLE_STATES:
+                raise RuntimeError(f"任务状态为 {job.state}，无法续跑")
+            if self.active(job.type) is not None:
+                raise RuntimeError(f"{job.type} 任务已在运行中")
+            job.state = PENDING
+            job.token = CancelToken()
+            job.finished_at = None
+        self._run(job)
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or not job.running:
+            return False
+        job.token.cancel()
+        job.update(message="已请求停止")
+        job.save(force=True)
+        return True
+
+    def _run(self, job):
+        run = JOB_TYPES[job.type]
+
+        def target():
+            job.update(state=RUNNING, message="任务运行中")
+            job.save(force=True)
+            try:
+                result = run(job, job.token)
+                if job.token.cancelled:
+                    job.update(state=CANCELLED, message="任务已手动停止")
+                else:
+                    job.update(state=DONE, message="任务完成", result=result)
+            except Exception as e:
+                print(f"❌ [任务] {job.job_id} 异常: {e}")
+                job.update(state=FAILED, message=f"任务异常中断: {e}")
+            job.update(finished_at=_now())
+            job.save(force=True)
+            print(f"[任务] {job.job_id} 结束：{job.state}")
+
+        threading.Thread(target=target, name=job.job_id, daemon=True).start()
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """进程内唯一的任务管理器，首次使用时加载已落盘的任务"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+    return _manager
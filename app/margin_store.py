@@ -0,0 +1,167 @@
+"""
+按证券代码索引的融资融券数据存储。
+
+原始数据仍是 akshare 拉取后追加写入的 margin_sse.csv / margin_szse.csv。
+首次查询时把 CSV 解析一次：代码统一规范为 6 位字符串，按 (代码, 日期) 排序，
+建立 代码 -> 行区间 的索引，并连同列类型一起持久化为同目录下的 .pkl。
+
+CSV 的 (大小, 修改时间) 作为版本号：版本不变时直接复用进程内缓存或 .pkl，
+版本变化（例如 update_margin_data 追加了新日期）时自动重建。
+"""
+
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app import metrics
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+STOCK_INFO_DIR = os.path.join(BASE_DIR, "stocks_info")
+
+# 交易所 -> (CSV 文件名, 代码列, 日期列)
+EXCHANGES = {
+    "SSE": ("margin_sse.csv", "标的证券代码", "信用交易日期"),
+    "SZSE": ("margin_szse.csv", "证券代码", "日期"),
+}
+
+
+def csv_path(exchange):
+    return os.path.join(STOCK_INFO_DIR, EXCHANGES[exchange][0])
+
+
+def index_path(exchange):
+    return os.path.splitext(csv_path(exchange))[0] + ".pkl"
+
+
+def _csv_version(exchange):
+    try:
+        st = os.stat(csv_path(exchange))
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def normalize_code(code):
+    return str(code).strip().zfill(6)
+
+
+class MarginIndex:
+    """单个交易所的融资融券数据：按代码排序的 DataFrame + 代码到行区间的索引"""
+
+    def __init__(self, exchange, version, frame, offsets):
+        self.exchange = exchange
+        self.version = version
+        self.frame = frame
+        self.offsets = offsets
+
+    @classmethod
+    @metrics.timed(metrics.STORE_DURATION, store="margin", op="build")
+    def build(cls, exchange, version):
+        _, code_col, date_col = EXCHANGES[exchange]
+        df = pd.read_csv(csv_path(exchange), encoding="utf-8-sig")
+        keys = df[code_col].fillna("").astype(str).str.strip().str.zfill(6)
+        df = df.assign(_code=keys).sort_values(["_code", date_col], kind="stable")
+        keys = df.pop("_code").to_numpy()
+        df = df.reset_index(drop=True)
+
+        offsets = {}
+        if len(keys):
+            # 排序后相同代码连续，记录每段的起止行号
+            starts = np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1])
+            ends = np.append(starts[1:], len(keys))
+            offsets = {
+                keys[start]: (int(start), int(end)) for start, end in zip(starts, ends)
+            }
+        return cls(exchange, version, df, offsets)
+
+    def query(self, code):
+        """返回单只股票按日期升序的数据切片，无数据时返回 None"""
+        span = self.offsets.get(normalize_code(code))
+        if span is None:
+            return None
+        return self.frame.iloc[span[0] : span[1]]
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+@metrics.timed(metrics.STORE_DURATION, store="margin", op="load")
+def _load_persisted(exchange, version):
+    path = index_path(exchange)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            persisted = pickle.load(f)
+    except Exception as e:
+        print(f"[融资融券索引] 读取 {path} 失败，将重建：{e}")
+        return None
+    if persisted.get("version") != version:
+        return None
+    return MarginIndex(exchange, version, persisted["frame"], persisted["offsets"])
+
+
+def _persist(index):
+    path = index_path(index.exchange)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(
+            {
+                "version": index.version,
+                "frame": index.frame,
+                "offsets": index.offsets,
+            },
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmp_path, path)
+
+
+def get_index(exchange):
+    """返回交易所的融资融券索引；CSV 不存在时返回 None"""
+    version = _csv_version(exchange)
+    if version is None:
+        return None
+    cached = _cache.get(exchange)
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _lock:
+        cached = _cache.get(exchange)
+        if cached is not None and cached.version == version:
+            return cached
+        index = _load_persisted(exchange, version)
+        if index is None:
+            print(f"[融资融券索引] 重建 {exchange} 索引")
+            index = MarginIndex.build(exchange, version)
+            try:
+                _persist(index)
+            except Exception as e:
+                print(f"[融资融券索引] 保存 {exchange} 索引失败：{e}")
+        _cache[exchange] = index
+        return index
+
+
+def query(exchange, code):
+    """查询单只股票在某交易所的融资融券数据，日期列统一重命名为 date"""
+    index = get_index(exchange)
+    if index is None:
+        return None
+    rows = index.query(code)
+    if rows is None:
+        return None
+    _, _, date_col = EXCHANGES[exchange]
+    return rows.rename(columns={date_col: "date"})
+
+
+def invalidate(exchange=None):
+    """丢弃进程内缓存，下次查询时按版本号重新加载"""
+    with _lock:
+        if exchange is None:
+            _cache.clear()
+        else:
+            _cache.pop(exchange, None)
@@ -0,0 +1,261 @@
+"""
+热点路径的计时与计数，以 Prometheus 文本格式在 /metrics 暴露。
+
+不依赖 prometheus_client，只实现这里用到的 Counter / Histogram：
+- 蓝图上每个路由的处理耗时（按路由规则、方法、状态码）；
+- 每个 akshare 接口的调用耗时（按函数名、成功/失败）；
+- history_cache、融资融券存储的读写耗时（按存储、操作）；
+- 每次低价筛选的耗时和处理的股票数（按引擎：panel / parallel / index）；
+- JSON / NDJSON 响应的序列化耗时。
+
+另有按请求开启的 cProfile：app.config["PROFILING"] 为真时，
+请求带 ?profile=1 或请求头 X-Profile: 1 即返回该请求的 pstats 文本而不是原响应。
+"""
+
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # labels -> [各桶计数, 总和, 次数]
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    labels = _format_labels(self.labelnames, key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def timed(histogram, **labels):
+    """用 histogram 记录被装饰函数每次调用的耗时"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+HTTP_DURATION = Histogram(
+    "smartlowpicker_http_request_duration_seconds",
+    "路由处理耗时（流式响应只计到返回响应对象为止）",
+    ("endpoint", "method", "status"),
+)
+AKSHARE_DURATION = Histogram(
+    "smartlowpicker_akshare_call_duration_seconds",
+    "akshare 接口调用耗时",
+    ("function", "outcome"),
+)
+STORE_DURATION = Histogram(
+    "smartlowpicker_store_io_duration_seconds",
+    "本地存储读写耗时",
+    ("store", "op"),
+)
+SCREENING_DURATION = Histogram(
+    "smartlowpicker_screening_duration_seconds",
+    "单次低价筛选耗时",
+    ("engine",),
+)
+SCREENING_CODES = Counter(
+    "smartlowpicker_screening_codes_total",
+    "低价筛选处理的股票数",
+    ("engine",),
+)
+SERIALIZATION_DURATION = Histogram(
+    "smartlowpicker_serialization_duration_seconds",
+    "响应序列化耗时",
+    ("format",),
+)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _wrap_akshare(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = func(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            AKSHARE_DURATION.observe(
+                time.perf_counter() - started, function=name, outcome=outcome
+            )
+
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+
+def instrument_akshare():
+    """
+    给 akshare 模块上的公开函数套一层计时。
+    各模块都在调用时才通过 ak.xxx 取函数，所以替换模块属性即可覆盖所有调用；可重复调用。
+    """
+    import akshare as ak
+
+    wrapped = 0
+    for name in dir(ak):
+        func = getattr(ak, name)
+        if name.startswith("_") or getattr(func, "__metrics_wrapped__", False):
+            continue
+        if inspect.isfunction(func) or inspect.ismethod(func):
+            setattr(ak, name, _wrap_akshare(name, func))
+            wrapped += 1
+    return wrapped
+
+
+def _profiling_requested(app):
+    return app.config.get("PROFILING") and (
+        request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+    )
+
+
+def init_app(app):
+    """注册请求计时和按请求 profiling 的钩子"""
+    app.config.setdefault("PROFILING", False)
+    app.config.setdefault("PROFILE_LIMIT", 40)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        if _profiling_requested(app):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request(response):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            out = io.StringIO()
+            stats = pstats.Stats(profiler, stream=out).sort_stats("cumulative")
+            stats.print_stats(app.config["PROFILE_LIMIT"])
+            response = Response(out.getvalue(), mimetype="text/plain")
+
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+            HTTP_DURATION.observe(
+                time.perf_counter() - started,
+                endpoint=rule,
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
@@ -1,7 +1,33 @@
+import json
+import os
+import threading
+
 import akshare as ak
-from flask import jsonify, request
-import pandas as pd
 import numpy as np
+import pandas as pd
+from flask import jsonify, request
+
+from app import board_matrix, history_store, jobs, sync_manifest
+from app.cache import cached
+from app.routes.stocks_analyse import (
+    STOCK_INFO_DIR,
+    get_code_name_map,
+    load_screening_state,
+    low_price_path,
+    start_job_response,
+    universe_window_stats,
+)
+from app.serialization import Frame, json_response, response_format
+
+
+@cached("industry_boards", ttl=600, maxsize=4, persist=True)
+def fetch_industry_boards():
+    return ak.stock_board_industry_name_em()
+
+
+@cached("industry_board_members", ttl=300, maxsize=512, persist=True)
+def fetch_industry_board_members(board_name):
+    return ak.stock_board_industry_cons_em(symbol=board_name)
 
 
 def get_boards_api():
@@ -9,28 +35,14 @@ def get_boards_api():
     获取所有行业板块信息
     """
     try:
-        df = ak.stock_board_industry_name_em()
-        return jsonify(
-            {"code": 0, "data": df.to_dict(orient="records"), "message": "获取成功"}
+        df = fetch_industry_boards()
+        return json_response(
+            {"code": 0, "data": Frame(df, response_format()), "message": "获取成功"}
         )
     except Exception as e:
         return jsonify({"error": str(e), "message": "获取所有行业板块信息失败"}), 500
 
 
-# 将不可序列化类型统一转换
-def normalize(x):
-    if isinstance(x, (np.generic, np.number)):
-        return x.item()
-    elif isinstance(x, (pd.Timestamp, pd.Timedelta)):
-        return str(x)
-    elif isinstance(x, (list, dict, tuple)):
-        return x
-    elif x is None:
-        return None
-    else:
-        return str(x)
-
-
 def get_board_members_api():
     """
     获取某行业板块的成分股信息
@@ -45,20 +57,16 @@ def get_board_members_api():
         if not boardName:
             return jsonify({"error": "缺少参数: boardName"}), 400
 
-        df = ak.stock_board_industry_cons_em(symbol=boardName)
-        print(f"成分股的类型：{type(df)}")
-        df = df.applymap(normalize)
-        data = df.to_dict(orient="records")
-        response = jsonify(
+        df = fetch_industry_board_members(boardName)
+        # 由 pandas 直接编码，NaN 输出为 null，时间类型输出为 ISO 字符串
+        return json_response(
             {
                 "code": 0,
                 "board": boardName,
-                "data": data,
+                "data": Frame(df, response_format()),
                 "message": "获取成功",
             }
         )
-        print(f"获取成功: {type(response)}")
-        return response
     except Exception as e:
         return (
             jsonify({"error": str(e), "message": "获取某行业板块的成分股信息失败"}),
@@ -66,12 +74,27 @@ def get_board_members_api():
         )
 
 
+@cached("concept_boards", ttl=600, maxsize=4, persist=True)
+def fetch_concept_boards():
+    return ak.stock_board_concept_name_em()
+
+
+@cached("concept_board_members", ttl=300, maxsize=512, persist=True)
+def fetch_concept_board_members(concept_name):
+    return ak.stock_board_concept_cons_em(symbol=concept_name)
+
+
 def get_concepts_api():
     """
     获取所有概念板块信息
     """
-    df = ak.stock_board_concept_name_em()
-    return jsonify(df.to_dict(orient="records"))
+    try:
+        df = fetch_concept_boards()
+        return json_response(
+            {"code": 0, "data": Frame(df, response_format()), "message": "获取成功"}
+        )
+    except Exception as e:
+        return jsonify({"error": str(e), "message": "获取所有概念板块信息失败"}), 500
 
 
 def get_concept_members_api():
@@ -84,11 +107,326 @@ def get_concept_members_api():
         concept_name = (
             request.json.get("concept_name")
             if request.is_json
-            else request.form.get("code")
+            else request.form.get("concept_name")
         )
 
     if not concept_name:
         return jsonify({"error": "缺少参数: concept_name"}), 400
 
-    df = ak.stock_board_concept_cons_em(symbol=concept_name)
-    return jsonify({"concept": concept_name, "data": df.to_dict(orient="records")})
+    try:
+        df = fetch_concept_board_members(concept_name)
+        return json_response(
+            {
+                "code": 0,
+                "concept": concept_name,
+                "data": Frame(df, response_format()),
+                "message": "获取成功",
+            }
+        )
+    except Exception as e:
+        return (
+            jsonify({"error": str(e), "message": "获取某概念板块的成分股信息失败"}),
+            500,
+        )
+
+
+def request_data():
+    """GET 取查询参数，其余取 JSON 请求体"""
+    if request.method == "GET":
+        data = request.args.to_dict()
+        if "codes" in request.args:
+            data["codes"] = request.args.getlist("codes")
+        return data
+    return request.get_json(silent=True) or {}
+
+
+def no_matrix_response():
+    return (
+        jsonify(
+            {"code": 1, "message": "板块隶属矩阵尚未建立，请先调用 /boards/refresh"}
+        ),
+        404,
+    )
+
+
+def refresh_board_matrix_api():
+    """
+    POST JSON:
+    {
+        "kinds": ["industry", "concept"],  # 刷新哪些类型的板块（可选）
+        "max_workers": 8,  # 并发拉取数（可选）
+        "background": false  # 为 true 时作为后台任务运行，立即返回 job_id（可选）
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    kinds = data.get("kinds") or list(board_matrix.KINDS)
+    try:
+        max_workers = int(data.get("max_workers", 8))
+        if max_workers <= 0 or not set(kinds) <= set(board_matrix.KINDS):
+            raise ValueError
+    except Exception:
+        return (
+            jsonify(
+                {
+                    "code": 1,
+                    "message": f"参数错误：kinds 应为 {list(board_matrix.KINDS)} 的子集，max_workers 应为正整数",
+                }
+            ),
+            400,
+        )
+
+    params = {"kinds": kinds, "max_workers": max_workers}
+    if data.get("background"):
+        return start_job_response("board_refresh", params)
+
+    try:
+        result = board_matrix.refresh(tuple(kinds), max_workers=max_workers)
+    except Exception as e:
+        return jsonify({"code": -1, "message": f"刷新板块隶属矩阵失败：{e}"}), 500
+    return jsonify(
+        {"code": 0, "message": f"刷新完成，耗时 {result['elapsed']} 秒", "data": result}
+    )
+
+
+@jobs.job_type("board_refresh")
+def run_board_refresh_job(job, token):
+    """板块隶属矩阵刷新任务：矩阵整体替换，续跑即重新运行"""
+
+    def on_progress(done, total):
+        job.update(
+            progress=done, total=total, message=f"已拉取 {done} / {total} 个板块"
+        )
+        job.save()
+
+    return board_matrix.refresh(
+        tuple(job.params.get("kinds") or board_matrix.KINDS),
+        max_workers=int(job.params.get("max_workers", 8)),
+        should_stop=token,
+        on_progress=on_progress,
+    )
+
+
+def get_board_matrix_api():
+    """板块隶属矩阵的概况：板块数、股票数、隶属关系数、建立时间和失败的板块"""
+    matrix = board_matrix.get_matrix()
+    if matrix is None:
+        return no_matrix_response()
+    return jsonify({"code": 0, "data": matrix.stats(), "message": "获取成功"})
+
+
+def get_code_boards_api():
+    """
+    反查股票所属的行业 / 概念板块。
+    参数 code（单只）或 codes（多只），可选 kind 只返回某类板块。
+    """
+    data = request_data()
+    codes = data.get("codes") or ([data["code"]] if data.get("code") else [])
+    kind = data.get("kind")
+    if not codes:
+        return jsonify({"error": "缺少参数: code"}), 400
+
+    matrix = board_matrix.get_matrix()
+    if matrix is None:
+        return no_matrix_response()
+
+    result = {}
+    for code in codes:
+        code = board_matrix.normalize_code(code)
+        boards = [matrix.board_info(i) for i in matrix.boards_of(code)]
+        result[code] = [b for b in boards if kind is None or b["kind"] == kind]
+
+    if len(codes) == 1 and "codes" not in data:
+        code = board_matrix.normalize_code(codes[0])
+        return jsonify(
+            {
+                "code": 0,
+                "data": {"code": code, "boards": result[code]},
+                "message": "获取成功",
+            }
+        )
+    return jsonify({"code": 0, "data": result, "message": "获取成功"})
+
+
+def query_boards_api():
+    """
+    板块成分股的集合运算，可再与低价筛选结果取交集。
+    POST JSON:
+    {
+        "boards": ["银行", {"kind": "concept", "name": "..."}, "BK0475"],  # 名称、板块代码或 {kind, name}
+        "op": "and",  # and（交集）/ or（并集）/ diff（第一个板块去掉其余板块）
+        "days": 180  # 可选：只保留 low_price_stocks_{days}.csv 中的股票
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    specs = data.get("boards") or []
+    op = data.get("op", "and")
+    if not specs or op not in board_matrix.SET_OPS:
+        return (
+            jsonify(
+                {
+                    "code": 1,
+                    "message": f"参数错误：boards 不能为空，op 应为 {list(board_matrix.SET_OPS)} 之一",
+                }
+            ),
+            400,
+        )
+
+    matrix = board_matrix.get_matrix()
+    if matrix is None:
+        return no_matrix_response()
+
+    rows, missing = [], []
+    for spec in specs:
+        if isinstance(spec, dict):
+            i = matrix.board_index(spec.get("name"), spec.get("kind"))
+        else:
+            i = matrix.board_index(str(spec))
+        (missing if i is None else rows).append(spec if i is None else i)
+    if missing:
+        return jsonify({"code": 1, "message": f"找不到板块：{missing}"}), 404
+
+    positions = matrix.combine(rows, op)
+    payload = {
+        "boards": [matrix.board_info(i) for i in rows],
+        "op": op,
+    }
+
+    days = data.get("days")
+    if days is not None:
+        path = low_price_path(int(days))
+        if not os.path.exists(path):
+            return (
+                jsonify({"code": 1, "message": f"不存在 {days} 天的分析数据文件"}),
+                404,
+            )
+        df = pd.read_csv(path, dtype={"股票代码": str})
+        hits = matrix.code_positions(df["股票代码"])
+        positions = np.intersect1d(positions, hits, assume_unique=True)
+        df = df[df["股票代码"].isin(matrix.codes[positions])]
+        payload.update(
+            days=int(days), count=len(df), stocks=Frame(df, response_format())
+        )
+    else:
+        codes = matrix.codes[positions].tolist()
+        name_map = get_code_name_map()
+        payload.update(
+            count=len(codes),
+            stocks=[
+                {"股票代码": code, "股票名称": name_map.get(code, "未知名称")}
+                for code in codes
+            ],
+        )
+    return json_response({"code": 0, "data": payload, "message": "查询成功"})
+
+
+def sector_cache_path(days):
+    return os.path.join(STOCK_INFO_DIR, f"low_price_sectors_{days}.json")
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def build_sector_summary(days, kind, matrix, adjust=""):
+    """
+    把 low_price_stocks_{days}.csv 与板块隶属矩阵关联，按板块统计低价股数、占比和距低点中位数。
+    距低点的中位数基于全市场所有成分股（不只是低价股）的窗口统计量，
+    复权方式 adjust 与生成结果文件时的筛选一致。
+    """
+    hits = pd.read_csv(low_price_path(days), dtype={"股票代码": str})["股票代码"]
+    codes = history_store.list_codes()
+    stats = universe_window_stats(codes, days, adjust)
+    summary = matrix.summarize(codes, stats["distance"], hits)
+
+    boards = pd.DataFrame(matrix.boards, columns=["类型", "板块名称", "板块代码"])
+    df = boards.assign(
+        成分股数=summary["size"],
+        有数据=summary["with_data"],
+        低价股数=summary["low"],
+        低价占比=np.round(summary["low"] / np.maximum(summary["size"], 1), 4),
+        距低点中位数=np.round(summary["median_distance"] * 100, 2),
+    )
+    df = df[df["类型"] == kind].drop(columns="类型")
+    return df.sort_values(
+        ["低价占比", "低价股数"], ascending=False, kind="stable", ignore_index=True
+    )
+
+
+def get_low_price_sectors_api():
+    """
+    板块维度的低价筛选结果：每个板块的成分股数、低价股数、低价占比、距低点中位数（%）。
+    参数 days（默认 180）、kind（industry / concept，默认 industry）、refresh（为真时忽略缓存）。
+    结果按 (结果文件, 隶属矩阵) 的文件戳、同步清单的变更序号和筛选时的复权方式
+    缓存在 low_price_sectors_{days}.json；同步后距低点中位数随之重算。
+    """
+    data = request_data()
+    try:
+        days = int(data.get("days", 180))
+    except (TypeError, ValueError):
+        return jsonify({"code": 1, "message": "参数 days 应为整数"}), 400
+    kind = data.get("kind", "industry")
+    if kind not in board_matrix.KINDS:
+        return (
+            jsonify(
+                {
+                    "code": 1,
+                    "message": f"参数 kind 应为 {list(board_matrix.KINDS)} 之一",
+                }
+            ),
+            400,
+        )
+
+    path = low_price_path(days)
+    if not os.path.exists(path):
+        return jsonify({"code": 1, "message": f"不存在 {days} 天的分析数据文件"}), 404
+    matrix = board_matrix.get_matrix()
+    if matrix is None:
+        return no_matrix_response()
+
+    state = load_screening_state().get(str(days)) or {}
+    adjust = state.get("adjust", "")
+    try:
+        version = [
+            _file_stamp(path),
+            _file_stamp(board_matrix.MATRIX_PATH),
+            sync_manifest.get_manifest().seq,
+            adjust,
+        ]
+        cache_path = sector_cache_path(days)
+        cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        entry = cache.get(kind)
+        refresh = str(data.get("refresh", "")).lower() in ("1", "true")
+        if refresh or entry is None or entry["version"] != version:
+            df = build_sector_summary(days, kind, matrix, adjust)
+            # JSON 中 NaN 写作 null，读回来仍是缺失值
+            entry = {
+                "version": version,
+                "columns": list(df.columns),
+                "rows": json.loads(df.to_json(orient="values", force_ascii=False)),
+            }
+            cache[kind] = entry
+            # 多进程、多线程可能同时重建缓存，各自写独立的临时文件再原子替换
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        df = pd.DataFrame(entry["rows"], columns=entry["columns"])
+    except Exception as e:
+        return jsonify({"code": -1, "message": f"板块汇总失败：{e}"}), 500
+
+    return json_response(
+        {
+            "code": 0,
+            "message": "获取成功",
+            "days": days,
+            "kind": kind,
+            "threshold": state.get("threshold"),
+            "adjust": adjust,
+            "count": len(df),
+            "data": Frame(df, response_format()),
+        }
+    )
@@ -7,6 +7,9 @@ from app.routes.stocks_info import (
     async_all_stock_start_api,
     all_stock_async_stop_api,
     check_async_all_status_api,
+    daily_append_sync_api,
+    stock_history_api,
+    refresh_adjust_factors_api,
 )
 
 from app.routes.stocks_analyse import (
@@ -22,9 +25,31 @@ from app.routes.stocks_analyse import (
     query_margin_data_by_code_api,
     query_latest_main_stock_holder_api,
     get_margin_stocks_api,
+    publish_shared_panel_api,
+    get_shared_panel_api,
 )
 
-from app.routes.boards_info import get_boards_api, get_board_members_api
+from app.routes.boards_info import (
+    get_boards_api,
+    get_board_members_api,
+    get_concepts_api,
+    get_concept_members_api,
+    refresh_board_matrix_api,
+    get_board_matrix_api,
+    get_code_boards_api,
+    query_boards_api,
+    get_low_price_sectors_api,
+)
+
+from app.routes.system_info import (
+    get_cache_stats_api,
+    get_metrics_api,
+    list_jobs_api,
+    get_job_api,
+    start_job_api,
+    cancel_job_api,
+    resume_job_api,
+)
 
 
 main = Blueprint("main", __name__)
@@ -74,6 +99,23 @@ def all_stock_async_stop():
     return all_stock_async_stop_api()
 
 
+# 每日快照增量同步
+@main.route("/sync/daily-append", methods=["POST"])
+def daily_append_sync():
+    return daily_append_sync_api()
+
+
+# 单只股票日线（adjust=none / qfq / hfq，读取时按复权因子换算）
+@main.route("/stocks/history", methods=["GET", "POST"])
+def get_stock_history():
+    return stock_history_api()
+
+
+@main.route("/adjust-factors/refresh", methods=["POST"])
+def refresh_adjust_factors():
+    return refresh_adjust_factors_api()
+
+
 @main.route("/history_cache_count", methods=["POST", "GET"])
 def get_history_cache_count():
     return get_history_cache_count_api()
@@ -89,6 +131,17 @@ def analyze_batch():
     return analyze_batch_api()
 
 
+# 多进程共享的只读价格面板
+@main.route("/panel/publish", methods=["POST"])
+def publish_shared_panel():
+    return publish_shared_panel_api()
+
+
+@main.route("/panel", methods=["GET"])
+def get_shared_panel():
+    return get_shared_panel_api()
+
+
 @main.route("/analyze_batch_data", methods=["POST"])
 def analyze_batch_data():
     return get_analyze_batch_data_api()
@@ -140,4 +193,74 @@ def get_board_members():
     return get_board_members_api()
 
 
+@main.route("/concepts", methods=["GET"])
+def get_concepts():
+    return get_concepts_api()
+
+
+@main.route("/get_concept_members", methods=["GET", "POST"])
+def get_concept_members():
+    return get_concept_members_api()
+
+
+@main.route("/boards/refresh", methods=["POST"])
+def refresh_board_matrix():
+    return refresh_board_matrix_api()
+
+
+@main.route("/boards/matrix", methods=["GET"])
+def get_board_matrix():
+    return get_board_matrix_api()
+
+
+@main.route("/boards/by_code", methods=["GET", "POST"])
+def get_code_boards():
+    return get_code_boards_api()
+
+
+@main.route("/boards/query", methods=["POST"])
+def query_boards():
+    return query_boards_api()
+
+
+@main.route("/low-price-sectors", methods=["GET", "POST"])
+def get_low_price_sectors():
+    return get_low_price_sectors_api()
+
+
 # 板块信息 end
+
+
+@main.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    return get_cache_stats_api()
+
+
+@main.route("/metrics", methods=["GET"])
+def get_metrics():
+    return get_metrics_api()
+
+
+@main.route("/jobs", methods=["GET"])
+def list_jobs():
+    return list_jobs_api()
+
+
+@main.route("/jobs/start", methods=["POST"])
+def start_job():
+    return start_job_api()
+
+
+@main.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    return get_job_api(job_id)
+
+
+@main.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    return cancel_job_api(job_id)
+
+
+@main.route("/jobs/<job_id>/resume", methods=["POST"])
+def resume_job(job_id):
+    return resume_job_api(job_id)
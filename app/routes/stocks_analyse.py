@@ -1,115 +1,156 @@
 from flask import request, jsonify
 import pandas as pd
 import os
-from datetime import datetime, timedelta
 import akshare as ak
 import numpy as np
-from pandas.errors import EmptyDataError
 import warnings
+import time
+import json
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app import (
+    adjust_factors,
+    extremes_index,
+    history_store,
+    jobs,
+    margin_store,
+    screener,
+    shared_panel,
+    sync_manifest,
+)
+from app.cache import cached
+from app.serialization import (
+    Frame,
+    file_version,
+    iter_csv_chunks,
+    iter_frame_chunks,
+    json_response,
+    ndjson_response,
+    next_cursor,
+    page_request,
+    read_csv_page,
+    response_format,
+    wants_ndjson,
+)
+from app.trade_calendar import get_calendar
+from app.watchlist import get_watchlist
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
-HISTORY_CACHE_DIR = os.path.join(BASE_DIR, "history_cache")
 STOCK_INFO_DIR = os.path.join(BASE_DIR, "stocks_info")
 LIST_CSV_PATH = os.path.join(BASE_DIR, "stocks_info", "list.csv")
-stock_list_df = pd.read_csv(LIST_CSV_PATH, dtype=str)
-code_name_map = dict(zip(stock_list_df["code"], stock_list_df["name"]))
+
+# 股票代码 -> 名称，首次使用时加载，list.csv 更新后自动重新读取
+_code_name_cache = {"version": None, "map": {}}
+
+
+def get_code_name_map():
+    try:
+        version = os.path.getmtime(LIST_CSV_PATH)
+    except OSError:
+        return _code_name_cache["map"]
+    if _code_name_cache["version"] != version:
+        stock_list_df = pd.read_csv(LIST_CSV_PATH, dtype=str)
+        _code_name_cache["map"] = dict(
+            zip(stock_list_df["code"], stock_list_df["name"])
+        )
+        _code_name_cache["version"] = version
+    return _code_name_cache["map"]
+
 
 MARGIN_FILE_SSE = os.path.join(BASE_DIR, "stocks_info", "margin_sse.csv")
 MARGIN_FILE_SZSE = os.path.join(BASE_DIR, "stocks_info", "margin_szse.csv")
 
-WATCHLIST_FILE = os.path.join(BASE_DIR, "stocks_info", "watched_stocks.csv")
+
+def _watchlist_items(data):
+    """
+    从请求体取出要操作的股票，返回 [(代码, 名称), ...]。
+    支持单只 {"code", "name"}，以及批量 {"codes": [...]} 或 {"stocks": [{"code", "name"}, ...]}
+    """
+    if data.get("stocks"):
+        items = [
+            (str(s.get("code") or "").strip(), s.get("name") or "未知名称")
+            for s in data["stocks"]
+        ]
+    elif data.get("codes"):
+        items = [(str(code).strip(), "未知名称") for code in data["codes"]]
+    else:
+        items = [(str(data.get("code") or "").strip(), data.get("name", "未知名称"))]
+    return [(code, name) for code, name in items if code]
 
 
 def add_to_watchlist_api():
     try:
-        data = request.get_json()
-        code = data.get("code")
-        name = data.get("name", "未知名称")
+        data = request.get_json() or {}
+        items = _watchlist_items(data)
 
-        if not code:
+        if not items:
             return jsonify({"code": 1, "message": "股票代码不能为空"}), 400
 
-        # 如果文件存在且非空才读取
-        if os.path.exists(WATCHLIST_FILE) and os.path.getsize(WATCHLIST_FILE) > 0:
-            df = pd.read_csv(WATCHLIST_FILE, dtype=str)
-        else:
-            df = pd.DataFrame(columns=["股票代码", "股票名称"])
+        added, existing = get_watchlist().add(items)
 
-        # 检查是否已存在
-        if not df[df["股票代码"] == code].empty:
-            return jsonify({"code": 0, "message": f"{code} 已在关注列表中"})
+        if len(items) == 1:
+            code = items[0][0]
+            if existing:
+                return jsonify({"code": 0, "message": f"{code} 已在关注列表中"})
+            return jsonify({"code": 0, "message": f"已添加 {code} 到关注列表"})
 
-        # 添加
-        new_row = pd.DataFrame([[code, name]], columns=["股票代码", "股票名称"])
-        df = pd.concat([df, new_row], ignore_index=True)
-        df.to_csv(WATCHLIST_FILE, index=False, encoding="utf-8-sig")
-
-        return jsonify({"code": 0, "message": f"已添加 {code} 到关注列表"})
+        return jsonify(
+            {
+                "code": 0,
+                "message": f"已添加 {len(added)} 只到关注列表，{len(existing)} 只已在列表中",
+                "data": {"added": added, "existing": existing},
+            }
+        )
     except Exception as e:
         return jsonify({"code": -1, "message": f"添加失败: {str(e)}"}), 500
 
 
 def remove_to_watchlist_api():
     try:
-        data = request.get_json()
-        code = data.get("code")
+        data = request.get_json() or {}
+        codes = [code for code, _ in _watchlist_items(data)]
 
-        if not code:
+        if not codes:
             return jsonify({"code": 1, "message": "股票代码不能为空"}), 400
 
-        # 文件不存在或为空
-        if not os.path.exists(WATCHLIST_FILE) or os.path.getsize(WATCHLIST_FILE) == 0:
+        watchlist = get_watchlist()
+        if not len(watchlist):
             return jsonify({"code": 0, "message": "关注列表为空"})
 
-        df = pd.read_csv(WATCHLIST_FILE, dtype=str)
-        before_count = len(df)
-        df = df[df["股票代码"] != code]
-
-        if len(df) == before_count:
-            return jsonify({"code": 0, "message": f"{code} 不在关注列表中"})
+        removed, missing = watchlist.remove(codes)
 
-        df.to_csv(WATCHLIST_FILE, index=False, encoding="utf-8-sig")
+        if len(codes) == 1:
+            code = codes[0]
+            if missing:
+                return jsonify({"code": 0, "message": f"{code} 不在关注列表中"})
+            return jsonify({"code": 0, "message": f"已移除 {code} 从关注列表"})
 
-        return jsonify({"code": 0, "message": f"已移除 {code} 从关注列表"})
+        return jsonify(
+            {
+                "code": 0,
+                "message": f"已移除 {len(removed)} 只，{len(missing)} 只不在关注列表中",
+                "data": {"removed": removed, "missing": missing},
+            }
+        )
     except Exception as e:
         return jsonify({"code": -1, "message": f"移除失败: {str(e)}"}), 500
 
 
 def get_watched_stocks_api():
     try:
-        df = pd.read_csv(WATCHLIST_FILE, dtype=str)
-        if "股票代码" in df.columns and "股票名称" in df.columns:
-            watched_list = (
-                df[["股票代码", "股票名称"]].drop_duplicates().to_dict(orient="records")
-            )
-            return jsonify({"code": 0, "data": watched_list, "message": "获取成功"})
-        else:
-            return []
-    except FileNotFoundError:
-        print("关注股票文件不存在")
-        return jsonify({"code": -1, "message": "关注股票文件不存在"})
+        # 只读内存中的列表，不碰磁盘
+        watched_list = get_watchlist().items()
+        return jsonify({"code": 0, "data": watched_list, "message": "获取成功"})
     except Exception as e:
         print(f"读取关注股票文件出错: {e}")
         return jsonify({"code": -1, "message": "读取关注股票文件出错"})
 
 
-df = ak.tool_trade_date_hist_sina()
-
-# 确保转换为 datetime
-df["trade_date"] = pd.to_datetime(df["trade_date"], errors="coerce")
-
-TRADE_DATES = df["trade_date"].dt.strftime("%Y%m%d").tolist()
-
-
-def get_recent_trade_dates(days=30):
-    today = datetime.now().strftime("%Y%m%d")
-    idx = next((i for i, d in enumerate(TRADE_DATES) if d > today), len(TRADE_DATES))
-    return TRADE_DATES[max(0, idx - days) : idx]
-
-
 def to_native_types(d):
     # 递归把numpy类型转成普通python类型
     if isinstance(d, dict):
@@ -178,114 +219,212 @@ def analyze_margin_data_sse(code: str):
     return to_native_types(analysis)
 
 
-def update_market_file(
-    market: str, file_path: str, date_col: str, ak_fetch_func, dates
-):
+# 交易所 -> (CSV 路径, 日期列, akshare 获取函数名)
+MARGIN_MARKETS = {
+    "SSE": (MARGIN_FILE_SSE, "信用交易日期", "stock_margin_detail_sse"),
+    "SZSE": (MARGIN_FILE_SZSE, "日期", "stock_margin_detail_szse"),
+}
+
+
+def margin_trade_dates(days):
     """
-    更新某个市场的融资融券数据（全量模式，不按 code 过滤）。
-    market: "SSE" or "SZSE"
-    file_path: CSV 文件路径
-    date_col: 日期列名 (SSE="信用交易日期", SZSE="日期")
-    ak_fetch_func: akshare 数据获取函数
-    dates: 要更新的交易日列表
+    最近 days 个已经可以拉取融资融券明细的交易日，升序。
+    交易所在下一个交易日才公布当日明细，所以截止到今天之前的最后一个交易日，
+    避免每次都去请求今天（或周末、节假日）这种必然为空的日期。
     """
-    # 读取已有文件
-    if os.path.exists(file_path):
-        existing_df = pd.read_csv(file_path, encoding="utf-8-sig", dtype=str)
-    else:
-        existing_df = pd.DataFrame()
+    calendar = get_calendar()
+    until = calendar.previous_trading_day(datetime.now())
+    return calendar.last_n(days, until=until) if until else []
 
-    existing_dates = (
-        set(existing_df[date_col].astype(str).unique())
-        if not existing_df.empty
-        else set()
-    )
 
-    added_rows = 0
-    skipped_dates = []
-    updated_dates = []
-    new_dfs = []
+def existing_margin_dates(market: str):
+    """返回本地已有的交易日集合，复用按代码索引的融资融券存储，不重复解析 CSV"""
+    index = margin_store.get_index(market)
+    if index is None or index.frame.empty:
+        return set()
+    date_col = MARGIN_MARKETS[market][1]
+    return set(index.frame[date_col].astype(str).unique())
 
-    for date_str in dates:
-        if date_str in existing_dates:
-            print(f"[{market}] {date_str} 已存在，跳过")
-            skipped_dates.append(date_str)
-            continue
 
-        try:
-            print(f"[{market}] 获取 {date_str} 数据中...")
-            df = ak_fetch_func(date=date_str)
-            if not df.empty:
-                df[date_col] = date_str
-                new_dfs.append(df)
-                updated_dates.append(date_str)
-        except Exception as e:
-            print(f"[{market}] {date_str} 拉取失败: {e}")
-
-    if new_dfs:
-        new_data = pd.concat(new_dfs, ignore_index=True)
-        final_df = (
-            pd.concat([existing_df, new_data], ignore_index=True)
-            if not existing_df.empty
-            else new_data
+def fetch_margin_date(market: str, date_str: str):
+    """拉取单个交易所单个交易日的融资融券明细，返回 (DataFrame 或 None, 错误, 耗时)"""
+    _, date_col, func_name = MARGIN_MARKETS[market]
+    started = time.perf_counter()
+    try:
+        print(f"[{market}] 获取 {date_str} 数据中...")
+        df = getattr(ak, func_name)(date=date_str)
+        if df is not None and not df.empty:
+            df[date_col] = date_str
+        return df, None, time.perf_counter() - started
+    except Exception as e:
+        print(f"[{market}] {date_str} 拉取失败: {e}")
+        return None, e, time.perf_counter() - started
+
+
+def append_market_file(file_path: str, new_dfs):
+    """
+    把新日期的数据追加到 CSV 末尾，不重写已有历史。
+    列顺序对齐已有表头；文件不存在时带表头新建。
+    """
+    new_data = pd.concat(new_dfs, ignore_index=True)
+    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        header = pd.read_csv(file_path, encoding="utf-8-sig", nrows=0).columns
+        extra = [c for c in new_data.columns if c not in header]
+        if extra:
+            print(f"[融资融券] {os.path.basename(file_path)} 忽略新增列: {extra}")
+        # 追加模式下不能用 utf-8-sig，否则会在文件中间再写一个 BOM
+        new_data.reindex(columns=header).to_csv(
+            file_path, mode="a", header=False, index=False, encoding="utf-8"
         )
-        final_df.to_csv(file_path, index=False, encoding="utf-8-sig")
-        added_rows = len(new_data)
-        print(f"[{market}] 已更新 {added_rows} 行数据")
     else:
-        print(f"[{market}] 无需更新")
+        new_data.to_csv(file_path, index=False, encoding="utf-8-sig")
+    return len(new_data)
 
-    return {
-        "added_rows": added_rows,
-        "updated_dates": updated_dates,
-        "skipped_dates": skipped_dates,
-    }
+
+def refresh_margin_data(
+    dates, markets=("SSE", "SZSE"), max_workers=4, should_stop=None, on_progress=None
+):
+    """
+    并发拉取所有缺失的 (交易所, 交易日)，并发数不超过 max_workers；
+    每个交易所的新数据按日期升序一次性追加到 CSV。返回每个交易所的结果和逐日耗时。
+    should_stop() 为真时取消尚未开始的拉取，已拉到的数据照常追加（CSV 本身即断点）；
+    on_progress(done, total) 在每个日期完成后回调。
+    """
+    results = {}
+    tasks = []
+    for market in markets:
+        existing_dates = existing_margin_dates(market)
+        skipped = [d for d in dates if d in existing_dates]
+        for d in skipped:
+            print(f"[{market}] {d} 已存在，跳过")
+        results[market] = {
+            "added_rows": 0,
+            "updated_dates": [],
+            "skipped_dates": skipped,
+            "failed_dates": [],
+            "timings": {},
+        }
+        tasks += [(market, d) for d in dates if d not in existing_dates]
+
+    fetched = {market: {} for market in markets}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(fetch_margin_date, market, d): (market, d)
+            for market, d in tasks
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            if should_stop is not None and should_stop():
+                executor.shutdown(cancel_futures=True)
+                print("[融资融券] 检测到停止信号，取消剩余拉取")
+                break
+            market, d = futures[future]
+            df, error, elapsed = future.result()
+            if on_progress is not None:
+                on_progress(done, len(tasks))
+            results[market]["timings"][d] = round(elapsed, 3)
+            if error is not None:
+                results[market]["failed_dates"].append(d)
+            elif df is not None and not df.empty:
+                fetched[market][d] = df
+
+    for market in markets:
+        result = results[market]
+        new_dates = sorted(fetched[market])
+        result["failed_dates"].sort()
+        result["timings"] = dict(sorted(result["timings"].items()))
+        if new_dates:
+            file_path = MARGIN_MARKETS[market][0]
+            result["added_rows"] = append_market_file(
+                file_path, [fetched[market][d] for d in new_dates]
+            )
+            result["updated_dates"] = new_dates
+            print(f"[{market}] 已追加 {result['added_rows']} 行数据")
+        else:
+            print(f"[{market}] 无需更新")
+    return results
 
 
 def update_margin_data_api():
     """
     POST JSON:
     {
-        "days": 30  # 最近 N 个交易日（必填）
+        "days": 30,  # 最近 N 个交易日（必填）
+        "max_workers": 4,  # 并发拉取数（可选）
+        "background": false  # 为 true 时作为后台任务运行，立即返回 job_id（可选）
     }
     """
     data = request.get_json(silent=True) or {}
     try:
         days = int(data.get("days", 30))
-        if days <= 0:
+        max_workers = int(data.get("max_workers", 4))
+        if days <= 0 or max_workers <= 0:
             raise ValueError
     except Exception:
-        return jsonify({"code": 1, "message": "参数 days 错误，应为正整数"}), 400
+        return (
+            jsonify(
+                {"code": 1, "message": "参数 days 或 max_workers 错误，应为正整数"}
+            ),
+            400,
+        )
+
+    if data.get("background"):
+        return start_job_response(
+            "margin_refresh", {"days": days, "max_workers": max_workers}
+        )
 
     try:
-        dates = get_recent_trade_dates(days)  # 升序交易日列表
+        dates = margin_trade_dates(days)  # 升序交易日列表
     except Exception as e:
         return jsonify({"code": 1, "message": f"获取交易日失败: {e}"}), 500
 
-    sse_result = update_market_file(
-        "SSE", MARGIN_FILE_SSE, "信用交易日期", ak.stock_margin_detail_sse, dates
-    )
-    szse_result = update_market_file(
-        "SZSE", MARGIN_FILE_SZSE, "日期", ak.stock_margin_detail_szse, dates
-    )
+    started = time.perf_counter()
+    result = refresh_margin_data(dates, max_workers=max_workers)
 
     return (
         jsonify(
             {
                 "code": 0,
-                "message": "更新完成",
-                "data": {"SSE": sse_result, "SZSE": szse_result},
+                "message": f"更新完成，耗时 {time.perf_counter() - started:.2f} 秒",
+                "data": result,
             }
         ),
         200,
     )
 
 
+@jobs.job_type("margin_refresh")
+def run_margin_refresh_job(job, token):
+    """融资融券刷新任务：已追加的日期会被自动跳过，续跑即重新运行"""
+    dates = margin_trade_dates(int(job.params.get("days", 30)))
+
+    def on_progress(done, total):
+        job.update(progress=done, total=total, message=f"已拉取 {done} / {total}")
+        job.save()
+
+    return refresh_margin_data(
+        dates,
+        max_workers=int(job.params.get("max_workers", 4)),
+        should_stop=token,
+        on_progress=on_progress,
+    )
+
+
+def start_job_response(type, params):
+    """启动后台任务并返回 job_id；同类型任务已在运行时返回 400"""
+    try:
+        job = jobs.get_manager().start(type, params)
+    except RuntimeError as e:
+        return jsonify({"code": 1, "message": str(e)}), 400
+    return jsonify({"code": 0, "message": "任务已启动", "job_id": job.job_id})
+
+
 def query_margin_data_by_code_api():
     """
     查询单只股票的融资融券数据（从本地文件中读取）。
     优先从上交所文件查找，再查深交所文件，合并结果返回。
     日期字段统一为 date，按日期升序排序。
+    传 limit（可选 cursor）时按 SSE、SZSE 的先后顺序游标分页；
+    format=ndjson 时逐块流式输出，每行额外带 exchange 字段。
     """
     data = request.get_json()
     code = data.get("code", "").strip()
@@ -293,63 +432,73 @@ def query_margin_data_by_code_api():
     if not code:
         return jsonify({"code": 1, "message": "缺少股票代码参数", "data": []}), 400
 
-    result = []
+    code = margin_store.normalize_code(code)
+    fmt = response_format()
+    frames = []
 
-    # 查 SSE
-    if os.path.exists(MARGIN_FILE_SSE):
+    # 先查 SSE 再查 SZSE，均走按代码索引的本地存储
+    for exchange in ("SSE", "SZSE"):
         try:
-            df_sse = pd.read_csv(MARGIN_FILE_SSE, encoding="utf-8-sig")
-            if "标的证券代码" in df_sse.columns:
-                # 确保code是字符串且去空格
-                code = str(code).strip().zfill(6)
-                codes_series = (
-                    df_sse["标的证券代码"]
-                    .fillna("")
-                    .astype(str)
-                    .str.strip()
-                    .str.zfill(6)
-                )
-                filtered = df_sse[codes_series == code]
-                if not filtered.empty:
-                    # 统一日期字段
-                    filtered.rename(columns={"信用交易日期": "date"}, inplace=True)
-                    filtered.sort_values("date", inplace=True)
-                    result.append(
-                        {"exchange": "SSE", "data": filtered.to_dict(orient="records")}
-                    )
+            filtered = margin_store.query(exchange, code)
+            if filtered is not None and not filtered.empty:
+                frames.append((exchange, filtered))
         except Exception as e:
-            print(f"[query_margin_data] 读取 SSE 文件异常: {e}")
+            print(f"[query_margin_data] 读取 {exchange} 数据异常: {e}")
 
-    # 查 SZSE
-    if os.path.exists(MARGIN_FILE_SZSE):
-        try:
-            df_szse = pd.read_csv(MARGIN_FILE_SZSE, encoding="utf-8-sig")
-            if "证券代码" in df_szse.columns:
-                # 确保code是字符串且去空格
-                code = str(code).strip().zfill(6)
-
-                # 处理证券代码列：填充缺失，转字符串，去空格，补齐6位
-                codes_series = (
-                    df_szse["证券代码"].fillna("").astype(str).str.strip().str.zfill(6)
-                )
-
-                # 过滤匹配行
-                filtered = df_szse[codes_series == code]
-                if not filtered.empty:
-                    filtered.rename(columns={"日期": "date"}, inplace=True)
-                    filtered.sort_values("date", inplace=True)
-                    result.append(
-                        {"exchange": "SZSE", "data": filtered.to_dict(orient="records")}
-                    )
-        except Exception as e:
-            print(f"[query_margin_data] 读取 SZSE 文件异常: {e}")
-
-    if not result:
+    if not frames:
         return jsonify(
             {"code": 1, "message": f"股票代码 {code} 未查询到融资融券数据", "data": []}
         )
 
-    return jsonify({"code": 0, "message": "查询成功", "data": result})
+    if wants_ndjson():
+        return ndjson_response(
+            chunk.assign(exchange=exchange)
+            for exchange, filtered in frames
+            for chunk in iter_frame_chunks(filtered)
+        )
+
+    version = "|".join(
+        f"{exchange}:{margin_store.get_index(exchange).version}"
+        for exchange, _ in frames
+    )
+    try:
+        page = page_request(version)
+    except ValueError as e:
+        return jsonify({"code": 1, "message": str(e), "data": []}), 400
+
+    if page is None:
+        result = [
+            {"exchange": exchange, "data": Frame(filtered, fmt)}
+            for exchange, filtered in frames
+        ]
+        return json_response({"code": 0, "message": "查询成功", "data": result})
+
+    # 把两个交易所的数据视为按顺序拼接的一个序列，取 [offset, offset + limit)
+    offset, limit = page
+    result, skip, remaining = [], offset, limit
+    for exchange, filtered in frames:
+        rows = filtered.iloc[skip : skip + remaining]
+        skip = max(0, skip - len(filtered))
+        if not rows.empty:
+            result.append((exchange, rows))
+            remaining -= len(rows)
+    total = sum(len(filtered) for _, filtered in frames)
+    return json_response(
+        {
+            "code": 0,
+            "message": "查询成功",
+            "next_cursor": next_cursor(offset, limit, offset + limit < total, version),
+            "data": [
+                {"exchange": exchange, "data": Frame(rows, fmt)}
+                for exchange, rows in result
+            ],
+        }
+    )
+
+
+@cached("main_stock_holder", ttl=6 * 3600, maxsize=1024, persist=True)
+def fetch_main_stock_holder(code):
+    return ak.stock_main_stock_holder(stock=code)
 
 
 def query_latest_main_stock_holder_api():
@@ -367,7 +516,7 @@ def query_latest_main_stock_holder_api():
         code = str(code).zfill(6)
 
         # 获取股东信息
-        df = ak.stock_main_stock_holder(stock=code)
+        df = fetch_main_stock_holder(code).copy()
 
         if df.empty:
             return jsonify(
@@ -410,25 +559,417 @@ def query_latest_main_stock_holder_api():
 
 def get_history_cache_count_api():
     try:
-        files = [f for f in os.listdir(HISTORY_CACHE_DIR) if f.endswith(".csv")]
-        count = len(files)
+        count = len(history_store.list_codes())
         return jsonify({"code": 0, "message": "成功", "count": count})
     except Exception as e:
         return jsonify({"code": -1, "message": f"接口异常：{str(e)}"}), 500
 
 
+def publish_shared_panel_api():
+    """
+    发布新版本的共享价格面板
+    POST JSON: {"background": false}  # 为 true 时作为后台任务运行，立即返回 job_id（可选）
+    其他服务进程在下一次筛选时自动切换到新版本。
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get("background"):
+        return start_job_response("panel_publish", {})
+    try:
+        meta = shared_panel.publish()
+    except Exception as e:
+        return jsonify({"code": -1, "message": f"发布共享面板失败：{e}"}), 500
+    return jsonify(
+        {"code": 0, "message": f"发布完成，耗时 {meta['elapsed']} 秒", "data": meta}
+    )
+
+
+@jobs.job_type("panel_publish")
+def run_panel_publish_job(job, token):
+    """共享面板发布任务：新版本整体替换，续跑即重新运行"""
+    return shared_panel.publish()
+
+
+def get_shared_panel_api():
+    """当前发布的共享面板：版本信息，以及发布后又有变化（筛选时回退读文件）的股票数"""
+    panel = shared_panel.attach()
+    if panel is None:
+        return jsonify({"code": 1, "message": "尚未发布共享面板"}), 404
+    stale = sum(not panel.is_current(code) for code in panel.index)
+    return jsonify(
+        {"code": 0, "message": "成功", "data": {**panel.meta, "stale": stale}}
+    )
+
+
+def parse_windows(data):
+    """
+    从请求参数取出筛选窗口，返回 [(days, threshold), ...]（按 days 去重，保留最后一个）。
+    支持 {"windows": [{"days": 30, "threshold": 1.05}, 90, ...]}、
+    {"days": [30, 90], "threshold": 1.05 或 [1.05, 1.1]}，以及原来的单个 days / threshold。
+    """
+    default_threshold = data.get("threshold", 1.05)
+    if data.get("windows"):
+        windows = [
+            (
+                (w.get("days"), w.get("threshold", default_threshold))
+                if isinstance(w, dict)
+                else (w, default_threshold)
+            )
+            for w in data["windows"]
+        ]
+    else:
+        days = data.get("days", 180)
+        if isinstance(days, list):
+            thresholds = default_threshold
+            if not isinstance(thresholds, list):
+                thresholds = [thresholds] * len(days)
+            if len(thresholds) != len(days):
+                raise ValueError("threshold 的个数应与 days 一致")
+            windows = list(zip(days, thresholds))
+        else:
+            windows = [(days, default_threshold)]
+    windows = dict((int(days), float(threshold)) for days, threshold in windows)
+    if not windows or min(windows) <= 0:
+        raise ValueError("days 应为正整数")
+    return list(windows.items())
+
+
+def screen_codes(codes, windows, workers=1, adjust=""):
+    """
+    对 codes 做多窗口低价筛选，返回 {days: 结果行}。
+    预计算窗口直接查极值索引（多个窗口时先一起刷新过期条目），
+    其余窗口合并成一次读取、按最长窗口装载面板的 screener.screen_windows。
+    极值索引按不复权价格计算，复权筛选（adjust 为 qfq / hfq）的窗口全部走面板。
+    """
+    name_map = get_code_name_map()
+    index_windows = () if adjust else extremes_index.INDEX_WINDOWS
+    indexed = [(d, t) for d, t in windows if d in index_windows]
+    scanned = [(d, t) for d, t in windows if d not in index_windows]
+    if len(indexed) > 1:
+        extremes_index.refresh(codes, [days for days, _ in indexed])
+
+    results = {
+        days: extremes_index.screen(codes, days, threshold=threshold, name_map=name_map)
+        for days, threshold in indexed
+    }
+    if scanned:
+        results.update(
+            screener.screen_windows_parallel(
+                codes, scanned, name_map=name_map, workers=workers, adjust=adjust
+            )
+        )
+    return {days: results[days] for days, _ in windows}
+
+
+def universe_window_stats(codes, days, adjust=""):
+    """
+    codes 中每只股票 days 窗口的统计量（与 screener.window_stats 结构相同，含 distance）。
+    极值索引只有不复权价格，adjust 非空时改为按复权价格装载面板。
+    """
+    if days in extremes_index.INDEX_WINDOWS and not adjust:
+        return extremes_index.get_index(days).lookup(codes)
+    panel = screener.load_panel(codes, screener.cutoff_for(days), adjust=adjust)
+    return screener.window_stats(panel)
+
+
+LOW_PRICE_COLUMNS = [
+    "股票代码",
+    "股票名称",
+    "当前价",
+    "阶段最低",
+    "阶段最高",
+    "涨跌幅（%）",
+]
+# 各窗口结果文件的筛选状态，增量重新筛选以此为基准
+LOW_PRICE_STATE_PATH = os.path.join(STOCK_INFO_DIR, "low_price_state.json")
+# 结果文件的读取-合并-写入与筛选状态的更新互斥
+_results_lock = threading.Lock()
+
+
+def low_price_path(days):
+    return os.path.join(STOCK_INFO_DIR, f"low_price_stocks_{days}.csv")
+
+
+def load_screening_state():
+    """{str(days): {"threshold", "adjust", "first_day", "seq", "screened_at"}}"""
+    try:
+        with open(LOW_PRICE_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _set_screening_state(days, entry):
+    """调用方需持有 _results_lock；entry 为 None 时删除该窗口的状态"""
+    state = load_screening_state()
+    if entry is None:
+        if state.pop(str(days), None) is None:
+            return
+    else:
+        state[str(days)] = entry
+    tmp_path = f"{LOW_PRICE_STATE_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, LOW_PRICE_STATE_PATH)
+
+
+def screening_snapshot(windows, codes):
+    """
+    筛选开始前记下同步清单的变更序号和各窗口的起始日，写结果时一并保存。
+    先把 codes 的过期条目重算好，否则重算时产生的新序号会晚于这里的基准，下次被误判为有变化。
+    """
+    manifest = sync_manifest.get_manifest()
+    manifest.refresh(codes)
+    sync_manifest.flush()
+    return {
+        "seq": manifest.seq,
+        "first_days": {
+            str(days): str(extremes_index.first_day_for(days)) for days, _ in windows
+        },
+    }
+
+
+def save_low_price_results(days, results, threshold=None, snapshot=None, adjust=""):
+    """
+    根据 days 拼接文件名，直接覆盖写入，不合并，不去重。
+    snapshot 不为空表示这是覆盖全部股票的筛选，记录下来（连同复权方式）作为之后增量重新筛选的基准；
+    否则清除该窗口的筛选状态。
+    """
+    save_path = low_price_path(days)
+    new_df = pd.DataFrame(results, columns=LOW_PRICE_COLUMNS)
+    entry = None
+    if snapshot is not None:
+        entry = {
+            "threshold": threshold,
+            "adjust": adjust,
+            "first_day": snapshot["first_days"][str(days)],
+            "seq": snapshot["seq"],
+            "screened_at": datetime.now().isoformat(timespec="seconds"),
+        }
+    with _results_lock:
+        new_df.to_csv(save_path, index=False, encoding="utf-8-sig")
+        _set_screening_state(days, entry)
+    return new_df, save_path
+
+
+def merge_low_price_results(days, codes, rows, snapshot=None):
+    """
+    用 codes 的最新筛选结果替换结果文件中这些股票的行，其余行保持不变，按股票代码排序。
+    snapshot 不为空时把该窗口的变更序号推进到 snapshot。
+    返回 (合并后的 DataFrame, 新命中的代码, 不再命中的代码)。
+    """
+    path = low_price_path(days)
+    codes = set(codes)
+    hits = {row["股票代码"] for row in rows}
+    with _results_lock:
+        old_df = pd.DataFrame(columns=LOW_PRICE_COLUMNS)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            old_df = pd.read_csv(path, dtype={"股票代码": str})
+        if "股票代码" not in old_df.columns:
+            old_df = pd.DataFrame(columns=LOW_PRICE_COLUMNS)
+        previous = set(old_df["股票代码"]) & codes
+        merged = pd.concat(
+            [
+                old_df[~old_df["股票代码"].isin(codes)],
+                pd.DataFrame(rows, columns=LOW_PRICE_COLUMNS),
+            ],
+            ignore_index=True,
+        )
+        merged = merged.sort_values("股票代码", kind="stable", ignore_index=True)
+        merged.to_csv(path, index=False, encoding="utf-8-sig")
+        if snapshot is not None:
+            entry = load_screening_state().get(str(days))
+            if entry is not None:
+                _set_screening_state(days, {**entry, "seq": snapshot["seq"]})
+    return merged, sorted(hits - previous), sorted(previous - hits)
+
+
+def rescreen_dirty(windows, workers=1, adjust=""):
+    """
+    增量重新筛选：只重新评估上次筛选之后数据有变化的股票（同步清单的 changed_since），
+    把结果合并进已有的结果文件。没有筛选状态、阈值或复权方式不同、窗口起始日已滚动的窗口退回全量筛选。
+    返回 [{days, threshold, mode, rescreened, count, added, removed, file}, ...]
+    """
+    codes = history_store.list_codes()
+    snapshot = screening_snapshot(windows, codes)
+    state = load_screening_state()
+    incremental, full = [], []
+    for days, threshold in windows:
+        entry = state.get(str(days))
+        if (
+            entry is not None
+            and entry["threshold"] == threshold
+            and entry.get("adjust", "") == adjust
+            and entry["first_day"] == snapshot["first_days"][str(days)]
+            and os.path.exists(low_price_path(days))
+        ):
+            incremental.append((days, threshold))
+        else:
+            full.append((days, threshold))
+
+    summary = {}
+    if incremental:
+        since = min(state[str(days)]["seq"] for days, _ in incremental)
+        dirty = sync_manifest.get_manifest().changed_since(since, codes)
+        results = (
+            screen_codes(dirty, incremental, workers, adjust)
+            if dirty
+            else {days: [] for days, _ in incremental}
+        )
+        for days, threshold in incremental:
+            merged, added, removed = merge_low_price_results(
+                days, dirty, results[days], snapshot
+            )
+            summary[days] = {
+                "mode": "incremental",
+                "rescreened": len(dirty),
+                "count": len(merged),
+                "added": added,
+                "removed": removed,
+            }
+    if full:
+        results = screen_codes(codes, full, workers, adjust)
+        for days, threshold in full:
+            save_low_price_results(days, results[days], threshold, snapshot, adjust)
+            summary[days] = {
+                "mode": "full",
+                "rescreened": len(codes),
+                "count": len(results[days]),
+            }
+    return [
+        {
+            "days": days,
+            "threshold": threshold,
+            **summary[days],
+            "file": os.path.basename(low_price_path(days)),
+        }
+        for days, threshold in windows
+    ]
+
+
+def rescreen_codes(codes):
+    """
+    把少量股票（如单只刷新之后）的最新筛选结果合并进所有有筛选状态的结果文件。
+    各窗口沿用上次筛选的阈值和复权方式；不推进结果文件的变更序号，之后的增量重新筛选仍会覆盖这些股票。
+    返回 {days: {"hits", "added", "removed"}}
+    """
+    state = load_screening_state()
+    by_adjust = {}
+    for days, entry in state.items():
+        if os.path.exists(low_price_path(days)):
+            by_adjust.setdefault(entry.get("adjust", ""), []).append(
+                (int(days), entry["threshold"])
+            )
+    results = {}
+    for adjust, windows in by_adjust.items():
+        results.update(screen_codes(codes, windows, adjust=adjust))
+    changes = {}
+    for days in sorted(results):
+        _, added, removed = merge_low_price_results(days, codes, results[days])
+        changes[days] = {
+            "hits": [row["股票代码"] for row in results[days]],
+            "added": added,
+            "removed": removed,
+        }
+    return changes
+
+
+# 筛选任务每处理这么多只股票记录一次断点
+SCREENING_CHUNK = 500
+
+
+@jobs.job_type("screening")
+def run_screening_job(job, token):
+    """
+    低价筛选任务：按 SCREENING_CHUNK 分段做多窗口筛选，checkpoint 记录代码列表、
+    下一段的起点和各窗口已命中的结果，续跑时从断点所在段继续；全部完成后写所有窗口的结果文件。
+    """
+    params = job.params
+    windows = parse_windows(params)
+    workers = int(params.get("workers", 1))
+    adjust = adjust_factors.normalize_mode(params.get("adjust"))
+
+    codes = job.checkpoint.get("codes")
+    snapshot = job.checkpoint.get("snapshot")
+    if codes is None:
+        all_codes = history_store.list_codes()
+        start, end = int(params.get("start", 0)), int(params.get("end", 0))
+        codes = all_codes[start : end or None]
+        if len(codes) == len(all_codes):
+            snapshot = screening_snapshot(windows, codes)
+    next_index = job.checkpoint.get("next_index", 0)
+    # JSON 的键只能是字符串，checkpoint 里按 str(days) 保存
+    results = job.checkpoint.get("results", {})
+    results = {days: results.get(str(days), []) for days, _ in windows}
+    job.update(total=len(codes), progress=next_index)
+
+    for i in range(next_index, len(codes), SCREENING_CHUNK):
+        if token.cancelled:
+            return None
+        chunk_results = screen_codes(
+            codes[i : i + SCREENING_CHUNK], windows, workers, adjust
+        )
+        for days, rows in chunk_results.items():
+            results[days] += rows
+        done = min(i + SCREENING_CHUNK, len(codes))
+        job.update(
+            progress=done,
+            message=f"已筛选 {done} / {len(codes)}",
+            checkpoint={
+                "codes": codes,
+                "snapshot": snapshot,
+                "next_index": done,
+                "results": {str(days): rows for days, rows in results.items()},
+            },
+        )
+        job.save()
+
+    files = {}
+    for days, threshold in windows:
+        rows = results[days]
+        _, save_path = save_low_price_results(days, rows, threshold, snapshot, adjust)
+        files[str(days)] = {"count": len(rows), "file": os.path.basename(save_path)}
+    if len(windows) == 1:
+        return next(iter(files.values()))
+    return {"windows": files}
+
+
 def analyze_batch_api():
     try:
         # 获取参数
         data = request.get_json()
         start_index = int(data.get("start", 0))
         end_index = int(data.get("end", 0))
-        days = int(data.get("days", 180))
-        threshold = float(data.get("threshold", 1.05))
+        try:
+            windows = parse_windows(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({"code": 1, "message": f"筛选窗口参数无效：{e}"}), 400
+        # 复权方式：none（默认，不复权）/ qfq / hfq
+        try:
+            adjust = adjust_factors.normalize_mode(data.get("adjust"))
+        except ValueError as e:
+            return jsonify({"code": 1, "message": str(e)}), 400
+        # 并行进程数：1 为串行（默认），<= 0 表示使用全部 CPU 核心
+        workers = int(data.get("workers", 1))
+
+        if data.get("incremental"):
+            # 增量模式：忽略 start / end，只重新筛选上次之后有变化的股票
+            summary = rescreen_dirty(windows, workers, adjust)
+            return jsonify(
+                {
+                    "code": 0,
+                    "message": "增量筛选完成："
+                    + "，".join(
+                        f"{w['days']}天 {'增量' if w['mode'] == 'incremental' else '全量'}"
+                        f"处理 {w['rescreened']} 只，共 {w['count']} 条"
+                        for w in summary
+                    ),
+                    "windows": summary,
+                }
+            )
 
-        # 获取所有CSV文件
-        files = sorted([f for f in os.listdir(HISTORY_CACHE_DIR) if f.endswith(".csv")])
-        total = len(files)
+        # 获取所有已缓存的股票代码
+        codes = history_store.list_codes()
+        total = len(codes)
 
         # 参数校验
         if start_index < 0 or end_index > total or start_index >= end_index:
@@ -442,68 +983,73 @@ def analyze_batch_api():
                 400,
             )
 
-        today = datetime.now()
-        cutoff_date = today - timedelta(days=days)
-
-        results = []
-        for idx in range(start_index, end_index):
-            file = files[idx]
-            code = file.replace(".csv", "")
-            path = os.path.join(HISTORY_CACHE_DIR, file)
-            # 简单进度日志
-            print(
-                f"[{idx - start_index + 1}/{end_index - start_index}] 正在处理 {code} ...",
-                flush=True,
+        if data.get("background"):
+            return start_job_response(
+                "screening",
+                {
+                    "start": start_index,
+                    "end": end_index,
+                    "windows": [
+                        {"days": days, "threshold": threshold}
+                        for days, threshold in windows
+                    ],
+                    "workers": workers,
+                    "adjust": adjust,
+                },
             )
 
-            try:
-                try:
-                    df = pd.read_csv(path)
-                    if df.empty:
-                        continue  # 有表头但无数据
-                except EmptyDataError:
-                    continue  # 文件完全空
-                df["日期"] = pd.to_datetime(df["日期"])
-                df = df[df["日期"] >= cutoff_date]
-                min_price = df["最低"].astype(float).min()
-                max_price = df["最高"].astype(float).max()
-                current_price = float(df.iloc[-1]["收盘"])
-
-                if current_price <= min_price * threshold:
-                    results.append(
-                        {
-                            "股票代码": code,
-                            "股票名称": code_name_map.get(code, "未知名称"),
-                            "当前价": current_price,
-                            "阶段最低": min_price,
-                            "阶段最高": max_price,
-                            "涨跌幅（%）": f"{(current_price - min_price) / min_price * 100:.2f}%",
-                        }
-                    )
-
-            except Exception as e:
-                print(f"处理 {file} 出错：{e}")
-                continue
-
-        # 保存结果，避免重复写入
-        # 根据 days 拼接文件名
-        save_path = os.path.join(
-            BASE_DIR, "stocks_info", f"low_price_stocks_{days}.csv"
+        # 覆盖全部股票时记下筛选基准，之后可以增量重新筛选
+        snapshot = (
+            screening_snapshot(windows, codes)
+            if start_index == 0 and end_index == total
+            else None
+        )
+        all_results = screen_codes(
+            codes[start_index:end_index], windows, workers, adjust
         )
+        saved = {
+            days: save_low_price_results(
+                days, all_results[days], threshold, snapshot, adjust
+            )
+            for days, threshold in windows
+        }
 
-        new_df = pd.DataFrame(results)
-        # 直接覆盖写入，不合并，不去重
-        new_df.to_csv(save_path, index=False, encoding="utf-8-sig")
+        if len(windows) == 1:
+            days, _ = windows[0]
+            results = all_results[days]
+            new_df, save_path = saved[days]
+            return jsonify(
+                {
+                    "code": 0,
+                    "message": f"分析完成（{days}天）：处理了 {end_index - start_index} 只股票，新增 {len(new_df)} 条低价股票，结果保存在 {os.path.basename(save_path)}",
+                    "total": total,
+                    "start_index": start_index,
+                    "end_index": end_index,
+                    "count": len(results),
+                    "data": results,
+                }
+            )
 
         return jsonify(
             {
                 "code": 0,
-                "message": f"分析完成（{days}天）：处理了 {end_index - start_index} 只股票，新增 {len(new_df)} 条低价股票，结果保存在 {os.path.basename(save_path)}",
+                "message": f"分析完成（{'/'.join(str(days) for days, _ in windows)}天）：处理了 {end_index - start_index} 只股票，"
+                + "，".join(
+                    f"{days}天 {len(rows)} 条" for days, rows in all_results.items()
+                ),
                 "total": total,
                 "start_index": start_index,
                 "end_index": end_index,
-                "count": len(results),
-                "data": results,
+                "windows": [
+                    {
+                        "days": days,
+                        "threshold": threshold,
+                        "count": len(all_results[days]),
+                        "file": os.path.basename(saved[days][1]),
+                    }
+                    for days, threshold in windows
+                ],
+                "data": {str(days): rows for days, rows in all_results.items()},
             }
         )
 
@@ -532,17 +1078,38 @@ def get_analyze_batch_data_api():
                 404,
             )
         print(f"正在读取{file_path}文件内容。")
-        # 读取 CSV 文件
-        df = pd.read_csv(file_path, dtype=str)
-        data = df.to_dict(orient="records")
+        if wants_ndjson():
+            return ndjson_response(iter_csv_chunks(file_path, dtype=str))
 
-        return jsonify(
+        version = file_version(file_path)
+        try:
+            page = page_request(version)
+        except ValueError as e:
+            return jsonify({"code": 1, "message": str(e)}), 400
+
+        if page is None:
+            # 读取 CSV 文件
+            df = pd.read_csv(file_path, dtype=str)
+            return json_response(
+                {
+                    "code": 0,
+                    "message": f"成功读取 {filename}",
+                    "days": days,
+                    "count": len(df),
+                    "data": Frame(df, response_format()),
+                }
+            )
+
+        offset, limit = page
+        df, has_more = read_csv_page(file_path, offset, limit, dtype=str)
+        return json_response(
             {
                 "code": 0,
                 "message": f"成功读取 {filename}",
                 "days": days,
-                "count": len(data),
-                "data": data,
+                "count": len(df),
+                "next_cursor": next_cursor(offset, limit, has_more, version),
+                "data": Frame(df, response_format()),
             }
         )
 
@@ -567,14 +1134,13 @@ def get_low_price_stocks_api():
             )
 
         df = pd.read_csv(file_path, dtype=str)
-        data = df.to_dict(orient="records")
 
-        return jsonify(
+        return json_response(
             {
                 "code": 0,
                 "message": f"成功获取 {days} 天的低价股票数据",
-                "count": len(data),
-                "data": data,
+                "count": len(df),
+                "data": Frame(df, response_format()),
             }
         )
 
@@ -638,10 +1204,13 @@ def get_margin_stocks_api():
         # 根据 '标的证券代码' 去重，保留第一条
         filtered_df = filtered_df.drop_duplicates(subset=["标的证券代码"], keep="first")
 
-        # 转成字典列表返回
-        data = filtered_df.to_dict(orient="records")
-
-        return jsonify({"code": 0, "count": len(data), "data": data})
+        return json_response(
+            {
+                "code": 0,
+                "count": len(filtered_df),
+                "data": Frame(filtered_df, response_format()),
+            }
+        )
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
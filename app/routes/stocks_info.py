@@ -1,20 +1,38 @@
 import os
 from flask import jsonify, request
 import akshare as ak
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
 import time
-import time
-import json
-import threading
+import asyncio
+
+from app import (
+    adjust_factors,
+    extremes_index,
+    fetch_engine,
+    history_store,
+    jobs,
+    sync_manifest,
+)
+from app.serialization import (
+    Frame,
+    file_version,
+    iter_csv_chunks,
+    json_response,
+    ndjson_response,
+    next_cursor,
+    page_request,
+    read_csv_page,
+    request_param,
+    response_format,
+    wants_ndjson,
+)
+from app.routes.stocks_analyse import rescreen_codes, start_job_response
+from app.trade_calendar import get_calendar, get_recent_trade_dates
 
-# 全局停止标志
-stop_flag = False
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
 LIST_CSV_PATH = os.path.join(BASE_DIR, "stocks_info", "list.csv")
-HISTORY_CACHE_DIR = os.path.join(BASE_DIR, "history_cache")
-TASK_STATUS_PATH = os.path.join(BASE_DIR, "stocks_info", "task_status.json")
 
 
 def get_stock_list_cached():
@@ -49,14 +67,42 @@ def stock_count_api():
 
 
 def stock_list_api():
-    """返回股票列表"""
+    """
+    返回股票列表。
+    传 limit（可选 cursor）时按游标分页；format=ndjson 时逐块读取 list.csv 流式输出。
+    """
     try:
-        df = get_stock_list_cached()
-        stocks = df[["code", "name"]].to_dict(orient="records")
-        return jsonify(
+        if not os.path.exists(LIST_CSV_PATH):
+            get_stock_list_cached()
+        read_options = {"dtype": {"code": str}, "usecols": ["code", "name"]}
+
+        if wants_ndjson():
+            return ndjson_response(iter_csv_chunks(LIST_CSV_PATH, **read_options))
+
+        version = file_version(LIST_CSV_PATH)
+        try:
+            page = page_request(version)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": str(e)}), 400
+
+        if page is None:
+            df = get_stock_list_cached()
+            return json_response(
+                {
+                    "data": Frame(df[["code", "name"]], response_format()),
+                    "count": len(df),
+                    "message": "成功获取股票列表",
+                    "code": 200,
+                }
+            )
+
+        offset, limit = page
+        df, has_more = read_csv_page(LIST_CSV_PATH, offset, limit, **read_options)
+        return json_response(
             {
-                "data": stocks,
-                "count": len(stocks),
+                "data": Frame(df, response_format()),
+                "count": len(df),
+                "next_cursor": next_cursor(offset, limit, has_more, version),
                 "message": "成功获取股票列表",
                 "code": 200,
             }
@@ -76,267 +122,562 @@ def update_single_stock_api():
         return jsonify({"error": "缺少参数: code"}), 400
 
     result = update_single_stock(code)
+    if result.get("updated_count", 0) > 0:
+        # 新 K 线直接合并进已有的低价筛选结果，不必等下一次全量筛选
+        try:
+            changes = rescreen_codes([code])
+            result["screening"] = {
+                str(days): code in change["hits"] for days, change in changes.items()
+            }
+        except Exception as e:
+            print(f"[筛选] 合并 {code} 的筛选结果失败：{e}")
+    extremes_index.flush()
+    adjust_factors.flush()
+    sync_manifest.flush()
     return jsonify(result)
 
 
-def update_single_stock(code):
+def plan_stock_update(code, end_date_str):
+    """
+    根据水位（最后日期、行数）决定抓取区间，水位优先取同步清单，不打开数据文件。
+    返回 (start_date_str, is_new)；已是最新时 start_date_str 为 None。
+    区间内没有交易日（周末、节假日）时也视为已是最新，不请求上游。
+    """
+    watermark = sync_manifest.watermark(code)
+    if watermark is None or watermark["last_date"] is None:
+        return "19800101", True
+
+    start_date = pd.Timestamp(watermark["last_date"]) + timedelta(days=1)
+    start_date_str = start_date.strftime("%Y%m%d")
+    if start_date_str > end_date_str:
+        return None, False
+    try:
+        if get_calendar().count_between(start_date_str, end_date_str) == 0:
+            return None, False
+    except Exception as e:
+        # 交易日历不可用时按自然日照常抓取
+        print(f"[交易日历] 不可用，{code} 按自然日判断：{e}")
+    return start_date_str, False
+
+
+def fetch_stock_bars(code, start_date_str, end_date_str, fetch_func=None):
+    """从上游拉取 [start_date, end_date] 的不复权日线"""
+    fetch_func = fetch_func or ak.stock_zh_a_hist
+    return fetch_func(
+        symbol=str(code),
+        period="daily",
+        start_date=start_date_str,
+        end_date=end_date_str,
+        adjust="",
+    )
+
+
+def save_stock_bars(code, df, is_new):
+    """把拉取到的日线写入 history_cache，并同步更新极值索引和复权因子的待刷新标记"""
+    if df.empty:
+        message = f"[无数据] {code}" if is_new else f"[无新数据] {code}"
+        return {"code": 0, "message": message, "updated_count": 0}
+
+    if is_new:
+        saved = history_store.write_history(code, df)
+        extremes_index.on_history_updated(code, saved)
+        adjust_factors.on_history_updated(code, saved)
+        return {
+            "code": 0,
+            "message": f"[首次保存] {code} 共 {saved} 条记录",
+            "updated_count": saved,
+        }
+
+    # 只追加新 K 线，不重写历史数据
+    appended = history_store.append_history(code, df)
+    extremes_index.on_history_updated(code, appended)
+    adjust_factors.on_history_updated(code, appended)
+    return {
+        "code": 0,
+        "message": f"[更新成功] {code} 新增 {appended} 条记录",
+        "updated_count": appended,
+    }
+
+
+def update_single_stock(code, should_stop=None):
     """单只股票更新"""
-    global stop_flag
-    if stop_flag:
+    if should_stop is not None and should_stop():
         return {"code": -1, "message": f"[停止] {code} 更新中断", "updated_count": -1}
 
     today = datetime.today()
     end_date_str = today.strftime("%Y%m%d")
 
     try:
-        cache_path = os.path.join(HISTORY_CACHE_DIR, f"{code}.csv")
-
-        if os.path.exists(cache_path):
-            df_old = pd.read_csv(cache_path, parse_dates=["日期"])
-            last_date = df_old["日期"].max()
-            start_date = last_date + timedelta(days=1)
-            start_date_str = start_date.strftime("%Y%m%d")
-
-            if start_date_str > end_date_str:
-                return {
-                    "code": 0,
-                    "message": f"[无需更新] {code} 已是最新",
-                    "updated_count": 0,
-                }
-
-            if stop_flag:
-                return {
-                    "code": -1,
-                    "message": f"[停止] {code} 更新中断",
-                    "updated_count": -1,
-                }
-
-            df_new = ak.stock_zh_a_hist(
-                symbol=str(code),
-                period="daily",
-                start_date=start_date_str,
-                end_date=end_date_str,
-                adjust="",
-            )
-            if df_new.empty:
-                return {"code": 0, "message": f"[无新数据] {code}", "updated_count": 0}
-
-            df_new["日期"] = pd.to_datetime(df_new["日期"])
-            df_combined = pd.concat([df_old, df_new], ignore_index=True)
-            df_combined.drop_duplicates(subset=["日期"], inplace=True)
-            df_combined.sort_values("日期", inplace=True)
-            df_combined.to_csv(cache_path, index=False)
-
+        start_date_str, is_new = plan_stock_update(code, end_date_str)
+        if start_date_str is None:
             return {
                 "code": 0,
-                "message": f"[更新成功] {code} 新增 {len(df_new)} 条记录",
-                "updated_count": len(df_new),
+                "message": f"[无需更新] {code} 已是最新",
+                "updated_count": 0,
             }
 
-        else:
-            if stop_flag:
-                return {
-                    "code": -1,
-                    "message": f"[停止] {code} 更新中断",
-                    "updated_count": -1,
-                }
-            df = ak.stock_zh_a_hist(
-                symbol=str(code),
-                period="daily",
-                start_date="19800101",
-                end_date=end_date_str,
-                adjust="",
-            )
-
-            if df.empty:
-                return {"code": 0, "message": f"[无数据] {code}", "updated_count": 0}
-
-            df["日期"] = pd.to_datetime(df["日期"])
-            df.sort_values("日期", inplace=True)
-            df.to_csv(cache_path, index=False)
-
+        if should_stop is not None and should_stop():
             return {
-                "code": 0,
-                "message": f"[首次保存] {code} 共 {len(df)} 条记录",
-                "updated_count": len(df),
+                "code": -1,
+                "message": f"[停止] {code} 更新中断",
+                "updated_count": -1,
             }
 
+        df = fetch_stock_bars(code, start_date_str, end_date_str)
+        result = save_stock_bars(code, df, is_new)
+        sync_manifest.get_manifest().mark_checked(code, sync_manifest.target_date())
+        return result
+
     except Exception as e:
         return {"code": -1, "message": f"[更新失败] {code}: {e}", "updated_count": -1}
 
 
-def update_stocks_batch(codes, max_workers=8, batch_size=50):
-    global stop_flag
-    total_updated = 0
+def sync_stocks(
+    codes,
+    fetch_func=None,
+    should_stop=None,
+    on_result=None,
+    skip_current=True,
+    **options,
+):
+    """
+    用异步抓取流水线同步一批股票的历史行情。
+    skip_current 为真时先用同步清单一次性筛掉已同步到最近收盘交易日的股票，
+    这些股票直接以"无需更新"回调 on_result，不进入流水线；
+    fetch_func 默认为 ak.stock_zh_a_hist，可替换为本地桩函数；
+    options 透传给 fetch_engine.run_pipeline（rate、max_concurrency 等）。
+    发生除权除息的股票只记为待刷新，由后台任务统一刷新复权因子表。
+    """
+    end_date_str = datetime.today().strftime("%Y%m%d")
+    manifest = sync_manifest.get_manifest()
+    target = sync_manifest.target_date()
+
+    current = []
+    if skip_current:
+        codes, current = manifest.split(codes, target)
+        print(f"[同步清单] 需要更新 {len(codes)} 只，已是最新 {len(current)} 只")
+        for code in current:
+            if on_result is not None:
+                on_result(
+                    code,
+                    {
+                        "code": 0,
+                        "message": f"[无需更新] {code} 已是最新",
+                        "updated_count": 0,
+                    },
+                )
+
+    def fetch_one(code):
+        start_date_str, is_new = plan_stock_update(code, end_date_str)
+        if start_date_str is None:
+            return None
+        df = fetch_stock_bars(code, start_date_str, end_date_str, fetch_func)
+        return df, is_new
 
-    for i in range(0, len(codes), batch_size):
-        if stop_flag:
-            print("[批量] 检测到停止信号，结束任务")
-            break
+    def write_one(code, payload):
+        df, is_new = payload
+        result = save_stock_bars(code, df, is_new)
+        manifest.mark_checked(code, target)
+        return result
 
-        batch_codes = codes[i : i + batch_size]
-        print(
-            f"[批次开始] 处理股票代码索引 {i + 1} - {i + len(batch_codes)} / {len(codes)}"
+    try:
+        stats = asyncio.run(
+            fetch_engine.run_pipeline(
+                codes,
+                fetch_one,
+                write_one,
+                should_stop=should_stop,
+                on_result=on_result,
+                **options,
+            )
         )
-        start_batch_time = time.time()
+        stats["total"] += len(current)
+        stats["skipped"] += len(current)
+        return stats
+    finally:
+        extremes_index.flush()
+        adjust_factors.flush()
+        sync_manifest.flush()
+
+
+# 全市场快照列 -> stock_zh_a_hist 日线列
+SNAPSHOT_COLUMNS = {
+    "今开": "开盘",
+    "最新价": "收盘",
+    "最高": "最高",
+    "最低": "最低",
+    "成交量": "成交量",
+    "成交额": "成交额",
+    "振幅": "振幅",
+    "涨跌幅": "涨跌幅",
+    "涨跌额": "涨跌额",
+    "换手率": "换手率",
+}
+
+
+def snapshot_to_bars(spot_df, trade_date):
+    """
+    把全市场快照表转换为当日 K 线（列名与 stock_zh_a_hist 一致）。
+    返回 (codes, records)，records 与 codes 一一对应；停牌（无最新价）的股票被剔除。
+    """
+    df = spot_df[spot_df["最新价"].notna()]
+    bars = df[list(SNAPSHOT_COLUMNS)].rename(columns=SNAPSHOT_COLUMNS)
+    bars.insert(0, "日期", pd.Timestamp(trade_date))
+    codes = df["代码"].astype(str).str.zfill(6).tolist()
+    # frame_to_records 会按日期稳定排序，单日数据的行顺序不变
+    return codes, history_store.frame_to_records(bars)
 
-        try:
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {
-                    executor.submit(update_single_stock, code): code
-                    for code in batch_codes
-                }
 
-                for future in as_completed(futures):
-                    if stop_flag:
-                        executor.shutdown(cancel_futures=True)
-                        print("[线程池] 停止信号，取消剩余任务")
-                        return total_updated
-
-                    code = futures[future]
-                    try:
-                        # 设定单任务最大等待时间，避免长时间卡住
-                        result = future.result(timeout=60)
-                        if result.get("updated_count", -1) > 0:
-                            total_updated += result["updated_count"]
-                        print(f"[更新完成] {code} -> {result.get('message')}")
-                    except TimeoutError:
-                        print(f"❌ {code} 更新超时，跳过该任务")
-                    except Exception as e:
-                        print(f"❌ {code} 异常: {e}")
-
-            end_batch_time = time.time()
-            print(
-                f"[批次结束] 完成索引 {i + len(batch_codes)} / {len(codes)}，耗时 {end_batch_time - start_batch_time:.2f} 秒"
-            )
-        except Exception as e:
-            print(f"❌ 批次异常: {e}")
+def daily_append_sync(codes=None, spot_func=None, fetch_func=None, fallback=True):
+    """
+    每日增量同步：拉一次全市场快照，把当日 K 线批量追加到 history_cache。
+    只有上一交易日已入库的股票直接追加快照；有缺口或首次入库的股票
+    退回逐只调用 stock_zh_a_hist（fallback=False 时只返回缺口列表）。
+    """
+    started = time.time()
+    previous_day, trade_day = get_recent_trade_dates(2)
+    trade_date = pd.Timestamp(trade_day).strftime("%Y-%m-%d")
+    previous_date = pd.Timestamp(previous_day).strftime("%Y-%m-%d")
+
+    spot_df = (spot_func or ak.stock_zh_a_spot_em)()
+    snapshot_codes, records = snapshot_to_bars(spot_df, trade_date)
+    position = {code: i for i, code in enumerate(snapshot_codes)}
+    codes = codes if codes is not None else snapshot_codes
+
+    appended, up_to_date, gap_codes = [], 0, []
+    for code in codes:
+        watermark = sync_manifest.watermark(code)
+        last_date = watermark["last_date"] if watermark else None
+        if last_date is not None and last_date >= trade_date:
+            up_to_date += 1
+        elif last_date == previous_date and code in position:
+            i = position[code]
+            count = history_store.append_records(code, records[i : i + 1])
+            extremes_index.on_history_updated(code, count)
+            adjust_factors.on_history_updated(code, count)
+            appended.append(code)
+        else:
+            gap_codes.append(code)
+    extremes_index.flush()
+    adjust_factors.flush()
+    sync_manifest.flush()
+    print(
+        f"[每日快照] {trade_date}：追加 {len(appended)} 只，已是最新 {up_to_date} 只，缺口 {len(gap_codes)} 只"
+    )
+
+    fallback_stats = None
+    if fallback and gap_codes:
+        fallback_stats = sync_stocks(gap_codes, fetch_func=fetch_func)
+
+    return {
+        "trade_date": trade_date,
+        "appended": len(appended),
+        "up_to_date": up_to_date,
+        "gap_codes": gap_codes,
+        "fallback": fallback_stats,
+        "elapsed": round(time.time() - started, 3),
+    }
+
+
+def daily_append_sync_api():
+    """
+    每日快照同步 API
+    POST JSON: {"fallback": true, "force": false}
+    收盘（15:00）前的快照不是完整日线，除非 force=true 否则拒绝执行。
+    快照追加在请求内完成；有缺口的股票（fallback=true）交给 daily_gap_sync 后台任务逐只补齐，
+    响应中的 fallback_job 为任务 id。全量同步任务运行期间缺口由它补齐，此时返回 409。
+    """
+    data = request.get_json(silent=True) or {}
+    fallback = bool(data.get("fallback", True))
+    force = bool(data.get("force", False))
+
+    manager = jobs.get_manager()
+    if fallback and manager.active("history_sync") is not None:
+        return (
+            jsonify(
+                {
+                    "code": 1,
+                    "message": "全量同步任务正在运行，可稍后重试或传 fallback=false 只追加快照",
+                }
+            ),
+            409,
+        )
 
-        # 批次间休息1秒，避免请求过于密集
-        time.sleep(1)
+    try:
+        now = datetime.now()
+        trade_day = get_recent_trade_dates(1)[-1]
+        if not force and trade_day == now.strftime("%Y%m%d") and now.hour < 15:
+            return jsonify({"code": 1, "message": "尚未收盘，快照不是完整日线"}), 400
+        result = daily_append_sync(fallback=False)
+    except Exception as e:
+        return jsonify({"code": -1, "message": f"每日快照同步失败: {e}"}), 500
 
-    print(f"[批量更新完成] 总共更新记录数: {total_updated}")
-    return total_updated
+    result["fallback_job"] = None
+    if fallback and result["gap_codes"]:
+        try:
+            job = manager.start("daily_gap_sync", {"codes": result["gap_codes"]})
+            result["fallback_job"] = job.job_id
+        except RuntimeError as e:
+            print(f"[每日快照] {e}")
+    # 新出现的除权除息交给后台任务限速刷新，不阻塞本次请求
+    result["adjust_factor_job"] = None
+    if adjust_factors.get_store().pending_codes():
+        try:
+            job = manager.start("adjust_factor_sync", {"codes": []})
+            result["adjust_factor_job"] = job.job_id
+        except RuntimeError as e:
+            print(f"[复权因子] {e}")
+    return jsonify({"code": 0, "message": "每日快照同步完成", "data": result})
 
 
-def save_task_status(status):
-    os.makedirs(os.path.dirname(TASK_STATUS_PATH), exist_ok=True)
-    with open(TASK_STATUS_PATH, "w", encoding="utf-8") as f:
-        json.dump(status, f, ensure_ascii=False, indent=2)
+@jobs.job_type("daily_gap_sync")
+def run_daily_gap_sync_job(job, token):
+    """
+    每日快照的缺口补齐任务：缺口股票走与全量同步相同的限速流水线。
+    续跑时已补齐的股票由同步清单跳过，不需要额外的 checkpoint。
+    """
+    codes = job.params.get("codes") or []
+    job.update(total=len(codes), progress=0)
+    job.save(force=True)
+
+    def on_result(code, result):
+        job.update(
+            progress=job.progress + 1,
+            message=f"已处理 {job.progress + 1} / {len(codes)}",
+        )
+        job.save()
 
+    return sync_stocks(codes, should_stop=token, on_result=on_result)
 
-def load_task_status():
-    if os.path.exists(TASK_STATUS_PATH):
-        with open(TASK_STATUS_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
 
+def parse_day(value):
+    """YYYYMMDD / YYYY-MM-DD 转为 datetime64[D]，为空时返回 None"""
+    if not value:
+        return None
+    return np.datetime64(pd.Timestamp(str(value)).date(), "D")
 
-def async_all_stock_start_api():
-    global stop_flag
-    stop_flag = False
 
-    status = load_task_status()
-    if status.get("running", False):
-        return jsonify({"code": 1, "message": "任务已在运行中"}), 400
+def stock_history_api():
+    """
+    单只股票的日线 API
+    参数：code（必填）、adjust（none / qfq / hfq，默认不复权）、start / end（YYYYMMDD，可选）、format
+    复权价格由本地的不复权日线和复权因子即时换算，不请求上游；
+    还没有因子表的股票返回不复权价格，响应中 factors 为 false。
+    """
+    code = request_param("code")
+    if not code:
+        return jsonify({"code": 1, "message": "缺少参数: code"}), 400
+    code = str(code)
+    try:
+        adjust = adjust_factors.normalize_mode(request_param("adjust"))
+        start, end = parse_day(request_param("start")), parse_day(request_param("end"))
+    except ValueError as e:
+        return jsonify({"code": 1, "message": f"参数错误：{e}"}), 400
+
+    records = history_store.read_history(code)
+    if records is None:
+        return jsonify({"code": 1, "message": f"{code} 没有历史数据"}), 404
+    lo = np.searchsorted(records["date"], start) if start is not None else 0
+    hi = (
+        np.searchsorted(records["date"], end, side="right")
+        if end is not None
+        else len(records)
+    )
+    records = adjust_factors.apply(code, records[lo:hi], adjust)
+    df = history_store.records_to_frame(records)
+    df["日期"] = df["日期"].dt.strftime("%Y-%m-%d")
+    return json_response(
+        {
+            "code": 0,
+            "message": "成功",
+            "adjust": adjust or "none",
+            "factors": adjust_factors.get_store().get(code) is not None,
+            "count": len(df),
+            "data": Frame(df, response_format()),
+        }
+    )
+
+
+def refresh_adjust_factors_api():
+    """
+    复权因子刷新 API
+    POST JSON:
+    {
+        "codes": ["600000"],  # 只刷新这些股票（可选）
+        "force": false,  # 不传 codes 时：false 只刷新待刷新和还没有因子表的股票，true 刷新全部已缓存股票
+        "rate": 10,  # 每秒请求数上限（可选）
+        "max_concurrency": 16,  # 并发上限（可选）
+        "background": false  # 为 true 时作为后台任务运行，立即返回 job_id（可选）
+    }
+    同步时发生除权除息的股票会被记为待刷新，由全量同步任务或这里统一刷新。
+    """
+    data = request.get_json(silent=True) or {}
+    params = {
+        "codes": [str(code) for code in data.get("codes") or []],
+        "force": bool(data.get("force", False)),
+    }
+    for name, cast in FACTOR_RATE_OPTIONS.items():
+        if name not in data:
+            continue
+        try:
+            params[name] = cast(data[name])
+            if params[name] <= 0:
+                raise ValueError
+        except Exception:
+            return jsonify({"code": 1, "message": f"参数 {name} 应为正数"}), 400
+    if data.get("background"):
+        return start_job_response("adjust_factor_sync", params)
 
     try:
-        df = get_stock_list_cached()
-        codes = df["code"].tolist()
+        result = refresh_adjust_factors(params)
     except Exception as e:
-        return jsonify({"code": -1, "message": f"读取股票列表失败: {e}"}), 500
+        return jsonify({"code": -1, "message": f"刷新复权因子失败：{e}"}), 500
+    return jsonify(
+        {
+            "code": 0,
+            "message": f"刷新完成：拉取 {result['fetched']} 只，变化 {len(result['changed'])} 只，失败 {len(result['failed'])} 只",
+            "data": result,
+        }
+    )
 
-    def background_task():
-        try:
-            save_task_status(
-                {"running": True, "progress": 0, "total": len(codes), "updated": 0}
-            )
-            updated_total = 0
-            batch_size = 50
-            max_workers = 8
-
-            for i in range(0, len(codes), batch_size):
-                if stop_flag:
-                    save_task_status(
-                        {
-                            "running": False,
-                            "progress": i,
-                            "total": len(codes),
-                            "updated": updated_total,
-                            "message": "任务已手动停止",
-                        }
-                    )
-                    print("[后台任务] 停止信号，任务终止")
-                    return
-
-                batch_codes = codes[i : i + batch_size]
-                print(
-                    f"[后台任务] 处理批次: {i + 1} - {i + len(batch_codes)} / {len(codes)}"
-                )
-                updated_count = update_stocks_batch(
-                    batch_codes, max_workers=max_workers, batch_size=batch_size
-                )
-                updated_total += updated_count
 
-                progress = min(i + batch_size, len(codes))
-                save_task_status(
-                    {
-                        "running": True,
-                        "progress": progress,
-                        "total": len(codes),
-                        "updated": updated_total,
-                        "message": f"已处理 {progress} / {len(codes)}",
-                    }
-                )
-                print(
-                    f"[后台任务] 已处理 {progress} / {len(codes)}，累计更新 {updated_total} 条记录"
-                )
+# 刷新接口接受的限速参数，透传给 fetch_engine.run_pipeline
+FACTOR_RATE_OPTIONS = {"rate": float, "max_concurrency": int}
 
-            save_task_status(
-                {
-                    "running": False,
-                    "progress": len(codes),
-                    "total": len(codes),
-                    "updated": updated_total,
-                    "message": "任务完成",
-                }
-            )
-            print("[后台任务] 全量同步任务完成")
-        except Exception as e:
-            print(f"❌ 后台任务异常: {e}")
-            save_task_status(
-                {
-                    "running": False,
-                    "progress": 0,
-                    "total": len(codes),
-                    "updated": 0,
-                    "message": f"任务异常中断: {e}",
-                }
-            )
 
-    threading.Thread(target=background_task, daemon=True).start()
-    return jsonify({"code": 0, "message": "任务已启动"})
+def refresh_adjust_factors(params, should_stop=None, on_progress=None):
+    """
+    把要刷新的股票记为待刷新，再统一走 sync_pending；中断后未完成的股票保持待刷新。
+    不传 codes 时处理全部待刷新股票（force 时先把全部已缓存股票记为待刷新）。
+    """
+    store = adjust_factors.get_store()
+    codes = params.get("codes") or None
+    if codes is not None:
+        store.mark_pending(codes)
+    elif params.get("force"):
+        store.mark_pending(history_store.list_codes())
+    else:
+        store.mark_pending(
+            [code for code in history_store.list_codes() if store.get(code) is None]
+        )
+    options = {name: params[name] for name in FACTOR_RATE_OPTIONS if name in params}
+    return adjust_factors.sync_pending(
+        codes, should_stop=should_stop, on_progress=on_progress, **options
+    )
+
+
+@jobs.job_type("adjust_factor_sync")
+def run_adjust_factor_sync_job(job, token):
+    """复权因子刷新任务：待刷新标记随因子表落盘，续跑即重新运行"""
+
+    def on_progress(done, total):
+        job.update(progress=done, total=total, message=f"已拉取 {done} / {total}")
+        job.save()
+
+    return refresh_adjust_factors(
+        job.params, should_stop=token, on_progress=on_progress
+    )
+
+
+@jobs.job_type("history_sync")
+def run_history_sync_job(job, token):
+    """
+    全量历史行情同步任务。
+    checkpoint 记录本次的代码列表和已成功的代码，续跑时只处理剩余代码；
+    失败的代码不计入已完成，续跑时会重试。
+    """
+    codes = job.checkpoint.get("codes")
+    if codes is None:
+        codes = get_stock_list_cached()["code"].tolist()
+    completed = set(job.checkpoint.get("completed", []))
+    pending = [code for code in codes if code not in completed]
+    stats = {"updated": 0, "errors": 0, **job.stats}
+
+    def snapshot():
+        return {"codes": codes, "completed": list(completed)}
+
+    job.update(total=len(codes), progress=len(completed), stats=stats)
+    job.save(force=True, checkpoint=snapshot)
+    if len(completed):
+        print(f"[后台任务] 从断点继续：已完成 {len(completed)}，剩余 {len(pending)}")
+
+    def on_result(code, result):
+        updated_count = result.get("updated_count", -1)
+        if updated_count >= 0:
+            completed.add(code)
+            stats["updated"] += updated_count
+        else:
+            stats["errors"] += 1
+        print(f"[更新完成] {code} -> {result.get('message')}")
+        job.update(
+            progress=job.progress + 1,
+            stats=stats,
+            message=f"已处理 {job.progress + 1} / {len(codes)}",
+        )
+        job.save(checkpoint=snapshot)
+
+    result = sync_stocks(
+        pending,
+        should_stop=token,
+        on_result=on_result,
+        skip_current=not job.params.get("force", False),
+    )
+    print(f"[后台任务] 抓取统计: {result}")
+    if not token.cancelled:
+        # 日线同步中记为待刷新的股票，经同一条限速流水线刷新复权因子表
+        job.update(message="刷新复权因子")
+        job.save()
+        result["adjust_factors"] = adjust_factors.sync_pending(codes, should_stop=token)
+    job.update(checkpoint=snapshot())
+    return result
+
+
+def history_sync_status(job):
+    """把任务状态转换成原 task_status.json 的字段，兼容旧的前端"""
+    status = job.to_dict()
+    return {
+        **status,
+        "updated": status["stats"].get("updated", 0),
+    }
+
+
+def async_all_stock_start_api():
+    """
+    启动全量同步。默认从最近一次未完成（中断/失败/停止）的同步任务断点续跑，
+    传 resume=false 时重新开始；force=true 时不按同步清单跳过已是最新的股票。
+    """
+    data = request.get_json(silent=True) or {}
+    resume = str(data.get("resume", request.args.get("resume", "true"))).lower()
+    manager = jobs.get_manager()
+
+    try:
+        latest = manager.latest("history_sync")
+        if resume != "false" and latest and latest.state in jobs.RESUMABLE_STATES:
+            job = manager.resume(latest.job_id)
+            return jsonify(
+                {"code": 0, "message": "任务已从断点继续", "job_id": job.job_id}
+            )
+        force = str(data.get("force", request.args.get("force", "false"))).lower()
+        job = manager.start("history_sync", {"force": force == "true"})
+    except RuntimeError:
+        return jsonify({"code": 1, "message": "任务已在运行中"}), 400
+    return jsonify({"code": 0, "message": "任务已启动", "job_id": job.job_id})
 
 
 def check_async_all_status_api():
     """检查任务状态"""
-    if not os.path.exists(TASK_STATUS_PATH):
+    job = jobs.get_manager().latest("history_sync")
+    if job is None:
         return jsonify({"code": 1, "message": "无同步任务状态", "running": False})
 
-    status = load_task_status()
-    return jsonify({"code": 0, "message": "成功获取任务状态", **status})
+    return jsonify({"code": 0, **history_sync_status(job)})
 
 
 def all_stock_async_stop_api():
     """停止任务"""
-    global stop_flag
-    stop_flag = True
-
-    status = load_task_status()
-    if status.get("running", False):
-        save_task_status({**status, "running": False, "message": "任务已手动停止"})
+    manager = jobs.get_manager()
+    job = manager.active("history_sync")
+    if job is not None and manager.cancel(job.job_id):
         return jsonify({"code": 0, "message": "停止请求已发送"})
     else:
         return jsonify({"code": 1, "message": "当前没有运行的任务"}), 400
-
-
@@ -0,0 +1,65 @@
+from flask import Response, jsonify, request
+
+from app import cache, jobs, metrics
+
+
+def get_cache_stats_api():
+    """
+    返回各 akshare 缓存的命中/未命中等计数
+    """
+    return jsonify({"code": 0, "data": cache.stats(), "message": "获取成功"})
+
+
+def get_metrics_api():
+    """
+    Prometheus 文本格式的计时与计数
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def list_jobs_api():
+    """
+    列出后台任务，可用 type 参数按任务类型过滤
+    """
+    job_type = request.args.get("type")
+    data = [job.to_dict() for job in jobs.get_manager().list(job_type)]
+    return jsonify(
+        {"code": 0, "data": data, "types": list(jobs.JOB_TYPES), "message": "获取成功"}
+    )
+
+
+def get_job_api(job_id):
+    job = jobs.get_manager().get(job_id)
+    if job is None:
+        return jsonify({"code": 1, "message": f"任务不存在: {job_id}"}), 404
+    return jsonify({"code": 0, "data": job.to_dict(), "message": "获取成功"})
+
+
+def start_job_api():
+    """
+    POST JSON: {"type": "history_sync" | "margin_refresh" | "screening", "params": {...}}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        job = jobs.get_manager().start(data.get("type"), data.get("params") or {})
+    except ValueError as e:
+        return jsonify({"code": 1, "message": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"code": 1, "message": str(e)}), 409
+    return jsonify({"code": 0, "data": job.to_dict(), "message": "任务已启动"})
+
+
+def cancel_job_api(job_id):
+    if not jobs.get_manager().cancel(job_id):
+        return jsonify({"code": 1, "message": "任务不存在或未在运行"}), 400
+    return jsonify({"code": 0, "message": "停止请求已发送"})
+
+
+def resume_job_api(job_id):
+    try:
+        job = jobs.get_manager().resume(job_id)
+    except KeyError:
+        return jsonify({"code": 1, "message": f"任务不存在: {job_id}"}), 404
+    except RuntimeError as e:
+        return jsonify({"code": 1, "message": str(e)}), 409
+    return jsonify({"code": 0, "data": job.to_dict(), "message": "任务已从断点继续"})
@@ -0,0 +1,371 @@
+"""
+全市场低价股筛选引擎。
+
+把指定代码区间的日线一次性装载成按 (日期 × 代码) 对齐的价格面板，
+再用 NumPy 在整张面板上一次性计算阶段最低、阶段最高、最新收盘价和距最低点涨幅，
+取代逐个文件读取、逐只计算的循环。
+多个窗口一起筛选时只装载最长窗口的面板，用后缀极值一次算出所有窗口。
+adjust 为 qfq / hfq 时装载面板前先按复权因子换算价格，避免跨除权除息日比较。
+
+并行筛选使用常驻的进程池，子进程由 forkserver 启动：多线程的 Flask 进程中直接 fork，
+子进程可能继承其他线程正持有的锁（metrics、共享面板等）而死锁。
+"""
+
+import multiprocessing
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import adjust_factors, history_store, metrics, shared_panel
+
+PANEL_FIELDS = ("low", "high", "close")
+
+
+class PricePanel:
+    """按 (日期 × 代码) 对齐的价格面板，缺失的交易日用 NaN 填充"""
+
+    def __init__(self, dates, codes, present, fields):
+        self.dates = dates  # datetime64[D]，长度 n_dates
+        self.codes = codes  # 股票代码列表，长度 n_codes
+        self.present = present  # bool 矩阵，该股票当天是否有 K 线
+        self.fields = fields  # {字段名: float64 矩阵 (n_dates × n_codes)}
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def cutoff_for(days, now=None):
+    """与原接口一致：截止时间为当前时刻往前推 days 个自然日"""
+    now = now or datetime.now()
+    return np.datetime64(now - timedelta(days=days), "us")
+
+
+def load_panel(codes, cutoff=None, fields=PANEL_FIELDS, adjust=""):
+    """
+    读取 codes 中每只股票 cutoff（含）之后的 K 线，对齐成一个价格面板。
+    没有缓存或窗口内无数据的股票对应整列 NaN。
+    adjust 为 qfq / hfq 时只对窗口内的 K 线做复权换算。
+    不复权时优先从已发布的共享面板取数，发布后又有变化的股票仍读 history_cache。
+    """
+    shared = None
+    if not adjust and set(fields) <= set(shared_panel.FIELDS):
+        shared = shared_panel.attach()
+    slices = []
+    for code in codes:
+        if shared is not None and shared.is_current(code):
+            slices.append(shared.records(code, cutoff, fields))
+            continue
+        try:
+            records = history_store.read_history(code)
+        except Exception as e:
+            print(f"[面板] 读取 {code} 出错：{e}")
+            records = None
+        if records is None or len(records) == 0:
+            slices.append(None)
+            continue
+        start = (
+            np.searchsorted(records["date"], cutoff, side="left")
+            if cutoff is not None
+            else 0
+        )
+        slices.append(adjust_factors.apply(code, records[start:], adjust))
+
+    non_empty = [s["date"] for s in slices if s is not None and len(s) > 0]
+    dates = (
+        np.unique(np.concatenate(non_empty))
+        if non_empty
+        else np.array([], dtype="M8[D]")
+    )
+
+    shape = (len(dates), len(codes))
+    present = np.zeros(shape, dtype=bool)
+    matrices = {field: np.full(shape, np.nan) for field in fields}
+    for j, window in enumerate(slices):
+        if window is None or len(window) == 0:
+            continue
+        rows = np.searchsorted(dates, window["date"])
+        present[rows, j] = True
+        for field in fields:
+            matrices[field][rows, j] = window[field]
+
+    return PricePanel(dates, list(codes), present, matrices)
+
+
+def window_stats(panel):
+    """
+    在整张面板上一次性计算每只股票的窗口统计量。
+    返回 dict：has_data / min_price / max_price / current_price / distance。
+    """
+    has_data = panel.present.any(axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        min_price = np.nanmin(panel["low"], axis=0) if len(panel.dates) else None
+        max_price = np.nanmax(panel["high"], axis=0) if len(panel.dates) else None
+
+    if min_price is None:
+        empty = np.full(len(panel), np.nan)
+        return {
+            "has_data": has_data,
+            "min_price": empty,
+            "max_price": empty.copy(),
+            "current_price": empty.copy(),
+            "distance": empty.copy(),
+        }
+
+    # 每只股票最后一根 K 线所在的行号
+    last_row = len(panel.dates) - 1 - np.argmax(panel.present[::-1], axis=0)
+    current_price = panel["close"][last_row, np.arange(len(panel))]
+    current_price = np.where(has_data, current_price, np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = (current_price - min_price) / min_price
+
+    return {
+        "has_data": has_data,
+        "min_price": min_price,
+        "max_price": max_price,
+        "current_price": current_price,
+        "distance": distance,
+    }
+
+
+def window_starts(panel, windows, now=None):
+    """每个窗口在面板上的起始行：第一个 `日期 >= cutoff_for(days)` 的交易日"""
+    return {
+        days: int(np.searchsorted(panel.dates, cutoff_for(days, now), side="left"))
+        for days in windows
+    }
+
+
+def multi_window_stats(panel, starts):
+    """
+    在一张覆盖最长窗口的面板上，一次算出所有窗口的统计量。
+    对 low/high 从后往前做累计 fmin/fmax（忽略 NaN，与 nanmin/nanmax 一致），
+    第 r 行即为“从第 r 个交易日到最后”的阶段最低/最高，每个窗口只需取其起始行，
+    总开销与窗口个数基本无关。返回 {days: 与 window_stats 相同结构的 dict}。
+    """
+    n_dates, n_codes = len(panel.dates), len(panel)
+    empty = np.full(n_codes, np.nan)
+    if n_dates == 0:
+        return {
+            days: {
+                "has_data": np.zeros(n_codes, dtype=bool),
+                "min_price": empty,
+                "max_price": empty.copy(),
+                "current_price": empty.copy(),
+                "distance": empty.copy(),
+            }
+            for days in starts
+        }
+
+    suffix_min = np.fmin.accumulate(panel["low"][::-1], axis=0)[::-1]
+    suffix_max = np.fmax.accumulate(panel["high"][::-1], axis=0)[::-1]
+    any_data = panel.present.any(axis=0)
+    last_row = n_dates - 1 - np.argmax(panel.present[::-1], axis=0)
+    current_price = np.where(
+        any_data, panel["close"][last_row, np.arange(n_codes)], np.nan
+    )
+
+    result = {}
+    for days, start in starts.items():
+        if start >= n_dates:
+            has_data = np.zeros(n_codes, dtype=bool)
+            min_price, max_price = empty, empty
+        else:
+            has_data = any_data & (last_row >= start)
+            min_price, max_price = suffix_min[start], suffix_max[start]
+        price = np.where(has_data, current_price, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = (price - min_price) / min_price
+        result[days] = {
+            "has_data": has_data,
+            "min_price": min_price,
+            "max_price": max_price,
+            "current_price": price,
+            "distance": distance,
+        }
+    return result
+
+
+def low_price_mask(stats, threshold):
+    """
+    命中条件：有数据、阶段最低为正，且当前价 <= 阶段最低 * threshold。
+    阶段最低为 0 或负数（异常、停牌的 K 线）的股票直接跳过，不参与计算涨跌幅。
+    """
+    with np.errstate(invalid="ignore"):
+        return (
+            stats["has_data"]
+            & (stats["min_price"] > 0)
+            & (stats["current_price"] <= stats["min_price"] * threshold)
+        )
+
+
+def format_rows(codes, stats, mask, name_map=None):
+    """把命中的股票转换成与 analyze_batch 接口一致的结果行；mask 须来自 low_price_mask"""
+    name_map = name_map or {}
+    rows = []
+    for j in np.flatnonzero(mask):
+        code = codes[j]
+        current_price = float(stats["current_price"][j])
+        min_price = float(stats["min_price"][j])
+        rows.append(
+            {
+                "股票代码": code,
+                "股票名称": name_map.get(code, "未知名称"),
+                "当前价": current_price,
+                "阶段最低": min_price,
+                "阶段最高": float(stats["max_price"][j]),
+                "涨跌幅（%）": f"{(current_price - min_price) / min_price * 100:.2f}%",
+            }
+        )
+    return rows
+
+
+@metrics.timed(metrics.SCREENING_DURATION, engine="panel")
+def screen_low_price(
+    codes, days=180, threshold=1.05, name_map=None, now=None, adjust=""
+):
+    """
+    对 codes 做一次向量化的低价筛选：当前价 <= 阶段最低 * threshold。
+    结果按 codes 的顺序返回，字段与原逐只计算的接口完全一致。
+    """
+    metrics.SCREENING_CODES.inc(len(codes), engine="panel")
+    panel = load_panel(codes, cutoff_for(days, now), adjust=adjust)
+    stats = window_stats(panel)
+    mask = low_price_mask(stats, threshold)
+    print(
+        f"[筛选] {days} 天窗口：{len(codes)} 只股票，{len(panel.dates)} 个交易日，命中 {int(mask.sum())} 只"
+    )
+    return format_rows(panel.codes, stats, mask, name_map)
+
+
+@metrics.timed(metrics.SCREENING_DURATION, engine="multi")
+def screen_windows(codes, windows, name_map=None, now=None, adjust=""):
+    """
+    多窗口低价筛选：windows 为 [(days, threshold), ...]。
+    每只股票的日线只读一次，装成覆盖最长窗口的面板，再用 multi_window_stats 一次算出所有窗口，
+    返回 {days: 结果行}，每个窗口的结果与单独调用 screen_low_price 完全一致。
+    """
+    metrics.SCREENING_CODES.inc(len(codes), engine="multi")
+    now = now or datetime.now()
+    longest = max(days for days, _ in windows)
+    panel = load_panel(codes, cutoff_for(longest, now), adjust=adjust)
+    all_stats = multi_window_stats(
+        panel, window_starts(panel, [days for days, _ in windows], now)
+    )
+    results = {}
+    for days, threshold in windows:
+        mask = low_price_mask(all_stats[days], threshold)
+        results[days] = format_rows(panel.codes, all_stats[days], mask, name_map)
+    print(
+        f"[筛选] {len(windows)} 个窗口（最长 {longest} 天）：{len(codes)} 只股票，"
+        f"命中 {', '.join(f'{days}天 {len(rows)} 只' for days, rows in results.items())}"
+    )
+    return results
+
+
+def _screen_shard(args):
+    """
+    进程池中执行的单个分片。子进程不继承父进程改过的模块状态，
+    缓存目录随分片显式传入，只在子进程里设置。
+    """
+    codes, windows, name_map, now, cache_dir, adjust = args
+    history_store.HISTORY_CACHE_DIR = cache_dir
+    return _screen_serial(codes, windows, name_map, now, adjust)
+
+
+def _screen_serial(codes, windows, name_map, now, adjust):
+    if len(windows) == 1:
+        days, threshold = windows[0]
+        return {
+            days: screen_low_price(
+                codes, days, threshold, name_map=name_map, now=now, adjust=adjust
+            )
+        }
+    return screen_windows(codes, windows, name_map=name_map, now=now, adjust=adjust)
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """
+    返回 workers 个进程的常驻进程池，进程数变化或池已损坏时重建。
+    旧池不等待即关闭，已提交的分片仍会执行完。
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        broken = _pool is not None and getattr(_pool, "_broken", False)
+        if _pool is None or _pool_workers != workers or broken:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["app.screener"])
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def resolve_workers(workers):
+    """workers <= 0 表示使用全部 CPU 核心"""
+    workers = 1 if workers is None else int(workers)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def screen_windows_parallel(
+    codes, windows, name_map=None, workers=0, now=None, adjust=""
+):
+    """
+    把有序的代码列表切成连续分片，交给进程池并行做多窗口筛选，再按分片顺序合并。
+    所有分片共用同一个 now，结果与串行的 screen_windows 完全一致。
+    """
+    workers = min(resolve_workers(workers), len(codes))
+    now = now or datetime.now()
+    if workers <= 1:
+        return _screen_serial(codes, windows, name_map, now, adjust)
+
+    shard_size = -(-len(codes) // workers)
+    shards = [
+        (
+            codes[i : i + shard_size],
+            windows,
+            name_map,
+            now,
+            history_store.HISTORY_CACHE_DIR,
+            adjust,
+        )
+        for i in range(0, len(codes), shard_size)
+    ]
+    results = {days: [] for days, _ in windows}
+    metrics.SCREENING_CODES.inc(len(codes), engine="parallel")
+    with metrics.SCREENING_DURATION.time(engine="parallel"):
+        # executor.map 按提交顺序返回，保证合并结果的顺序确定
+        for shard_results in get_pool(workers).map(_screen_shard, shards):
+            for days, rows in shard_results.items():
+                results[days].extend(rows)
+    return results
+
+
+def screen_low_price_parallel(
+    codes, days=180, threshold=1.05, name_map=None, workers=0, now=None, adjust=""
+):
+    """单窗口版本的 screen_windows_parallel"""
+    return screen_windows_parallel(
+        codes,
+        [(days, threshold)],
+        name_map=name_map,
+        workers=workers,
+        now=now,
+        adjust=adjust,
+    )[days]
@@ -0,0 +1,186 @@
+"""
+大 DataFrame 响应的快速 JSON 序列化。
+
+原来的路径是 applymap(normalize) / to_native_types 逐格转换 -> to_dict(orient="records")
+-> jsonify，每个单元格都要生成 Python 对象。这里改为由 pandas 内置的 C 编码器
+（DataFrame.to_json）直接把整张表编码成 JSON 文本，再拼接进响应外层的字典。
+
+响应中需要放 DataFrame 的位置用 Frame(df) 包一层：
+
+    return json_response({"code": 0, "count": len(df), "data": Frame(df, response_format())})
+
+Frame 支持两种格式：
+- "records"（默认）：[{列: 值, ...}, ...]，与原来的 to_dict(orient="records") 一致；
+- "columns"（可选）：{"columns": [...], "rows": [[...], ...]}，列名只出现一次，体积更小。
+NaN/None 统一输出为 null，日期时间输出为 ISO 字符串。
+
+批量查询接口另外支持两种读法（见 page_request / ndjson_response）：
+- 游标分页：传 limit（可选 cursor），响应带 next_cursor，为 null 表示已到末尾；
+  游标里带有数据源版本号，数据源变化后旧游标返回 400，避免翻页错位；
+- NDJSON 流式：format=ndjson 时按块读取、逐行输出，每行一条记录，
+  客户端可以边收边渲染，服务端内存不随结果大小增长。
+"""
+
+import base64
+import json
+import os
+import uuid
+
+import pandas as pd
+from flask import Response, request
+
+from app import metrics
+
+FORMATS = ("records", "columns")
+NDJSON = "ndjson"
+
+# 单页最大行数与流式输出的块大小
+MAX_PAGE_SIZE = 5000
+CHUNK_SIZE = 2000
+
+# double_precision 默认只有 10 位小数，会截断两融余额、小比例等数值；15 为 pandas 允许的上限
+JSON_OPTIONS = {
+    "double_precision": 15,
+    "force_ascii": False,
+    "date_format": "iso",
+    "date_unit": "s",
+    "default_handler": str,
+}
+
+
+class Frame:
+    """标记响应中需要由 pandas 直接序列化的 DataFrame"""
+
+    def __init__(self, df, fmt="records"):
+        self.df = df
+        self.fmt = fmt if fmt in FORMATS else "records"
+
+    def to_json(self):
+        if self.fmt == "columns":
+            columns = json.dumps([str(c) for c in self.df.columns], ensure_ascii=False)
+            rows = self.df.to_json(orient="values", **JSON_OPTIONS)
+            return f'{{"columns": {columns}, "rows": {rows}}}'
+        return self.df.to_json(orient="records", **JSON_OPTIONS)
+
+
+def request_param(name, default=None):
+    """依次从查询参数、JSON 请求体读取参数"""
+    value = request.args.get(name)
+    if value is None and request.is_json:
+        value = (request.get_json(silent=True) or {}).get(name)
+    return default if value is None else value
+
+
+def response_format():
+    """从查询参数或 JSON 请求体的 format 字段读取响应格式，默认 records"""
+    fmt = request_param("format")
+    return fmt if fmt in FORMATS else "records"
+
+
+def wants_ndjson():
+    return (
+        request_param("format") == NDJSON
+        or request.accept_mimetypes.best == "application/x-ndjson"
+    )
+
+
+def to_json_text(payload):
+    """序列化任意嵌套的 dict/list，其中的 Frame 由 pandas 直接编码后原样拼接"""
+    frames = {}
+
+    def default(obj):
+        if isinstance(obj, Frame):
+            token = f"__frame_{uuid.uuid4().hex}__"
+            frames[token] = obj
+            return token
+        if hasattr(obj, "item"):
+            # numpy 标量
+            return obj.item()
+        return str(obj)
+
+    text = json.dumps(payload, ensure_ascii=False, default=default)
+    for token, frame in frames.items():
+        text = text.replace(f'"{token}"', frame.to_json(), 1)
+    return text
+
+
+def json_response(payload, status=200):
+    with metrics.SERIALIZATION_DURATION.time(format="json"):
+        text = to_json_text(payload)
+    return Response(text, status=status, mimetype="application/json")
+
+
+def encode_cursor(offset, version):
+    raw = json.dumps({"o": offset, "v": version}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor, version):
+    """解析游标，返回起始行号；游标非法或数据源版本已变化时抛出 ValueError"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = int(payload["o"])
+    except Exception:
+        raise ValueError("cursor 参数非法")
+    if payload.get("v") != version or offset < 0:
+        raise ValueError("数据已更新，请从第一页重新查询")
+    return offset
+
+
+def page_request(version):
+    """
+    读取 limit / cursor 参数。未传 limit 时返回 None（不分页，保持原有响应），
+    否则返回 (offset, limit)。参数非法时抛出 ValueError。
+    """
+    limit = request_param("limit")
+    if limit is None:
+        return None
+    limit = int(limit)
+    if limit <= 0:
+        raise ValueError("limit 必须为正整数")
+    cursor = request_param("cursor")
+    offset = decode_cursor(cursor, version) if cursor else 0
+    return offset, min(limit, MAX_PAGE_SIZE)
+
+
+def next_cursor(offset, limit, has_more, version):
+    return encode_cursor(offset + limit, version) if has_more else None
+
+
+def file_version(path):
+    """以文件的 (大小, 修改时间) 作为数据源版本号"""
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def read_csv_page(path, offset, limit, **kwargs):
+    """
+    只解析 CSV 中 [offset, offset + limit) 的数据行，返回 (df, has_more)。
+    多读一行用于判断后面是否还有数据。
+    """
+    df = pd.read_csv(path, skiprows=range(1, offset + 1), nrows=limit + 1, **kwargs)
+    return df.iloc[:limit], len(df) > limit
+
+
+def iter_csv_chunks(path, chunksize=CHUNK_SIZE, **kwargs):
+    with pd.read_csv(path, chunksize=chunksize, **kwargs) as reader:
+        yield from reader
+
+
+def iter_frame_chunks(df, chunksize=CHUNK_SIZE):
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start : start + chunksize]
+
+
+def ndjson_response(chunks):
+    """把 DataFrame 块的迭代器逐块编码为 NDJSON 流式响应"""
+
+    def generate():
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            with metrics.SERIALIZATION_DURATION.time(format="ndjson"):
+                text = chunk.to_json(orient="records", lines=True, **JSON_OPTIONS)
+            yield text.rstrip("\n") + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
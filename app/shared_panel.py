@@ -0,0 +1,280 @@
+"""
+多个服务进程共享的只读价格面板。
+
+把 history_cache 中全部股票的日线按代码拼接成紧凑的列式文件，发布在
+``history_cache/_panel/{版本}/`` 下，各进程以只读内存映射打开，共用操作系统的页缓存：
+- codes.npy：升序的股票代码；offsets.npy：第 i 只股票的行为 [offsets[i], offsets[i + 1])；
+- dates.npy：日期轴（所有股票出现过的交易日，升序）；day.npy：每行在日期轴上的下标（int32）；
+- open / high / low / close / volume.npy：float64 列，与 history_cache 的精度一致；
+- size.npy / mtime.npy：发布时每只股票 .npy 的文件戳；meta.json：版本、生成时间、行数。
+
+发布在 ``_panel/.lock`` 上持有 fcntl 文件锁，多个进程同时发布时依次进行。
+写入方先在临时目录（名称带进程号）写好全部文件，重命名为版本目录，再用 os.replace 原子替换
+``_panel/CURRENT`` 中的版本号；读取方每次使用前读 CURRENT，版本变化时重新映射，
+附着只需打开十来个文件，不读取数据。旧版本只保留 KEEP_VERSIONS 个，
+已经映射旧版本的进程在 POSIX 上删除后仍可继续读取。
+
+文件戳与发布时不同的股票（发布后又同步过）由调用方回退为直接读 history_cache。
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app import history_store
+
+FIELDS = ("open", "high", "low", "close", "volume")
+KEEP_VERSIONS = 2
+# 超过该时长（秒）仍未完成的临时目录视为发布进程已退出的残留
+STALE_TMP_SECONDS = 3600
+
+
+def panel_dir():
+    return os.path.join(history_store.HISTORY_CACHE_DIR, "_panel")
+
+
+def current_path():
+    return os.path.join(panel_dir(), "CURRENT")
+
+
+def _file_stamp(code):
+    try:
+        st = os.stat(history_store.history_path(code))
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class SharedPanel:
+    """一个已发布版本的只读映射"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.version = self.meta["version"]
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        self.codes = load("codes")
+        self.offsets = load("offsets")
+        self.dates = load("dates")
+        self.day = load("day")
+        self.size = load("size")
+        self.mtime = load("mtime")
+        self.columns = {field: load(field) for field in FIELDS}
+        self.index = {str(code): i for i, code in enumerate(self.codes)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def is_current(self, code):
+        """该股票在面板中，且 .npy 自发布以来没有变化"""
+        i = self.index.get(code)
+        if i is None:
+            return False
+        return _file_stamp(code) == (int(self.size[i]), int(self.mtime[i]))
+
+    def records(self, code, cutoff=None, fields=FIELDS):
+        """
+        单只股票 cutoff（含）之后的 K 线，返回只含 date 与 fields 的结构化数组；
+        不在面板中时返回 None。
+        """
+        i = self.index.get(code)
+        if i is None:
+            return None
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        if cutoff is not None:
+            first = np.searchsorted(self.dates, cutoff, side="left")
+            lo += int(np.searchsorted(self.day[lo:hi], first, side="left"))
+        out = np.empty(
+            hi - lo, dtype=[("date", "M8[D]")] + [(field, "f8") for field in fields]
+        )
+        out["date"] = self.dates[self.day[lo:hi]]
+        for field in fields:
+            out[field] = self.columns[field][lo:hi]
+        return out
+
+
+_attached = None
+_attach_lock = threading.Lock()
+
+
+def read_current():
+    try:
+        with open(current_path(), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def attach():
+    """返回当前发布版本的映射，没有发布过时返回 None；版本变化后自动重新映射"""
+    global _attached
+    version = read_current()
+    if version is None:
+        return None
+    if _attached is not None and _attached.version == version:
+        return _attached
+    with _attach_lock:
+        if _attached is None or _attached.version != version:
+            try:
+                _attached = SharedPanel(os.path.join(panel_dir(), version))
+            except (FileNotFoundError, KeyError, ValueError) as e:
+                print(f"[共享面板] 映射版本 {version} 失败：{e}")
+                return _attached
+        return _attached
+
+
+def _is_abandoned(name, now):
+    """临时目录属于本进程（之前失败的发布），或超过 STALE_TMP_SECONDS 没有完成"""
+    if name.endswith(f".{os.getpid()}.tmp"):
+        return True
+    try:
+        mtime = os.stat(os.path.join(panel_dir(), name)).st_mtime
+    except FileNotFoundError:
+        return False
+    return now - mtime > STALE_TMP_SECONDS
+
+
+def _cleanup(keep):
+    """删除 keep 之外的旧版本，以及已被放弃的临时目录；调用方需持有发布锁"""
+    versions = sorted(
+        name
+        for name in os.listdir(panel_dir())
+        if os.path.isdir(os.path.join(panel_dir(), name))
+    )
+    now = time.time()
+    finished = [name for name in versions if not name.endswith(".tmp")]
+    stale = [
+        name for name in versions if name.endswith(".tmp") and _is_abandoned(name, now)
+    ]
+    stale += [name for name in finished[:-KEEP_VERSIONS] if name != keep]
+    for name in stale:
+        shutil.rmtree(os.path.join(panel_dir(), name), ignore_errors=True)
+
+
+def publish(codes=None):
+    """
+    从 history_cache 生成新版本并原子发布，返回 meta。
+    先只读日期列统计行数和日期轴，再预分配内存映射文件逐只写入，内存占用与股票数无关。
+    发布期间持有 ``_panel/.lock`` 的文件锁，其他进程或线程的发布会等待。
+    """
+    os.makedirs(panel_dir(), exist_ok=True)
+    with open(os.path.join(panel_dir(), ".lock"), "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            return _publish(codes)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _publish(codes):
+    started = time.perf_counter()
+    codes = sorted(codes if codes is not None else history_store.list_codes())
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    tmp_dir = os.path.join(panel_dir(), f"{version}.{os.getpid()}.tmp")
+    os.makedirs(tmp_dir)
+    try:
+        meta = _write_version(tmp_dir, version, codes)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # 版本目录就位后再切换 CURRENT，读取方不会看到写了一半的版本
+    os.rename(tmp_dir, os.path.join(panel_dir(), version))
+    tmp_current = f"{current_path()}.{os.getpid()}.tmp"
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_current, current_path())
+    _cleanup(version)
+
+    meta["elapsed"] = round(time.perf_counter() - started, 3)
+    print(
+        f"[共享面板] 发布版本 {version}：{len(codes)} 只股票，{meta['rows']} 行，耗时 {meta['elapsed']}s"
+    )
+    return meta
+
+
+def _write_version(tmp_dir, version, codes):
+    """在 tmp_dir 中写好一个版本的全部文件，返回 meta"""
+    # 第一遍：文件戳、行数，以及按天编号的日期位图
+    stamps, lengths = [], []
+    seen = np.zeros(0, dtype=bool)
+    for code in codes:
+        stamp = _file_stamp(code)
+        records = history_store.read_history(code) if stamp is not None else None
+        if records is None:
+            stamps.append((-1, -1))
+            lengths.append(0)
+            continue
+        days = records["date"].astype(np.int64)
+        if len(days) and days[-1] >= len(seen):
+            seen = np.concatenate([seen, np.zeros(days[-1] + 1 - len(seen), bool)])
+        seen[days] = True
+        stamps.append(stamp)
+        lengths.append(len(records))
+    dates = np.flatnonzero(seen).astype("M8[D]")
+    position = np.cumsum(seen, dtype=np.int64) - 1  # 天编号 -> 日期轴下标
+
+    offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    rows = int(offsets[-1])
+
+    def create(name, dtype):
+        return np.lib.format.open_memmap(
+            os.path.join(tmp_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=(rows,)
+        )
+
+    # 第二遍：逐只写入列文件
+    day = create("day", np.int32)
+    columns = {field: create(field, np.float64) for field in FIELDS}
+    for i, code in enumerate(codes):
+        if lengths[i] == 0:
+            continue
+        records = history_store.read_history(code)[: lengths[i]]
+        if len(records) < lengths[i]:
+            # 两遍之间文件被整体重写变短：这一段不完整，标记为过期，读取时回退到文件
+            stamps[i] = (-1, -1)
+        lo = offsets[i]
+        hi = lo + len(records)
+        day[lo:hi] = position[records["date"].astype(np.int64)]
+        for field in FIELDS:
+            columns[field][lo:hi] = records[field]
+    for array in (day, *columns.values()):
+        array.flush()
+    del day, columns
+
+    stamps = np.array(stamps, dtype=np.int64).reshape(-1, 2)
+    np.save(os.path.join(tmp_dir, "codes.npy"), np.array(codes, dtype=str))
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "dates.npy"), dates)
+    np.save(os.path.join(tmp_dir, "size.npy"), stamps[:, 0])
+    np.save(os.path.join(tmp_dir, "mtime.npy"), stamps[:, 1])
+    meta = {
+        "version": version,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "codes": len(codes),
+        "rows": rows,
+        "dates": len(dates),
+        "fields": list(FIELDS),
+        "bytes": rows * (4 + 8 * len(FIELDS)),
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "publish":
+        publish()
+    else:
+        print("用法: python -m app.shared_panel publish")
@@ -0,0 +1,294 @@
+"""
+history_cache 的同步清单。
+
+``history_cache/_manifest.json`` 为每只股票记录一条：
+- last_date / rows：最后一根 K 线日期和行数；
+- checksum：数据区的 CRC32，追加时在旧值基础上增量计算；
+- synced_at：最近一次写入或向上游确认的时间；
+- checked_through：最近一次向上游确认"已无更多数据"的交易日（停牌股不会每次都重新请求）；
+- size / mtime：计算时 .npy 的文件戳；
+- changed：最近一次数据变化（写入、追加、从文件重算）的变更序号。
+
+变更序号单调递增，取纳秒时间戳，清单丢失重建后也大于之前记下的序号。
+低价筛选结果记录筛选时的序号，增量重新筛选只需处理 changed_since() 返回的股票。
+
+history_store 的所有写入路径（整体写入、追加、CSV 迁移）都会更新清单；
+文件戳对不上的条目（进程中途退出、外部改写等）在使用时从文件重算。
+全量同步开始前用 split() 一次性算出需要更新的代码，已是最新的股票既不打开文件，也不请求上游。
+
+多个服务进程各有一份内存中的清单。落盘时持有 ``_manifest.json.lock`` 的 fcntl 文件锁，
+先读入磁盘上的清单，只覆盖本进程改过的条目，其余条目（其他进程写入的）并回内存，
+不会出现后写的进程丢掉别人的条目、增量重新筛选漏掉变化股票的情况。
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from app import history_store, trade_calendar
+
+
+def manifest_path():
+    return os.path.join(history_store.HISTORY_CACHE_DIR, "_manifest.json")
+
+
+def file_stamp(code):
+    try:
+        st = os.stat(history_store.history_path(code))
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def target_date(now=None):
+    """最近一个已收盘的交易日（YYYY-MM-DD）；交易日历不可用时退回今天"""
+    now = now or datetime.now()
+    try:
+        day = trade_calendar.get_calendar().latest_closed(now)
+    except Exception as e:
+        print(f"[同步清单] 获取交易日历失败，以今天为目标日期：{e}")
+        day = None
+    if day is None:
+        return now.strftime("%Y-%m-%d")
+    return f"{day[:4]}-{day[4:6]}-{day[6:]}"
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _last_date(records):
+    return str(records["date"][-1]) if len(records) else None
+
+
+class Manifest:
+    def __init__(self):
+        self.entries = {}
+        self.dirty = False
+        self.touched = set()  # 上次落盘以来本进程写入或删除的代码
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.entries = self._read() or {}
+        self.seq = max(
+            (entry.get("changed", 0) for entry in self.entries.values()), default=0
+        )
+
+    def _read(self):
+        path = manifest_path()
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[同步清单] 读取失败，将按需重建：{e}")
+            return None
+
+    def _put(self, code, entry, changed=False):
+        with self.lock:
+            if changed:
+                self.seq = max(self.seq + 1, time.time_ns())
+                entry["changed"] = self.seq
+            self.entries[code] = entry
+            self.touched.add(code)
+            self.dirty = True
+        return entry
+
+    def on_saved(self, code, records):
+        """整体写入（首次保存、CSV 迁移、追加失败后的重写）后调用"""
+        stamp = file_stamp(code)
+        return self._put(
+            code,
+            {
+                "last_date": _last_date(records),
+                "rows": len(records),
+                "checksum": zlib.crc32(records.tobytes()),
+                "synced_at": _now(),
+                "checked_through": None,
+                "size": stamp[0],
+                "mtime": stamp[1],
+            },
+            changed=True,
+        )
+
+    def on_appended(self, code, stamp_before, records):
+        """
+        原地追加后调用：追加前的文件戳与条目一致时增量更新行数和校验和，
+        否则说明条目已过期，从文件整体重算。
+        """
+        entry = self.entries.get(code)
+        if entry is None or (entry["size"], entry["mtime"]) != stamp_before:
+            return self.rescan(code)
+        stamp = file_stamp(code)
+        return self._put(
+            code,
+            {
+                **entry,
+                "last_date": _last_date(records),
+                "rows": entry["rows"] + len(records),
+                "checksum": zlib.crc32(records.tobytes(), entry["checksum"]),
+                "synced_at": _now(),
+                "size": stamp[0],
+                "mtime": stamp[1],
+            },
+            changed=True,
+        )
+
+    def rescan(self, code):
+        """从 .npy 文件重算条目，文件不存在时删除条目并返回 None"""
+        records = history_store.read_history(code)
+        if records is None:
+            with self.lock:
+                if self.entries.pop(code, None) is not None:
+                    self.touched.add(code)
+                    self.dirty = True
+            return None
+        entry = self.entries.get(code) or {}
+        stamp = file_stamp(code)
+        return self._put(
+            code,
+            {
+                "last_date": _last_date(records),
+                "rows": len(records),
+                "checksum": zlib.crc32(records.tobytes()),
+                "synced_at": entry.get("synced_at") or _now(),
+                "checked_through": None,
+                "size": stamp[0],
+                "mtime": stamp[1],
+            },
+            changed=True,
+        )
+
+    def get(self, code):
+        """返回与文件一致的条目；没有 .npy 时返回 None"""
+        stamp = file_stamp(code)
+        if stamp is None:
+            return None
+        entry = self.entries.get(code)
+        if entry is not None and (entry["size"], entry["mtime"]) == stamp:
+            return entry
+        return self.rescan(code)
+
+    def mark_checked(self, code, through):
+        """记录已向上游确认到 through（YYYY-MM-DD）为止没有更多数据"""
+        entry = self.get(code)
+        if entry is not None:
+            self._put(code, {**entry, "checked_through": through, "synced_at": _now()})
+
+    def is_current(self, entry, target):
+        if entry is None:
+            return False
+        reached = max(entry["last_date"] or "", entry["checked_through"] or "")
+        return reached >= target
+
+    def split(self, codes, target):
+        """按清单把 codes 分成 (需要更新, 已是最新) 两组，保持原有顺序"""
+        stale, current = [], []
+        for code in codes:
+            (current if self.is_current(self.get(code), target) else stale).append(code)
+        return stale, current
+
+    def refresh(self, codes):
+        """让 codes 的条目都与文件一致：文件戳对不上或缺失的条目从文件重算"""
+        for code in codes:
+            self.get(code)
+
+    def changed_since(self, seq, codes):
+        """codes 中变更序号大于 seq 的股票（文件戳对不上的先重算，也算作有变化），保持原有顺序"""
+        changed = []
+        for code in codes:
+            entry = self.get(code)
+            if entry is not None and entry.get("changed", 0) > seq:
+                changed.append(code)
+        return changed
+
+    def verify(self, code):
+        """重新计算文件的校验和并与清单比较"""
+        entry = self.get(code)
+        records = history_store.read_history(code)
+        if entry is None or records is None:
+            return entry is None and records is None
+        return zlib.crc32(records.tobytes()) == entry["checksum"]
+
+    def save(self):
+        """
+        在文件锁内与磁盘上的清单合并后写回：本进程改过的条目覆盖磁盘，
+        其余条目以磁盘为准并同步回内存，变更序号取两者的最大值。
+        """
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                touched = {code: self.entries.get(code) for code in self.touched}
+                self.touched = set()
+                self.dirty = False
+            path = manifest_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                with open(f"{path}.lock", "a+") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        payload = self._read() or {}
+                        for code, entry in touched.items():
+                            if entry is None:
+                                payload.pop(code, None)
+                            else:
+                                payload[code] = entry
+                        tmp_path = f"{path}.{os.getpid()}.tmp"
+                        with open(tmp_path, "w", encoding="utf-8") as f:
+                            json.dump(
+                                payload, f, ensure_ascii=False, separators=(",", ":")
+                            )
+                        os.replace(tmp_path, path)
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            except Exception:
+                with self.lock:
+                    self.touched |= set(touched)
+                    self.dirty = True
+                raise
+            with self.lock:
+                # 落盘期间本进程又改过的条目以内存为准
+                for code, entry in payload.items():
+                    if code not in self.touched:
+                        self.entries[code] = entry
+                for code in set(self.entries) - set(payload) - self.touched:
+                    del self.entries[code]
+                self.seq = max(
+                    [self.seq] + [entry.get("changed", 0) for entry in payload.values()]
+                )
+
+
+_manifest = None
+_lock = threading.Lock()
+
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        with _lock:
+            if _manifest is None:
+                _manifest = Manifest()
+    return _manifest
+
+
+def watermark(code):
+    """
+    与 history_store.get_watermark 相同的返回值，优先取清单中的条目；
+    只有旧 CSV 缓存时先迁移为 .npy（迁移本身会写入清单）。
+    """
+    entry = get_manifest().get(code)
+    if entry is None:
+        return history_store.get_watermark(code)
+    return {"last_date": entry["last_date"], "rows": entry["rows"]}
+
+
+def flush():
+    try:
+        get_manifest().save()
+    except Exception as e:
+        print(f"[同步清单] 保存失败：{e}")
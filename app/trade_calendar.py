@@ -0,0 +1,229 @@
+"""
+交易日历的懒加载与本地缓存。
+
+交易日历在首次使用时才加载：优先读 ``stocks_info/trade_dates.csv``，
+缓存超过 REFRESH_AFTER 或已不覆盖今天时才请求 ak.tool_trade_date_hist_sina() 刷新；
+刷新失败时退回使用旧缓存，保证离线也能启动和工作。
+进程内的交易日列表每隔 RECHECK_AFTER 按同样的策略在后台线程中重新检查，
+检查期间请求照常使用进程内缓存，长期运行的进程也会刷新而不会在请求线程里等待上游。
+create_app() 会在后台线程中预热，请求线程不必等待网络。
+
+查询统一通过 TradeCalendar：在升序的交易日列表上二分查找，
+是否交易日、前后一个交易日、区间内的交易日、最近 N 个交易日都是 O(log n)。
+"""
+
+import bisect
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import akshare as ak
+import pandas as pd
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+TRADE_DATES_PATH = os.path.join(BASE_DIR, "stocks_info", "trade_dates.csv")
+
+# 本地缓存的最长有效期（秒）
+REFRESH_AFTER = 7 * 24 * 3600
+
+# 进程内缓存重新检查刷新策略的间隔（秒）；检查只读本地缓存，过期时才请求上游
+RECHECK_AFTER = 3600
+
+# 交易日该时刻之后，当天的日线才视为完整
+MARKET_CLOSE = "15:00"
+
+_trade_dates = None
+_calendar = None
+_checked_at = 0.0
+_rechecking = False
+_lock = threading.Lock()
+
+
+def to_key(day):
+    """把 YYYYMMDD / YYYY-MM-DD 字符串、date、datetime、Timestamp 统一为 YYYYMMDD"""
+    if isinstance(day, (date, datetime)):
+        return day.strftime("%Y%m%d")
+    return str(day).replace("-", "")[:8]
+
+
+class TradeCalendar:
+    """升序交易日列表（YYYYMMDD）上的二分查找，返回的日期均为 YYYYMMDD 字符串"""
+
+    def __init__(self, dates):
+        self.dates = dates
+
+    def __len__(self):
+        return len(self.dates)
+
+    def is_trading_day(self, day):
+        key = to_key(day)
+        i = bisect.bisect_left(self.dates, key)
+        return i < len(self.dates) and self.dates[i] == key
+
+    def previous_trading_day(self, day, inclusive=False):
+        """day 之前（inclusive 时含 day）的最后一个交易日，没有时返回 None"""
+        bisector = bisect.bisect_right if inclusive else bisect.bisect_left
+        i = bisector(self.dates, to_key(day))
+        return self.dates[i - 1] if i else None
+
+    def next_trading_day(self, day, inclusive=False):
+        """day 之后（inclusive 时含 day）的第一个交易日，没有时返回 None"""
+        bisector = bisect.bisect_left if inclusive else bisect.bisect_right
+        i = bisector(self.dates, to_key(day))
+        return self.dates[i] if i < len(self.dates) else None
+
+    def _span(self, start, end):
+        lo = bisect.bisect_left(self.dates, to_key(start))
+        hi = bisect.bisect_right(self.dates, to_key(end))
+        return lo, max(lo, hi)
+
+    def trading_days_between(self, start, end):
+        """[start, end] 闭区间内的交易日"""
+        lo, hi = self._span(start, end)
+        return self.dates[lo:hi]
+
+    def count_between(self, start, end):
+        """[start, end] 闭区间内的交易日个数"""
+        lo, hi = self._span(start, end)
+        return hi - lo
+
+    def last_n(self, n, until=None):
+        """截至 until（含，默认今天）的最近 n 个交易日，升序"""
+        hi = bisect.bisect_right(self.dates, to_key(until or datetime.now()))
+        return self.dates[max(0, hi - n) : hi]
+
+    def latest_closed(self, now=None):
+        """最近一个已收盘的交易日；今天是交易日但还没到 MARKET_CLOSE 时取前一个交易日"""
+        now = now or datetime.now()
+        if now.strftime("%H:%M") < MARKET_CLOSE:
+            return self.previous_trading_day(now)
+        return self.previous_trading_day(now, inclusive=True)
+
+
+def _read_cache():
+    if not os.path.exists(TRADE_DATES_PATH):
+        return None
+    try:
+        df = pd.read_csv(TRADE_DATES_PATH, dtype=str)
+        return df["trade_date"].tolist()
+    except Exception as e:
+        print(f"[交易日历] 读取本地缓存失败：{e}")
+        return None
+
+
+def _fetch_and_cache():
+    df = ak.tool_trade_date_hist_sina()
+    # 确保转换为 datetime
+    df["trade_date"] = pd.to_datetime(df["trade_date"], errors="coerce")
+    dates = df["trade_date"].dropna().dt.strftime("%Y%m%d").tolist()
+    os.makedirs(os.path.dirname(TRADE_DATES_PATH), exist_ok=True)
+    tmp_path = f"{TRADE_DATES_PATH}.tmp"
+    pd.DataFrame({"trade_date": dates}).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, TRADE_DATES_PATH)
+    print(f"[交易日历] 已刷新并缓存 {len(dates)} 个交易日")
+    return dates
+
+
+def _is_stale(dates):
+    if not dates:
+        return True
+    if dates[-1] < datetime.now().strftime("%Y%m%d"):
+        return True
+    return time.time() - os.path.getmtime(TRADE_DATES_PATH) > REFRESH_AFTER
+
+
+def load_trade_dates(force_refresh=False):
+    """按刷新策略加载交易日列表（升序的 YYYYMMDD 字符串）"""
+    dates = _read_cache()
+    if force_refresh or _is_stale(dates):
+        try:
+            return _fetch_and_cache()
+        except Exception as e:
+            if not dates:
+                raise
+            print(f"[交易日历] 刷新失败，继续使用本地缓存：{e}")
+    return dates
+
+
+def _recheck_due():
+    return _trade_dates is None or time.monotonic() - _checked_at > RECHECK_AFTER
+
+
+def _recheck():
+    """按刷新策略重新加载交易日列表；内容没有变化时保持原列表，TradeCalendar 不必重建"""
+    global _trade_dates, _checked_at, _rechecking
+    try:
+        dates = load_trade_dates()
+    except Exception as e:
+        print(f"[交易日历] 重新检查失败，继续使用进程内缓存：{e}")
+        dates = _trade_dates
+    with _lock:
+        if dates != _trade_dates:
+            _trade_dates = dates
+        _checked_at = time.monotonic()
+        _rechecking = False
+
+
+def get_trade_dates():
+    """
+    返回交易日列表。首次调用时同步加载，之后复用进程内缓存；
+    每隔 RECHECK_AFTER 启动一个后台线程重新检查，当前请求直接返回缓存的列表。
+    """
+    global _trade_dates, _checked_at, _rechecking
+    if _trade_dates is None:
+        with _lock:
+            if _trade_dates is None:
+                _trade_dates = load_trade_dates()
+                _checked_at = time.monotonic()
+        return _trade_dates
+    if _recheck_due():
+        with _lock:
+            start = _recheck_due() and not _rechecking
+            if start:
+                _rechecking = True
+        if start:
+            threading.Thread(
+                target=_recheck, name="trade-calendar-recheck", daemon=True
+            ).start()
+    return _trade_dates
+
+
+def get_calendar():
+    """当前交易日列表上的 TradeCalendar，交易日历刷新后自动重建"""
+    global _calendar
+    dates = get_trade_dates()
+    calendar = _calendar
+    if calendar is None or calendar.dates is not dates:
+        calendar = _calendar = TradeCalendar(dates)
+    return calendar
+
+
+def refresh():
+    """强制从上游刷新交易日历"""
+    global _trade_dates, _checked_at
+    dates = load_trade_dates(force_refresh=True)
+    with _lock:
+        _trade_dates = dates
+        _checked_at = time.monotonic()
+    return dates
+
+
+def get_recent_trade_dates(days=30):
+    """截至今天（含）的最近 days 个交易日，升序的 YYYYMMDD 列表"""
+    return get_calendar().last_n(days)
+
+
+def warm_up(*loaders):
+    """在后台线程中预热交易日历及其他懒加载数据，失败只打印日志"""
+
+    def run():
+        for loader in (get_trade_dates,) + loaders:
+            try:
+                loader()
+            except Exception as e:
+                print(f"[预热] {getattr(loader, '__name__', loader)} 失败：{e}")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,142 @@
+"""
+进程内的关注列表。
+
+关注列表在首次使用时从 stocks_info/watched_stocks.csv 读入内存（按代码去重，保留先加入的），
+之后的增删查都只操作内存中的有序字典，O(1) 且在锁内完成，并发请求不会互相覆盖。
+
+写盘采用 write-behind：修改后唤醒后台线程，合并 WRITE_DELAY 秒内的多次修改，
+写入临时文件再 os.replace 原子替换，文件格式与原来一致（股票代码、股票名称，utf-8-sig）。
+进程退出时会把尚未落盘的修改写完。
+"""
+
+import atexit
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+WATCHLIST_FILE = os.path.join(BASE_DIR, "stocks_info", "watched_stocks.csv")
+
+# 合并写盘的等待时间（秒）
+WRITE_DELAY = 0.5
+
+COLUMNS = ["股票代码", "股票名称"]
+
+
+class Watchlist:
+    def __init__(self, path=WATCHLIST_FILE):
+        self.path = path
+        self.stocks = OrderedDict()  # 代码 -> 名称
+        self.lock = threading.Lock()
+        self.version = 0
+        self.saved_version = 0
+        self.wakeup = threading.Event()
+        self.write_lock = threading.Lock()
+        self.writer = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        df = pd.read_csv(self.path, dtype=str, encoding="utf-8-sig")
+        if "股票代码" not in df.columns:
+            return
+        names = df["股票名称"] if "股票名称" in df.columns else [None] * len(df)
+        for code, name in zip(df["股票代码"], names):
+            if isinstance(code, str) and code not in self.stocks:
+                self.stocks[code] = name if isinstance(name, str) else "未知名称"
+
+    def add(self, items):
+        """批量添加 [(代码, 名称), ...]，返回 (新增的代码, 已存在的代码)"""
+        added, existing = [], []
+        with self.lock:
+            for code, name in items:
+                if code in self.stocks:
+                    existing.append(code)
+                else:
+                    self.stocks[code] = name or "未知名称"
+                    added.append(code)
+            if added:
+                self._changed()
+        return added, existing
+
+    def remove(self, codes):
+        """批量移除，返回 (移除的代码, 不在列表中的代码)"""
+        removed, missing = [], []
+        with self.lock:
+            for code in codes:
+                if self.stocks.pop(code, None) is None:
+                    missing.append(code)
+                else:
+                    removed.append(code)
+            if removed:
+                self._changed()
+        return removed, missing
+
+    def __contains__(self, code):
+        return code in self.stocks
+
+    def __len__(self):
+        return len(self.stocks)
+
+    def items(self):
+        """按加入顺序返回 [{"股票代码":..., "股票名称":...}, ...] 的快照"""
+        with self.lock:
+            return [
+                {"股票代码": code, "股票名称": name}
+                for code, name in self.stocks.items()
+            ]
+
+    def _changed(self):
+        """调用方需持有 self.lock"""
+        self.version += 1
+        if self.writer is None:
+            self.writer = threading.Thread(
+                target=self._write_loop, name="watchlist-writer", daemon=True
+            )
+            self.writer.start()
+        self.wakeup.set()
+
+    def _write_loop(self):
+        while True:
+            self.wakeup.wait()
+            # 等一小段时间，把连续的多次修改合并成一次写盘
+            threading.Event().wait(WRITE_DELAY)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[关注列表] 写盘失败：{e}")
+
+    def flush(self):
+        """把当前内容原子写入文件；没有未保存的修改时直接返回"""
+        with self.write_lock:
+            with self.lock:
+                if self.version == self.saved_version:
+                    return
+                version = self.version
+                rows = list(self.stocks.items())
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # 同一进程内由 write_lock 串行；多个服务进程各用自己的临时文件
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            pd.DataFrame(rows, columns=COLUMNS).to_csv(
+                tmp_path, index=False, encoding="utf-8-sig"
+            )
+            os.replace(tmp_path, self.path)
+            self.saved_version = version
+
+
+_watchlist = None
+_lock = threading.Lock()
+
+
+def get_watchlist():
+    global _watchlist
+    if _watchlist is None:
+        with _lock:
+            if _watchlist is None:
+                _watchlist = Watchlist()
+                atexit.register(_watchlist.flush)
+    return _watchlist
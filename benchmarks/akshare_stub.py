@@ -0,0 +1,162 @@
+"""
+进程内的 akshare 桩：替换被测代码用到的 akshare 接口，返回合成数据，
+每次调用按 latency + uniform(0, jitter) 秒模拟网络时延，并统计调用次数。
+
+    stub = AkshareStub(latency=0.05)
+    stub.install()   # 之后 app 中的 ak.xxx 调用都走桩函数
+"""
+
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+
+
+class AkshareStub:
+    def __init__(self, latency=0.0, jitter=0.0, codes=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.codes = codes or synthetic.make_codes(100)
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def _call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def stock_zh_a_hist(
+        self,
+        symbol,
+        period="daily",
+        start_date="19700101",
+        end_date="20500101",
+        adjust="",
+    ):
+        self._call("stock_zh_a_hist")
+        days = pd.bdate_range(
+            max(pd.Timestamp(start_date), pd.Timestamp("2000-01-01")),
+            min(pd.Timestamp(end_date), pd.Timestamp.now().normalize()),
+        )
+        rng = np.random.default_rng(int(symbol))
+        close = 10 + rng.standard_normal(len(days)).cumsum() * 0.1
+        return pd.DataFrame(
+            {
+                "日期": days.strftime("%Y-%m-%d"),
+                "股票代码": symbol,
+                "开盘": close,
+                "收盘": close,
+                "最高": close * 1.01,
+                "最低": close * 0.99,
+                "成交量": rng.integers(1_000, 1_000_000, len(days)),
+                "成交额": close * 1e6,
+                "振幅": 2.0,
+                "涨跌幅": 0.5,
+                "涨跌额": 0.05,
+                "换手率": 1.2,
+            }
+        )
+
+    def stock_zh_a_daily(self, symbol, adjust=""):
+        # 只模拟复权因子表：每只股票几次除权除息，按日期降序，数值为字符串（与新浪接口一致）
+        self._call("stock_zh_a_daily")
+        rng = np.random.default_rng(int(symbol[2:]))
+        offsets = np.sort(rng.choice(365 * 25, size=4, replace=False))[::-1]
+        events = np.datetime64("2000-01-01") + offsets
+        factors = np.cumprod(1 + rng.random(4) * 0.1)[::-1]
+        return pd.DataFrame(
+            {
+                "date": events.astype(str),
+                adjust.replace("-", "_"): [f"{f:.4f}" for f in factors],
+            }
+        )
+
+    def tool_trade_date_hist_sina(self):
+        self._call("tool_trade_date_hist_sina")
+        end = pd.Timestamp.now().normalize() + pd.Timedelta(days=365)
+        return pd.DataFrame({"trade_date": pd.bdate_range("1990-12-19", end).date})
+
+    def stock_info_a_code_name(self):
+        self._call("stock_info_a_code_name")
+        return pd.DataFrame(
+            {"code": self.codes, "name": [f"股票{code}" for code in self.codes]}
+        )
+
+    def _board_list(self, prefix, code_prefix, n):
+        return pd.DataFrame(
+            {
+                "排名": np.arange(1, n + 1),
+                "板块名称": [f"{prefix}{i}" for i in range(n)],
+                "板块代码": [f"{code_prefix}{i:04d}" for i in range(n)],
+                "最新价": np.linspace(500, 5000, n),
+                "涨跌幅": np.linspace(-5, 5, n),
+            }
+        )
+
+    def _board_members(self, symbol, share):
+        # 按板块名称确定性地抽取成分股，不同板块的成分股互有重叠
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+        size = max(1, int(len(self.codes) * share))
+        members = sorted(rng.choice(self.codes, size=size, replace=False))
+        return pd.DataFrame(
+            {
+                "序号": np.arange(1, len(members) + 1),
+                "代码": members,
+                "名称": [f"股票{code}" for code in members],
+                "最新价": np.linspace(5, 50, len(members)),
+                "涨跌幅": np.linspace(-3, 3, len(members)),
+            }
+        )
+
+    def stock_board_industry_name_em(self):
+        self._call("stock_board_industry_name_em")
+        return self._board_list("行业", "BK", 90)
+
+    def stock_board_industry_cons_em(self, symbol):
+        self._call("stock_board_industry_cons_em")
+        return self._board_members(symbol, 1 / 90)
+
+    def stock_board_concept_name_em(self):
+        self._call("stock_board_concept_name_em")
+        return self._board_list("概念", "BK1", 400)
+
+    def stock_board_concept_cons_em(self, symbol):
+        self._call("stock_board_concept_cons_em")
+        return self._board_members(symbol, 0.02)
+
+    def stock_margin_detail_sse(self, date):
+        self._call("stock_margin_detail_sse")
+        codes = [code for code in self.codes if code.startswith("6")]
+        return synthetic.margin_sse_frame(codes, date, np.random.default_rng(0))
+
+    def stock_margin_detail_szse(self, date):
+        self._call("stock_margin_detail_szse")
+        codes = [code for code in self.codes if not code.startswith("6")]
+        return synthetic.margin_szse_frame(codes, date, np.random.default_rng(0))
+
+    def install(self):
+        """把桩函数挂到 akshare 模块上；app 通过 ak.xxx 调用，运行时即可生效"""
+        for name in (
+            "stock_zh_a_hist",
+            "stock_zh_a_daily",
+            "tool_trade_date_hist_sina",
+            "stock_info_a_code_name",
+            "stock_board_industry_name_em",
+            "stock_board_industry_cons_em",
+            "stock_board_concept_name_em",
+            "stock_board_concept_cons_em",
+            "stock_margin_detail_sse",
+            "stock_margin_detail_szse",
+        ):
+            setattr(ak, name, getattr(self, name))
+        return self
@@ -0,0 +1,64 @@
+"""
+analyze_batch 串行与进程池并行的耗时对比。
+
+在临时目录中生成合成的 history_cache，分别用不同的进程数筛选，
+校验结果与串行完全一致并打印加速比。不依赖网络。
+
+用法（在项目根目录）：
+    python -m benchmarks.bench_analyze_batch --codes 5000 --years 10
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+
+from app import history_store, screener
+from benchmarks import synthetic
+
+
+def make_history(cache_dir, n_codes, years, seed=0):
+    """生成 n_codes 只股票、每只约 years 年交易日的随机游走日线"""
+    codes = synthetic.make_codes(n_codes)
+    history_store.HISTORY_CACHE_DIR = cache_dir
+    synthetic.make_history(cache_dir, codes, years, seed=seed)
+    return codes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codes", type=int, default=5000)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--threshold", type=float, default=1.05)
+    parser.add_argument("--workers", type=int, nargs="*", default=None)
+    args = parser.parse_args()
+
+    worker_counts = args.workers or sorted({2, 4, os.cpu_count() or 1})
+    now = datetime.now()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        codes = make_history(os.path.join(tmp, "history_cache"), args.codes, args.years)
+        print(f"已生成 {len(codes)} 只股票的合成日线，CPU 核心数 {os.cpu_count()}")
+
+        started = time.perf_counter()
+        baseline = screener.screen_low_price(codes, args.days, args.threshold, now=now)
+        serial = time.perf_counter() - started
+        print(f"串行: {serial:.3f}s，命中 {len(baseline)} 只")
+
+        for workers in worker_counts:
+            started = time.perf_counter()
+            rows = screener.screen_low_price_parallel(
+                codes, args.days, args.threshold, workers=workers, now=now
+            )
+            elapsed = time.perf_counter() - started
+            assert rows == baseline, f"workers={workers} 结果与串行不一致"
+            print(
+                f"workers={workers}: {elapsed:.3f}s，加速比 {serial / elapsed:.2f}x，结果一致"
+            )
+
+
+if __name__ == "__main__":
+    main()
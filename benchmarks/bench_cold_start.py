@@ -0,0 +1,52 @@
+"""
+测量冷启动耗时：在新的 Python 进程中导入 app 包并调用 create_app()。
+超出 app.STARTUP_BUDGET_SECONDS 时以非零状态退出，可用于 CI 中防止回退。
+
+用法（在项目根目录）：
+    python -m benchmarks.bench_cold_start --runs 5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+SNIPPET = (
+    "import time; t = time.perf_counter(); "
+    "from app import create_app; "
+    "app = create_app({'WARM_UP_CACHES': False}); "
+    "print(app.config['STARTUP_SECONDS'], time.perf_counter() - t)"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    from app import STARTUP_BUDGET_SECONDS
+
+    samples = []
+    for _ in range(args.runs):
+        out = (
+            subprocess.run(
+                [sys.executable, "-c", SNIPPET],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            .stdout.strip()
+            .splitlines()[-1]
+        )
+        startup, total = (float(x) for x in out.split())
+        samples.append(total)
+        print(f"create_app {startup:.3f}s，含导入的冷启动 {total:.3f}s")
+
+    median = statistics.median(samples)
+    print(f"中位数 {median:.3f}s，预算 {STARTUP_BUDGET_SECONDS}s")
+    if median > STARTUP_BUDGET_SECONDS:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+用本地桩函数代替 ak.stock_zh_a_hist，检验异步抓取流水线在不同上游时延、
+错误率下的吞吐和自适应并发。不依赖网络，也不写 history_cache。
+
+用法（在项目根目录）：
+    python -m benchmarks.bench_fetch_engine --codes 500 --latency 0.05 --error-rate 0.1
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from app import fetch_engine
+
+
+def make_stub(latency, jitter, error_rate, slow_after=None, slow_factor=5.0):
+    """返回一个模拟上游的同步函数：随机时延、按比例抛错，可在 slow_after 秒后整体变慢"""
+    started = time.monotonic()
+    lock = threading.Lock()
+    counters = {"calls": 0, "errors": 0}
+
+    def stub(code):
+        with lock:
+            counters["calls"] += 1
+        delay = latency + random.uniform(0, jitter)
+        if slow_after is not None and time.monotonic() - started > slow_after:
+            delay *= slow_factor
+        time.sleep(delay)
+        if random.random() < error_rate:
+            with lock:
+                counters["errors"] += 1
+            raise ConnectionError("注入的上游错误")
+        return code
+
+    return stub, counters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codes", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--slow-after", type=float, default=None)
+    parser.add_argument("--rate", type=float, default=200)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--latency-target", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub, counters = make_stub(
+        args.latency, args.jitter, args.error_rate, slow_after=args.slow_after
+    )
+    written = []
+
+    stats = asyncio.run(
+        fetch_engine.run_pipeline(
+            [f"{i:06d}" for i in range(args.codes)],
+            stub,
+            lambda code, payload: written.append(code),
+            rate=args.rate,
+            max_concurrency=args.max_concurrency,
+            latency_target=args.latency_target,
+        )
+    )
+    throughput = args.codes / stats["elapsed"] if stats["elapsed"] else 0
+    print(f"统计: {stats}")
+    print(f"上游调用 {counters['calls']} 次，注入错误 {counters['errors']} 次")
+    print(f"吞吐 {throughput:.1f} 只/秒，写入 {len(written)} 只")
+
+
+if __name__ == "__main__":
+    main()
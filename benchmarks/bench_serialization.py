@@ -0,0 +1,100 @@
+"""
+对比大 DataFrame 响应的两种序列化方式：
+- 旧：applymap(normalize) -> to_dict(orient="records") -> jsonify
+- 新：app.serialization.json_response(Frame(df))，records 与 columns 两种格式
+
+输出每种方式的耗时中位数、峰值内存（tracemalloc）和响应体大小。
+
+用法（在项目根目录）：
+    python -m benchmarks.bench_serialization --rows 5000 --runs 5
+"""
+
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from flask import Flask, jsonify
+
+from app.serialization import Frame, json_response
+
+
+def make_members(rows):
+    """构造与 stock_board_industry_cons_em 返回值相近的成分股表"""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "序号": np.arange(1, rows + 1),
+            "代码": [f"{i:06d}" for i in range(rows)],
+            "名称": [f"股票{i}" for i in range(rows)],
+        }
+    )
+    for col in ("最新价", "涨跌幅", "涨跌额", "成交量", "成交额", "振幅", "最高"):
+        df[col] = rng.random(rows) * 100
+    for col in ("最低", "今开", "昨收", "换手率", "市盈率-动态", "市净率"):
+        df[col] = rng.random(rows) * 10
+    df.loc[df.sample(frac=0.05, random_state=0).index, "市盈率-动态"] = np.nan
+    return df
+
+
+def normalize(x):
+    if isinstance(x, (np.generic, np.number)):
+        return x.item()
+    elif isinstance(x, (pd.Timestamp, pd.Timedelta)):
+        return str(x)
+    elif x is None:
+        return None
+    else:
+        return str(x)
+
+
+def old_path(df):
+    data = df.map(normalize).to_dict(orient="records")
+    return jsonify({"code": 0, "data": data, "message": "获取成功"}).get_data()
+
+
+def new_path(df, fmt):
+    return json_response(
+        {"code": 0, "data": Frame(df, fmt), "message": "获取成功"}
+    ).get_data()
+
+
+def measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    df = make_members(args.rows)
+    app = Flask(__name__)
+    cases = {
+        "旧 applymap+jsonify": lambda: old_path(df),
+        "新 records": lambda: new_path(df, "records"),
+        "新 columns": lambda: new_path(df, "columns"),
+    }
+    with app.app_context():
+        for name, func in cases.items():
+            elapsed, peak, size = measure(func, args.runs)
+            print(
+                f"{name:<20} 耗时 {elapsed * 1000:8.1f}ms  "
+                f"峰值内存 {peak / 1024 / 1024:7.1f}MB  响应 {size / 1024:8.1f}KB"
+            )
+
+
+if __name__ == "__main__":
+    main()
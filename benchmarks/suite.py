@@ -0,0 +1,355 @@
+"""
+离线基准测试套件。
+
+1. 把当前的 app 包复制到临时目录，在其中用 benchmarks.synthetic 生成合成数据
+   （history_cache、list.csv、融资融券 CSV、交易日历），所有路径都落在临时目录里，
+   不会碰到项目自己的 history_cache / stocks_info；
+2. 在子进程中安装 benchmarks.akshare_stub（可配置时延），逐项计时：
+   单只更新、批量同步、无变化的全量同步、analyze_batch（单窗口、多窗口、增量、前复权与共享面板）、融资融券查询、板块隶属矩阵、主要 HTTP 接口；
+3. 结果写成 JSON（默认 benchmarks/results/{时间}-{commit}.json），
+   --compare 与另一份结果逐项对比中位数，超过 --max-regression 倍时以非零状态退出。
+
+全程不访问网络。用法（在项目根目录）：
+    python -m benchmarks.suite --codes 2000 --years 10 --latency 0.01
+    python -m benchmarks.suite --compare benchmarks/results/<旧结果>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def summarize(name, group, samples, **extra):
+    return {
+        "name": name,
+        "group": group,
+        "runs": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+        **extra,
+    }
+
+
+def timed(func, runs):
+    samples = []
+    for i in range(runs):
+        started = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run_cases(config):
+    """在子进程中执行：此时 sys.path 上的 app 是临时目录里的副本"""
+    from benchmarks import synthetic
+    from benchmarks.akshare_stub import AkshareStub
+
+    codes = synthetic.make_codes(config["codes"])
+    stub = AkshareStub(config["latency"], config["jitter"], codes=codes).install()
+
+    from app import create_app, sync_manifest
+    from app.routes import stocks_info
+
+    app = create_app({"WARM_UP_CACHES": False})
+    client = app.test_client()
+    runs = config["runs"]
+    cases = []
+
+    def http(method, url, **kwargs):
+        def call(_):
+            response = getattr(client, method)(url, **kwargs)
+            assert response.status_code == 200, f"{url} 返回 {response.status_code}"
+            response.get_data()
+
+        return call
+
+    # 同步：前 runs 只用于单只更新，接下来 sync_codes 只用于批量同步，其余已是最新
+    single, batch = codes[:runs], codes[runs : runs + config["sync_codes"]]
+
+    samples = timed(
+        lambda _: sync_manifest.get_manifest().split(
+            codes, sync_manifest.target_date()
+        ),
+        1,
+    )
+    cases.append(summarize("manifest_rebuild", "sync", samples))
+
+    samples = timed(lambda i: stocks_info.update_single_stock(single[i]), runs)
+    cases.append(summarize("update_single_stock", "sync", samples))
+
+    calls_before = stub.calls["stock_zh_a_hist"]
+    stats = {}
+    samples = timed(
+        lambda _: stats.update(
+            stocks_info.sync_stocks(
+                batch, rate=config["rate"], max_concurrency=config["concurrency"]
+            )
+        ),
+        1,
+    )
+    cases.append(
+        summarize(
+            "sync_stocks",
+            "sync",
+            samples,
+            codes=len(batch),
+            upstream_calls=stub.calls["stock_zh_a_hist"] - calls_before,
+            written=stats.get("written"),
+        )
+    )
+
+    calls_before = stub.calls["stock_zh_a_hist"]
+    samples = timed(lambda _: stocks_info.sync_stocks(codes), runs)
+    cases.append(
+        summarize(
+            "sync_stocks_noop",
+            "sync",
+            samples,
+            codes=len(codes),
+            upstream_calls=stub.calls["stock_zh_a_hist"] - calls_before,
+        )
+    )
+
+    for days, name in ((180, "analyze_batch_index"), (120, "analyze_batch_panel")):
+        body = {"start": 0, "end": len(codes), "days": days, "threshold": 1.05}
+        call = http("post", "/analyze-batch", json=body)
+        cases.append(summarize(f"{name}_cold", "analyze", timed(call, 1)))
+        cases.append(summarize(name, "analyze", timed(call, runs)))
+
+    # 一次请求筛选多个窗口：成本应接近最长窗口，而不是各窗口之和
+    body = {"start": 0, "end": len(codes), "days": [30, 90, 120, 180, 250]}
+    call = http("post", "/analyze-batch", json=body)
+    cases.append(summarize("analyze_batch_multi", "analyze", timed(call, runs)))
+
+    # 上面的全量筛选之后没有数据变化，增量重新筛选只需比对同步清单
+    body = {"incremental": True, "days": [30, 90, 120, 180, 250]}
+    call = http("post", "/analyze-batch", json=body)
+    cases.append(summarize("analyze_batch_incremental", "analyze", timed(call, runs)))
+
+    # 同步只把需要的股票记为待刷新，复权因子表经同一条限速流水线统一拉取
+    body = {"rate": config["rate"], "max_concurrency": config["concurrency"]}
+    call = http("post", "/adjust-factors/refresh", json=body)
+    cases.append(summarize("adjust_factor_refresh", "sync", timed(call, 1)))
+
+    # 前复权筛选不走极值索引，读取时按复权因子换算
+    body = {"start": 0, "end": len(codes), "days": 180, "adjust": "qfq"}
+    call = http("post", "/analyze-batch", json=body)
+    cases.append(summarize("analyze_batch_qfq", "analyze", timed(call, runs)))
+
+    # 发布共享面板后，面板窗口的筛选直接取映射好的列，不再逐个打开 .npy
+    call = http("post", "/panel/publish")
+    cases.append(summarize("panel_publish", "analyze", timed(call, 1)))
+    body = {"start": 0, "end": len(codes), "days": 120, "threshold": 1.05}
+    call = http("post", "/analyze-batch", json=body)
+    cases.append(summarize("analyze_batch_shared", "analyze", timed(call, runs)))
+
+    rng = np.random.default_rng(0)
+    picks = [codes[i] for i in rng.integers(0, len(codes), runs + 1)]
+
+    def query(i):
+        http("post", "/query_margin_data_by_code", json={"code": picks[i]})(i)
+
+    cases.append(summarize("margin_query_cold", "margin", timed(query, 1)))
+    cases.append(
+        summarize("margin_query", "margin", timed(lambda i: query(i + 1), runs))
+    )
+
+    call = http("post", "/boards/refresh", json={"max_workers": config["concurrency"]})
+    cases.append(summarize("board_matrix_refresh", "boards", timed(call, 1)))
+
+    routes = [
+        ("GET /stocks/list", http("get", "/stocks/list")),
+        ("GET /stocks/count", http("get", "/stocks/count")),
+        ("GET /history_cache_count", http("get", "/history_cache_count")),
+        (
+            "GET /stocks/history",
+            http("get", f"/stocks/history?code={single[0]}&adjust=qfq"),
+        ),
+        ("GET /low-price-stocks", http("get", "/low-price-stocks?days=180")),
+        (
+            "POST /analyze_batch_data",
+            http("post", "/analyze_batch_data", json={"days": 180}),
+        ),
+        ("GET /boards", http("get", "/boards")),
+        (
+            "POST /get_board_members",
+            http("post", "/get_board_members", json={"boardName": "行业1"}),
+        ),
+        ("GET /boards/by_code", http("get", f"/boards/by_code?code={codes[0]}")),
+        (
+            "POST /boards/query",
+            http(
+                "post",
+                "/boards/query",
+                json={"boards": ["概念1", "概念2"], "op": "or", "days": 180},
+            ),
+        ),
+        ("GET /low-price-sectors", http("get", "/low-price-sectors?days=180")),
+        ("GET /panel", http("get", "/panel")),
+        ("GET /cache/stats", http("get", "/cache/stats")),
+    ]
+    for name, call in routes:
+        cases.append(summarize(name, "http", timed(call, runs)))
+
+    return {"cases": cases, "upstream_calls": dict(stub.calls)}
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    try:
+        return git("rev-parse", "--short", "HEAD") or None, bool(
+            git("status", "--porcelain", "--", "app")
+        )
+    except OSError:
+        return None, None
+
+
+def compare(current, baseline_path, max_regression):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {case["name"]: case for case in json.load(f)["cases"]}
+    regressions = []
+    print(f"\n与 {os.path.basename(baseline_path)} 对比（中位数，新/旧）：")
+    for case in current["cases"]:
+        old = baseline.get(case["name"])
+        if old is None or old["median"] <= 0:
+            continue
+        ratio = case["median"] / old["median"]
+        flag = " <-- 回退" if ratio > max_regression else ""
+        print(f"  {case['name']:<28} {ratio:6.2f}x{flag}")
+        if flag:
+            regressions.append(case["name"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codes", type=int, default=2000)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--margin-dates", type=int, default=60)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--sync-codes", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--max-regression", type=float, default=1.5)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        result = run_cases(config)
+        with open(config["result_path"], "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    from benchmarks import synthetic
+
+    config = {
+        "codes": args.codes,
+        "years": args.years,
+        "margin_dates": args.margin_dates,
+        "runs": args.runs,
+        "sync_codes": args.sync_codes,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(
+            os.path.join(REPO_ROOT, "app"),
+            os.path.join(tmp, "app"),
+            ignore=shutil.ignore_patterns("__pycache__"),
+        )
+        started = time.perf_counter()
+        # 只有前 runs + sync_codes 只股票落后，留给同步基准去补齐
+        dataset = synthetic.build_dataset(
+            tmp,
+            args.codes,
+            args.years,
+            args.margin_dates,
+            stale_codes=args.runs + args.sync_codes,
+        )
+        print(f"合成数据生成耗时 {time.perf_counter() - started:.1f}s")
+
+        config["result_path"] = os.path.join(tmp, "result.json")
+        config_path = os.path.join(tmp, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join([tmp, REPO_ROOT])}
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", "--worker", config_path],
+            cwd=tmp,
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        with open(config["result_path"], "r", encoding="utf-8") as f:
+            result = json.load(f)
+
+    commit, dirty = git_revision()
+    del config["result_path"]
+    result = {
+        "dataset": dataset,
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "dirty": dirty,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": config,
+        },
+        **result,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR,
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for case in result["cases"]:
+        print(
+            f"{case['group']:<8} {case['name']:<28} 中位数 {case['median'] * 1000:9.2f}ms"
+            f"  最小 {case['min'] * 1000:9.2f}ms  ×{case['runs']}"
+        )
+    print(f"结果已写入 {output}")
+
+    if args.compare:
+        regressions = compare(result, args.compare, args.max_regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+离线基准测试用的合成数据。
+
+在指定根目录下生成与线上结构一致的数据：
+- history_cache/{code}.npy：随机游走日线，长度在 years 年内随机，末尾少 stale_bars 个交易日
+  （留给同步基准去补齐）；
+- stocks_info/list.csv：股票代码与名称；
+- stocks_info/margin_sse.csv / margin_szse.csv：最近 margin_dates 个交易日的融资融券明细；
+- stocks_info/trade_dates.csv：交易日历缓存（工作日近似）。
+
+直接按 history_store 的 .npy 格式写文件，不经过 app 的写入路径，
+同步清单、极值索引等衍生数据由被测代码自己按需重建。
+
+用法（在项目根目录）：
+    python -m benchmarks.synthetic --root /tmp/bench --codes 5000 --years 20
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app import history_store
+
+
+def business_days(end, years):
+    end = np.datetime64(end, "D")
+    days = np.arange(end - 365 * years, end + 1)
+    return days[np.is_busday(days)]
+
+
+def make_codes(n_codes):
+    """沪深代码各占一半：600000 起为沪市，000001 起为深市"""
+    half = n_codes // 2
+    return [str(600000 + i) for i in range(half)] + [
+        f"{i:06d}" for i in range(1, n_codes - half + 1)
+    ]
+
+
+def make_history(cache_dir, codes, years, stale_bars=0, end=None, seed=0):
+    """为每只股票生成随机游走日线，写入 cache_dir/{code}.npy，返回交易日数组"""
+    rng = np.random.default_rng(seed)
+    weekdays = business_days(end or datetime.now().date(), years)
+    if stale_bars:
+        weekdays = weekdays[:-stale_bars]
+    os.makedirs(cache_dir, exist_ok=True)
+    for code in codes:
+        start = rng.integers(0, len(weekdays) // 2)
+        dates = weekdays[start:]
+        change = rng.normal(0, 0.02, len(dates))
+        close = 10 * np.exp(np.cumsum(change))
+        records = np.zeros(len(dates), dtype=history_store.HISTORY_DTYPE)
+        records["date"] = dates
+        records["open"] = close / (1 + change)
+        records["close"] = close
+        records["high"] = close * (1 + rng.random(len(dates)) * 0.03)
+        records["low"] = close * (1 - rng.random(len(dates)) * 0.03)
+        records["volume"] = rng.integers(1_000, 1_000_000, len(dates))
+        records["amount"] = records["volume"] * close * 100
+        records["amplitude"] = (records["high"] - records["low"]) / close * 100
+        records["pct_chg"] = change * 100
+        records["change"] = close - records["open"]
+        records["turnover"] = rng.random(len(dates)) * 5
+        np.save(os.path.join(cache_dir, f"{code}.npy"), records)
+    return weekdays
+
+
+def make_stock_list(path, codes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame({"code": codes, "name": [f"股票{code}" for code in codes]}).to_csv(
+        path, index=False
+    )
+
+
+def make_trade_dates(path, end=None, years=40):
+    """工作日近似的交易日历，覆盖到 end 之后一年，供 trade_calendar 直接读取"""
+    end = np.datetime64(end or datetime.now().date(), "D") + 365
+    days = business_days(end, years)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame({"trade_date": pd.DatetimeIndex(days).strftime("%Y%m%d")}).to_csv(
+        path, index=False
+    )
+
+
+def margin_sse_frame(codes, date_str, rng):
+    n = len(codes)
+    return pd.DataFrame(
+        {
+            "信用交易日期": date_str,
+            "标的证券代码": codes,
+            "标的证券简称": [f"股票{code}" for code in codes],
+            "融资余额": rng.random(n) * 1e9,
+            "融资买入额": rng.random(n) * 1e8,
+            "融资偿还额": rng.random(n) * 1e8,
+            "融券余量": rng.integers(0, 1_000_000, n),
+            "融券卖出量": rng.integers(0, 100_000, n),
+            "融券偿还量": rng.integers(0, 100_000, n),
+        }
+    )
+
+
+def margin_szse_frame(codes, date_str, rng):
+    n = len(codes)
+    return pd.DataFrame(
+        {
+            "证券代码": codes,
+            "证券简称": [f"股票{code}" for code in codes],
+            "融资买入额": rng.random(n) * 1e8,
+            "融资余额": rng.random(n) * 1e9,
+            "融券卖出量": rng.integers(0, 100_000, n),
+            "融券余量": rng.integers(0, 1_000_000, n),
+            "融券余额": rng.random(n) * 1e7,
+            "融资融券余额": rng.random(n) * 1e9,
+            "日期": date_str,
+        }
+    )
+
+
+def make_margin(stock_info_dir, codes, n_dates, end=None, seed=0):
+    """按交易所拆分代码，生成最近 n_dates 个交易日的融资融券明细 CSV"""
+    rng = np.random.default_rng(seed)
+    dates = business_days(end or datetime.now().date(), 1 + n_dates // 200)
+    dates = pd.DatetimeIndex(dates[-n_dates:]).strftime("%Y%m%d")
+    sse = [code for code in codes if code.startswith("6")]
+    szse = [code for code in codes if not code.startswith("6")]
+    os.makedirs(stock_info_dir, exist_ok=True)
+    pd.concat([margin_sse_frame(sse, d, rng) for d in dates]).to_csv(
+        os.path.join(stock_info_dir, "margin_sse.csv"),
+        index=False,
+        encoding="utf-8-sig",
+    )
+    pd.concat([margin_szse_frame(szse, d, rng) for d in dates]).to_csv(
+        os.path.join(stock_info_dir, "margin_szse.csv"),
+        index=False,
+        encoding="utf-8-sig",
+    )
+    return list(dates)
+
+
+def build_dataset(
+    root, n_codes=5000, years=20, margin_dates=120, stale_bars=3, stale_codes=None
+):
+    """
+    在 root 下生成完整的合成数据集，返回数据集描述。
+    只有前 stale_codes 只股票（默认全部）末尾少 stale_bars 个交易日，其余已是最新。
+    """
+    codes = make_codes(n_codes)
+    stale_codes = n_codes if stale_codes is None else min(stale_codes, n_codes)
+    stock_info_dir = os.path.join(root, "stocks_info")
+    history_dir = os.path.join(root, "history_cache")
+    make_history(history_dir, codes[:stale_codes], years, stale_bars=stale_bars)
+    make_history(history_dir, codes[stale_codes:], years, seed=1)
+    make_stock_list(os.path.join(stock_info_dir, "list.csv"), codes)
+    make_trade_dates(os.path.join(stock_info_dir, "trade_dates.csv"))
+    make_margin(stock_info_dir, codes, margin_dates)
+    return {
+        "codes": n_codes,
+        "years": years,
+        "margin_dates": margin_dates,
+        "stale_bars": stale_bars,
+        "stale_codes": stale_codes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", required=True)
+    parser.add_argument("--codes", type=int, default=5000)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--margin-dates", type=int, default=120)
+    parser.add_argument("--stale-bars", type=int, default=3)
+    args = parser.parse_args()
+    info = build_dataset(
+        args.root, args.codes, args.years, args.margin_dates, args.stale_bars
+    )
+    print(f"已在 {args.root} 生成合成数据：{info}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from app import history_store, shared_panel, sync_manifest
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """把 history_cache 指向临时目录，并清掉进程内的同步清单和共享面板"""
+    path = tmp_path / "history_cache"
+    path.mkdir()
+    monkeypatch.setattr(history_store, "HISTORY_CACHE_DIR", str(path))
+    monkeypatch.setattr(sync_manifest, "_manifest", None)
+    monkeypatch.setattr(shared_panel, "_attached", None)
+    return path
+
+
+def make_records(dates, close=None, seed=0):
+    """按给定日期生成随机游走日线，close 给定时直接使用"""
+    dates = np.asarray(dates, dtype="M8[D]")
+    rng = np.random.default_rng(seed)
+    if close is None:
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+    close = np.asarray(close, dtype=float)
+    records = np.zeros(len(dates), dtype=history_store.HISTORY_DTYPE)
+    records["date"] = dates
+    records["open"] = close
+    records["close"] = close
+    records["high"] = close * (1 + rng.random(len(dates)) * 0.03)
+    records["low"] = close * (1 - rng.random(len(dates)) * 0.03)
+    records["volume"] = rng.integers(1_000, 1_000_000, len(dates))
+    return records
+
+
+def business_days(start, count):
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(start, "D") + count * 2)
+    return days[np.is_busday(days)][:count]
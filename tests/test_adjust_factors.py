@@ -0,0 +1,62 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app import adjust_factors
+from conftest import business_days, make_records
+
+CODE = "600000"
+EVENTS = np.array(["2024-01-10", "2024-02-01"], dtype="M8[D]")
+FACTORS = np.array([1.0, 1.5])
+
+
+@pytest.fixture
+def store(cache_dir, monkeypatch):
+    monkeypatch.setattr(adjust_factors, "_store", None)
+    store = adjust_factors.get_store()
+    store.put(CODE, EVENTS, FACTORS)
+    return store
+
+
+def test_apply_scales_prices_by_factor_interval(store):
+    records = make_records(business_days("2024-01-02", 40))
+    before = records["date"] < EVENTS[1]
+
+    hfq = adjust_factors.apply(CODE, records, "hfq")
+    assert np.allclose(hfq["close"][before], records["close"][before])
+    assert np.allclose(hfq["close"][~before], records["close"][~before] * 1.5)
+
+    qfq = adjust_factors.apply(CODE, records, "qfq")
+    assert np.allclose(qfq["close"][before], records["close"][before] / 1.5)
+    assert np.allclose(qfq["close"][~before], records["close"][~before])
+    assert np.array_equal(qfq["volume"], records["volume"])
+    assert adjust_factors.apply(CODE, records, "") is records
+
+
+def test_concurrent_saves_leave_a_loadable_store(store, monkeypatch):
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def save(i):
+        barrier.wait()
+        for j in range(20):
+            store.put(f"{i}{j:05d}", EVENTS, FACTORS * (j + 1))
+            try:
+                store.save()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    monkeypatch.setattr(adjust_factors, "_store", None)
+    reloaded = adjust_factors.get_store()
+    assert sorted(reloaded.tables) == sorted(store.tables)
+    dates, factors = reloaded.get("300019")
+    assert np.array_equal(dates, EVENTS)
+    assert np.array_equal(factors, FACTORS * 20)
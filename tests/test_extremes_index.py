@@ -0,0 +1,105 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app import extremes_index, history_store, screener
+from conftest import business_days, make_records
+
+START = datetime(2024, 6, 3, 16, 0)
+STATS = ("has_data", "min_price", "max_price", "current_price")
+
+
+@pytest.fixture
+def codes(cache_dir, monkeypatch):
+    monkeypatch.setattr(extremes_index, "_indexes", {})
+    dates = business_days("2023-06-01", 400)
+    codes = [f"{600000 + i:06d}" for i in range(12)]
+    for i, code in enumerate(codes):
+        history_store.append_records(code, make_records(dates[i * 10 :], seed=i))
+    return codes
+
+
+def assert_matches_panel(stats, codes, days, now):
+    expected = screener.window_stats(
+        screener.load_panel(codes, screener.cutoff_for(days, now))
+    )
+    for field in STATS:
+        assert np.array_equal(stats[field], expected[field], equal_nan=True), field
+
+
+def test_rolling_window_matches_panel_and_rescans_only_expired(codes, monkeypatch):
+    index = extremes_index.get_index(30)
+    index.lookup(codes, START)
+
+    reads = []
+    read_history = history_store.read_history
+    monkeypatch.setattr(
+        history_store,
+        "read_history",
+        lambda code, *args, **kwargs: reads.append(code)
+        or read_history(code, *args, **kwargs),
+    )
+    total_reads = 0
+    for step in range(1, 60):
+        now = START + timedelta(days=step)
+        reads.clear()
+        stats = index.lookup(codes, now)
+        total_reads += len(reads)
+        first_day = extremes_index.first_day_for(30, now)
+        # 没有重读的股票，极值所在日都还在窗口内
+        for code in set(codes) - set(reads):
+            entry = index.entries[code]
+            assert entry["cutoff"] == first_day
+            assert entry["min_date"] >= first_day and entry["max_date"] >= first_day
+        assert_matches_panel(stats, codes, 30, now)
+    # 窗口每天滚动，但只有少数股票的极值滚出窗口
+    assert total_reads < 59 * len(codes) / 2
+
+
+def test_incremental_update_tracks_extreme_dates(codes):
+    index = extremes_index.get_index(90)
+    index.lookup(codes, START)
+    code = codes[0]
+    last = history_store.read_history(code)[-1:].copy()
+    last["date"] += 1
+    last["low"] = 0.01
+    appended = history_store.append_records(code, last)
+    assert appended == 1
+    extremes_index.on_history_updated(code, appended, START)
+
+    entry = index.entries[code]
+    assert entry["min"] == 0.01
+    assert entry["min_date"] == last["date"][0]
+    assert entry["rows"] == len(history_store.read_history(code))
+    assert_matches_panel(index.lookup(codes, START), codes, 90, START)
+
+
+def test_concurrent_saves_leave_a_loadable_index(codes, monkeypatch):
+    index = extremes_index.get_index(180)
+    index.lookup(codes, START)
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def save():
+        barrier.wait()
+        for _ in range(20):
+            with index.lock:
+                index.dirty = True
+            try:
+                index.save()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    monkeypatch.setattr(extremes_index, "_indexes", {})
+    reloaded = extremes_index.get_index(180)
+    assert sorted(reloaded.entries) == sorted(index.entries)
+    assert_matches_panel(reloaded.lookup(codes, START), codes, 180, START)
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import fetch_engine
+from benchmarks.akshare_stub import AkshareStub
+
+CODES = [f"{600000 + i:06d}" for i in range(40)]
+
+
+class Upstream:
+    """
+    stock_zh_a_hist 形状的上游：时延来自 AkshareStub，另外可按代码注入
+    固定失败、前几次失败和额外的卡顿，并记录同时在途的调用数。
+    """
+
+    def __init__(self, latency=0.0, fail=(), flaky=(), hang=None):
+        self.stub = AkshareStub(latency=latency)
+        self.fail = set(fail)
+        self.flaky = dict.fromkeys(flaky, 1)
+        self.hang = hang or {}
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.in_flight = 0
+        self.peak = 0
+
+    def __call__(self, code):
+        with self.lock:
+            self.calls[code] = self.calls.get(code, 0) + 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            flaky = self.flaky.get(code, 0) > 0
+            if flaky:
+                self.flaky[code] -= 1
+        try:
+            time.sleep(self.hang.get(code, 0))
+            df = self.stub.stock_zh_a_hist(code, start_date="20240101")
+            if code in self.fail or flaky:
+                raise ConnectionError(f"{code} 注入的上游错误")
+            return df
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def run(upstream, items=CODES, **options):
+    written, results = [], {}
+
+    def write_one(code, df):
+        written.append(code)
+        assert list(df.columns)[:2] == ["日期", "股票代码"]
+        return {"code": 0, "message": "ok", "updated_count": len(df)}
+
+    def on_result(code, result):
+        results[code] = result
+
+    options = {"rate": 1000, "retries": 0, **options}
+    stats = asyncio.run(
+        fetch_engine.run_pipeline(
+            items, upstream, write_one, on_result=on_result, **options
+        )
+    )
+    return stats, written, results
+
+
+def test_single_concurrency_writes_in_item_order():
+    stats, written, results = run(Upstream(), initial_concurrency=1, max_concurrency=1)
+    assert written == CODES
+    assert stats["total"] == stats["fetched"] == stats["written"] == len(CODES)
+    assert stats["errors"] == stats["skipped"] == 0
+    assert all(results[code]["updated_count"] > 0 for code in CODES)
+
+
+def test_errors_are_retried_then_reported():
+    fail, flaky = CODES[:3], CODES[3:6]
+    upstream = Upstream(fail=fail, flaky=flaky)
+    stats, written, results = run(upstream, retries=2)
+
+    assert all(upstream.calls[code] == 3 for code in fail)
+    assert all(upstream.calls[code] == 2 for code in flaky)
+    assert stats["errors"] == len(fail)
+    assert all(results[code]["updated_count"] == -1 for code in fail)
+    assert sorted(written) == sorted(set(CODES) - set(fail))
+
+
+def test_none_payload_is_skipped():
+    def fetch_one(code):
+        return None if code in CODES[:5] else Upstream()(code)
+
+    stats, written, results = run(fetch_one)
+    assert stats["skipped"] == 5
+    assert all(results[code]["updated_count"] == 0 for code in CODES[:5])
+    assert len(written) == len(CODES) - 5
+
+
+def test_aimd_grows_on_fast_upstream_and_backs_off_on_slow_one():
+    stats, _, _ = run(
+        Upstream(latency=0.001), initial_concurrency=2, max_concurrency=16
+    )
+    assert stats["final_concurrency"] > 2
+
+    upstream = Upstream(latency=0.03, fail=CODES[::4])
+    stats, _, _ = run(
+        upstream,
+        initial_concurrency=8,
+        max_concurrency=8,
+        latency_target=0.01,
+    )
+    assert stats["final_concurrency"] < 8
+    assert upstream.peak <= 8
+
+
+def test_timed_out_call_keeps_its_slot_and_is_not_retried():
+    hung = CODES[0]
+    upstream = Upstream(latency=0.01, hang={hung: 0.5})
+    stats, written, results = run(
+        upstream,
+        initial_concurrency=2,
+        max_concurrency=2,
+        timeout=0.1,
+        retries=2,
+    )
+
+    assert stats["timeouts"] == 1
+    assert stats["errors"] == 1
+    assert upstream.calls[hung] == 1
+    assert results[hung]["updated_count"] == -1
+    assert hung not in written
+    # 卡住的调用一直占着名额，在途调用数从未超过并发上限
+    assert upstream.peak <= 2
+    assert sorted(written) == sorted(CODES[1:])
+
+
+def test_should_stop_leaves_remaining_items_untouched():
+    upstream = Upstream()
+    stats, written, _ = run(
+        upstream,
+        initial_concurrency=1,
+        max_concurrency=1,
+        should_stop=lambda: len(upstream.calls) >= 10,
+    )
+    assert stats["stopped"] is True
+    assert len(upstream.calls) == 10
+    assert written == CODES[:10]
+
+
+@pytest.mark.parametrize("max_concurrency", [4, 8])
+def test_concurrent_fetch_uses_one_writer_thread(max_concurrency):
+    writer_threads = set()
+    written = []
+
+    def write_one(code, df):
+        writer_threads.add(threading.get_ident())
+        written.append(code)
+        return {"code": 0, "message": "ok", "updated_count": len(df)}
+
+    stats = asyncio.run(
+        fetch_engine.run_pipeline(
+            CODES,
+            Upstream(latency=0.002),
+            write_one,
+            rate=1000,
+            max_concurrency=max_concurrency,
+        )
+    )
+    assert sorted(written) == CODES
+    assert stats["written"] == len(CODES)
+    assert len(writer_threads) == 1
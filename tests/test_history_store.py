@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+
+from app import history_store
+from conftest import business_days, make_records
+
+CODE = "600000"
+
+
+def test_append_creates_file_then_extends_it(cache_dir):
+    dates = business_days("2024-01-02", 30)
+    records = make_records(dates)
+    assert history_store.append_records(CODE, records[:20]) == 20
+    assert history_store.append_records(CODE, records[20:]) == 10
+
+    stored = history_store.read_history(CODE)
+    assert np.array_equal(stored, records)
+    assert history_store.get_watermark(CODE) == {
+        "last_date": str(dates[-1]),
+        "rows": 30,
+    }
+
+
+def test_append_skips_duplicate_dates(cache_dir):
+    records = make_records(business_days("2024-01-02", 12))
+    history_store.append_records(CODE, records[:10])
+
+    # 新数据内部重复的日期只保留第一行
+    batch = np.concatenate([records[10:11], records[10:], records[11:]])
+    assert history_store.append_records(CODE, batch) == 2
+    assert np.array_equal(history_store.read_history(CODE), records)
+
+
+def test_append_ignores_dates_not_after_watermark(cache_dir):
+    records = make_records(business_days("2024-01-02", 10))
+    history_store.append_records(CODE, records)
+    before = (cache_dir / f"{CODE}.npy").read_bytes()
+
+    older = records[:5].copy()
+    older["close"] += 1
+    assert history_store.append_records(CODE, older) == 0
+    assert history_store.append_records(CODE, records[-1:]) == 0
+    assert (cache_dir / f"{CODE}.npy").read_bytes() == before
+
+
+def test_append_grows_header_in_place(cache_dir):
+    records = make_records(business_days("2000-01-03", 100_001))
+    offset = 0
+    # 行数跨过 10、100、1000、10 万的位数边界
+    for size in (9, 1, 90, 900, 99_000, 1):
+        chunk = records[offset : offset + size]
+        assert history_store.append_records(CODE, chunk) == size
+        offset += size
+        stored = history_store.read_history(CODE, mmap=False)
+        assert np.array_equal(stored, records[:offset])
+    assert history_store.get_watermark(CODE)["rows"] == 100_001
+
+
+def test_append_falls_back_to_rewrite_when_header_is_full(cache_dir, monkeypatch):
+    records = make_records(business_days("2024-01-02", 20))
+    history_store.append_records(CODE, records[:10])
+    monkeypatch.setattr(history_store, "_rewrite_header", lambda *args: False)
+
+    assert history_store.append_records(CODE, records[10:]) == 10
+    assert np.array_equal(history_store.read_history(CODE, mmap=False), records)
+
+
+def test_concurrent_overlapping_appends_do_not_duplicate(cache_dir):
+    records = make_records(business_days("2024-01-02", 400))
+    history_store.append_records(CODE, records[:1])
+    barrier = threading.Barrier(2)
+
+    def writer(offset):
+        barrier.wait()
+        for start in range(offset, len(records), 10):
+            history_store.append_records(CODE, records[start : start + 15])
+
+    threads = [threading.Thread(target=writer, args=(offset,)) for offset in (1, 6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 先到的写入者可能越过另一方的起点，被跳过的旧日期不会再补写；但不能有重复或乱序的 K 线
+    stored = history_store.read_history(CODE, mmap=False)
+    assert np.all(np.diff(stored["date"]) > np.timedelta64(0, "D"))
+    assert stored["date"][-1] == records["date"][-1]
+    positions = np.searchsorted(records["date"], stored["date"])
+    assert np.array_equal(stored, records[positions])
+    assert history_store.get_watermark(CODE)["rows"] == len(stored)
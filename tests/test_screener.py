@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app import history_store, screener
+from conftest import business_days, make_records
+
+NOW = datetime(2024, 12, 31, 16, 0)
+WINDOWS = [(30, 1.05), (90, 1.1), (180, 1.05), (250, 1.2)]
+
+
+@pytest.fixture
+def codes(cache_dir):
+    dates = business_days("2023-06-01", 400)
+    codes = [f"{600000 + i:06d}" for i in range(40)]
+    for i, code in enumerate(codes):
+        # 起始日错开，部分股票在短窗口内没有数据
+        start = (i * 37) % 300
+        end = len(dates) - (i % 7) * 20
+        history_store.append_records(code, make_records(dates[start:end], seed=i))
+    return codes + ["699999"]  # 最后一只没有缓存
+
+
+def test_parallel_screen_matches_serial(codes):
+    serial = screener.screen_windows(codes, WINDOWS, now=NOW)
+    for workers in (2, 3):
+        parallel = screener.screen_windows_parallel(
+            codes, WINDOWS, workers=workers, now=NOW
+        )
+        assert parallel == serial
+    assert any(serial[days] for days, _ in WINDOWS)
+
+
+def test_parallel_screen_reuses_one_forkserver_pool(codes):
+    screener.screen_windows_parallel(codes, WINDOWS, workers=2, now=NOW)
+    pool = screener.get_pool(2)
+    assert pool._mp_context.get_start_method() == "forkserver"
+    screener.screen_windows_parallel(codes, WINDOWS, workers=2, now=NOW)
+    assert screener.get_pool(2) is pool
+
+
+def test_multi_window_screen_matches_single_window(codes):
+    results = screener.screen_windows(codes, WINDOWS, now=NOW)
+    for days, threshold in WINDOWS:
+        assert results[days] == screener.screen_low_price(
+            codes, days, threshold, now=NOW
+        )
+
+
+def test_non_positive_window_low_is_not_a_hit(cache_dir):
+    dates = business_days("2024-11-01", 20)
+    records = make_records(dates, close=np.full(len(dates), 5.0))
+    records["low"][3] = 0.0
+    records["close"][-1] = 0.0
+    history_store.append_records("600000", records)
+
+    assert screener.screen_low_price(["600000"], 30, now=NOW) == []
@@ -0,0 +1,49 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+from flask import Flask, jsonify
+
+from app.serialization import Frame
+
+VALUES = [
+    12.345678901234,
+    1e-12,
+    0.0123,
+    1234567890123.4567,
+    98765432101.23,
+    -3.5,
+    np.nan,
+    0.1,
+]
+
+
+def jsonify_records(df):
+    with Flask(__name__).app_context():
+        return json.loads(jsonify(df.to_dict("records")).get_data(as_text=True))
+
+
+def same(a, b):
+    if isinstance(a, float) and math.isnan(a):
+        return b is None or math.isnan(b)
+    return a == b
+
+
+def test_frame_records_match_jsonify():
+    df = pd.DataFrame(
+        {"股票代码": [f"{i:06d}" for i in range(len(VALUES))], "余额": VALUES}
+    )
+    expected = jsonify_records(df)
+    actual = json.loads(Frame(df).to_json())
+    assert [row["股票代码"] for row in actual] == [row["股票代码"] for row in expected]
+    for got, want in zip(actual, expected):
+        assert same(want["余额"], got["余额"]), (want, got)
+
+
+def test_frame_columns_keeps_full_precision():
+    df = pd.DataFrame({"余额": VALUES})
+    payload = json.loads(Frame(df, "columns").to_json())
+    assert payload["columns"] == ["余额"]
+    for (got,), want in zip(payload["rows"], VALUES):
+        assert same(want, got), (want, got)
@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+
+from app import history_store, sync_manifest
+from conftest import business_days, make_records
+
+CODES = ["000001", "600000"]
+
+
+def write_codes(days=20):
+    records = make_records(business_days("2024-01-02", days))
+    for code in CODES:
+        history_store.append_records(code, records)
+    return records
+
+
+def reload_manifest(monkeypatch):
+    monkeypatch.setattr(sync_manifest, "_manifest", None)
+    return sync_manifest.get_manifest()
+
+
+def test_manifest_round_trip(cache_dir, monkeypatch):
+    records = write_codes()
+    manifest = sync_manifest.get_manifest()
+    manifest.mark_checked(CODES[0], "2024-02-01")
+    history_store.append_records(CODES[1], make_records(["2024-03-01"]))
+    sync_manifest.flush()
+    saved_entries = json.loads(json.dumps(manifest.entries))
+    saved_seq = manifest.seq
+
+    loaded = reload_manifest(monkeypatch)
+    assert loaded.entries == saved_entries
+    assert loaded.seq == saved_seq
+    assert loaded.get(CODES[0])["checked_through"] == "2024-02-01"
+    assert sync_manifest.watermark(CODES[1]) == {
+        "last_date": "2024-03-01",
+        "rows": len(records) + 1,
+    }
+    assert all(loaded.verify(code) for code in CODES)
+    # 文件未变化时读回的条目直接可用，不需要重算
+    assert loaded.changed_since(saved_seq, CODES) == []
+
+
+def test_appended_checksum_matches_full_rescan(cache_dir):
+    write_codes()
+    history_store.append_records(CODES[0], make_records(["2024-03-01", "2024-03-04"]))
+    manifest = sync_manifest.get_manifest()
+    incremental = dict(manifest.get(CODES[0]))
+
+    rescanned = manifest.rescan(CODES[0])
+    assert incremental["checksum"] == rescanned["checksum"]
+    assert incremental["rows"] == rescanned["rows"]
+    assert incremental["last_date"] == rescanned["last_date"] == "2024-03-04"
+
+
+def test_external_rewrite_is_detected_after_reload(cache_dir, monkeypatch):
+    write_codes()
+    sync_manifest.flush()
+    seq = sync_manifest.get_manifest().seq
+
+    # 绕过 history_store 改写文件，清单中的文件戳随之失效
+    path = cache_dir / f"{CODES[1]}.npy"
+    np.save(path, make_records(business_days("2024-01-02", 5), seed=1))
+
+    loaded = reload_manifest(monkeypatch)
+    assert loaded.changed_since(seq, CODES) == [CODES[1]]
+    assert loaded.get(CODES[1])["rows"] == 5
+    assert loaded.verify(CODES[1])
+
+
+def test_split_uses_last_date_and_checked_through(cache_dir):
+    write_codes()
+    manifest = sync_manifest.get_manifest()
+    last_date = manifest.get(CODES[0])["last_date"]
+    manifest.mark_checked(CODES[1], "2099-01-01")
+
+    stale, current = manifest.split(CODES + ["300001"], "2099-01-01")
+    assert stale == [CODES[0], "300001"]
+    assert current == [CODES[1]]
+    assert manifest.split(CODES, last_date) == ([], CODES)
+
+
+def test_saves_from_two_processes_merge_on_disk(cache_dir, monkeypatch):
+    write_codes()
+    sync_manifest.flush()
+    # 两个独立的清单实例模拟两个服务进程，各自更新不同的股票
+    first, second = sync_manifest.Manifest(), sync_manifest.Manifest()
+    first.mark_checked(CODES[0], "2024-02-01")
+    second.mark_checked(CODES[1], "2024-02-02")
+    first.save()
+    second.save()
+
+    assert second.get(CODES[0])["checked_through"] == "2024-02-01"
+    assert second.seq >= first.seq
+    loaded = reload_manifest(monkeypatch)
+    assert loaded.get(CODES[0])["checked_through"] == "2024-02-01"
+    assert loaded.get(CODES[1])["checked_through"] == "2024-02-02"
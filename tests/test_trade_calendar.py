@@ -0,0 +1,53 @@
+import threading
+import time
+
+from app import trade_calendar
+
+OLD = ["20240102", "20240103"]
+NEW = OLD + ["20240104"]
+
+
+def test_due_recheck_runs_in_background_and_serves_cached_dates(monkeypatch):
+    release = threading.Event()
+    loads = []
+
+    def slow_load():
+        loads.append(threading.current_thread().name)
+        release.wait(5)
+        return NEW
+
+    monkeypatch.setattr(trade_calendar, "_trade_dates", OLD)
+    monkeypatch.setattr(trade_calendar, "_checked_at", 0.0)
+    monkeypatch.setattr(trade_calendar, "_rechecking", False)
+    monkeypatch.setattr(trade_calendar, "load_trade_dates", slow_load)
+
+    # 上游卡住时请求线程不等待，重复调用也只启动一个后台检查
+    started = time.monotonic()
+    for _ in range(5):
+        assert trade_calendar.get_trade_dates() is OLD
+    assert time.monotonic() - started < 1
+    release.set()
+
+    deadline = time.monotonic() + 5
+    while trade_calendar.get_trade_dates() is OLD and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert trade_calendar.get_trade_dates() == NEW
+    assert loads == ["trade-calendar-recheck"]
+    assert trade_calendar.get_calendar().is_trading_day("2024-01-04")
+
+
+def test_failed_background_recheck_keeps_cached_dates(monkeypatch):
+    def failing_load():
+        raise ConnectionError("上游不可用")
+
+    monkeypatch.setattr(trade_calendar, "_trade_dates", OLD)
+    monkeypatch.setattr(trade_calendar, "_checked_at", 0.0)
+    monkeypatch.setattr(trade_calendar, "_rechecking", False)
+    monkeypatch.setattr(trade_calendar, "load_trade_dates", failing_load)
+
+    assert trade_calendar.get_trade_dates() is OLD
+    deadline = time.monotonic() + 5
+    while trade_calendar._rechecking and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert trade_calendar.get_trade_dates() is OLD
+    assert not trade_calendar._recheck_due()
@@ -0,0 +1,27 @@
+import threading
+
+from app.watchlist import Watchlist
+
+
+def test_concurrent_flushes_persist_every_change(tmp_path):
+    path = str(tmp_path / "watched_stocks.csv")
+    watchlist = Watchlist(path)
+    barrier = threading.Barrier(4)
+
+    def worker(i):
+        barrier.wait()
+        for j in range(25):
+            watchlist.add([(f"{i}{j:05d}", f"股票{i}{j}")])
+            watchlist.flush()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    watchlist.flush()
+
+    reloaded = Watchlist(path)
+    assert len(reloaded) == 100
+    assert reloaded.items() == watchlist.items()
+    assert list(tmp_path.iterdir()) == [tmp_path / "watched_stocks.csv"]